@@ -3,6 +3,12 @@
 # The BagOfWords class implements individual volumes as ordered
 # lists of features.
 #
+# The Corpus class holds a whole set of volumes as one matrix, and can
+# be used instead of a list of BagOfWords when building a training set.
+#
+# The same file is copied into classify, piketty, reception, utilities and
+# workshop, so keep the copies in step.
+#
 
 import numpy as np
 import pandas as pd
@@ -16,6 +22,40 @@ def all_nonalphanumeric(astring):
             break
     return nonalphanum
 
+def read_counts(filepath, include_punctuation):
+	''' Reads a file of token \t count lines. Returns a dictionary of raw
+	counts, and the total count.
+	'''
+
+	with open(filepath, encoding = 'utf-8') as f:
+		filelines = f.readlines()
+
+	rawcounts = dict()
+	totalcount = 0
+
+	for line in filelines:
+		line = line.rstrip()
+		fields = line.split('\t')
+		if len(fields) != 2:
+			print("Illegal line length in " + filepath)
+			print(line)
+			continue
+		else:
+			tokentype = fields[0]
+			count = fields[1]
+
+			try:
+				intcount = int(count)
+				if include_punctuation or not all_nonalphanumeric(tokentype):
+					rawcounts[tokentype] = intcount
+					totalcount += intcount
+
+			except ValueError:
+				print("Cannot parse count " + count + " as integer.")
+				continue
+
+	return rawcounts, totalcount
+
 class BagOfWords:
 
 	def __init__(self, filepath, volID, include_punctuation):
@@ -25,33 +65,7 @@ class BagOfWords:
 		'''
 
 		self.volID = volID
-
-		with open(filepath, encoding = 'utf-8') as f:
-			filelines = f.readlines()
-
-		self.rawcounts = dict()
-		self.totalcount = 0
-
-		for line in filelines:
-			line = line.rstrip()
-			fields = line.split('\t')
-			if len(fields) != 2:
-				print("Illegal line length in " + filepath)
-				print(line)
-				continue
-			else:
-				tokentype = fields[0]
-				count = fields[1]
-
-				try:
-					intcount = int(count)
-					if include_punctuation or not all_nonalphanumeric(tokentype):
-						self.rawcounts[tokentype] = intcount
-						self.totalcount += intcount
-
-				except ValueError:
-					print("Cannot parse count " + count + " as integer.")
-					continue
+		self.rawcounts, self.totalcount = read_counts(filepath, include_punctuation)
 
 		self.numrawcounts = len(self.rawcounts)
 
@@ -97,6 +111,20 @@ class BagOfWords:
 		self.features = (self.features - standardizer.means) / standardizer.stdevs
 
 
+def feature_statistics(featurematrix, featurelist):
+	''' The mean and standard deviation of each column of featurematrix.
+	'''
+
+	means = np.mean(featurematrix, axis = 0)
+	stdevs = np.std(featurematrix, axis = 0)
+
+	for idx in np.flatnonzero(stdevs == 0):
+		print("Problematic standard deviation of zero for feature " + featurelist[idx])
+		stdevs[idx] = 0.0000001
+		# Cheesy hack is my middle name.
+
+	return means, stdevs
+
 class StandardizingVector:
 	''' An object that computes the means and standard deviations of features
 	across a corpus of volumes. These statistics can then be used to standardize
@@ -104,63 +132,211 @@ class StandardizingVector:
 	'''
 
 	def __init__(self, listofvolumes, featurelist):
-		numvolumes = len(listofvolumes)
-		numfeatures = len(featurelist)
 
-		# First a simple sanity check. We are talking about volumes with
-		# the same number of features, right?
+		if isinstance(listofvolumes, Corpus):
+			# A Corpus already has its features as a matrix.
+			assert listofvolumes.featurelist == featurelist
+			featurematrix = listofvolumes.features
+
+		else:
+			numvolumes = len(listofvolumes)
+			numfeatures = len(featurelist)
+
+			# First a simple sanity check. We are talking about volumes with
+			# the same number of features, right?
 
-		for avolume in listofvolumes:
-			assert avolume.numfeatures == numfeatures
+			for avolume in listofvolumes:
+				assert avolume.numfeatures == numfeatures
 
-		# And how about a spot check to make sure the lists are really the same?
+			# And how about a spot check to make sure the lists are really the same?
 
-		for ourfeature, itsfeature in zip(featurelist, listofvolumes[0].featurelist):
-			assert ourfeature == itsfeature
+			for ourfeature, itsfeature in zip(featurelist, listofvolumes[0].featurelist):
+				assert ourfeature == itsfeature
 
-		# Okay, we're good. Initialize some pandas series.
+			# Okay, we're good. Poll every volume at once, as a matrix with a row
+			# for each volume and a column for each feature.
 
-		means = list()
-		stdevs = list()
+			featurematrix = np.array([avolume.features[featurelist].values for avolume in listofvolumes])
 
-		for afeature in featurelist:
-			featuredistribution = np.zeros(numvolumes)
+		means, stdevs = feature_statistics(featurematrix, featurelist)
 
-			# For each feature, create an array of possible values by polling volumes.
+		self.means = Series(means, index = featurelist)
+		self.stdevs = Series(stdevs, index = featurelist)
+		self.features = featurelist
 
-			for volidx, avolume in enumerate(listofvolumes):
-				featuredistribution[volidx] = avolume.features[afeature]
+		# Because we're going to need the list of features to apply this model
+		# to other volumes.
 
-			# Then calculate mean and standard deviation for this feature.
+		# Done.
 
-			thismean = np.mean(featuredistribution)
-			thisstd = np.std(featuredistribution)
+class WordVector:
+	''' A WordVector is just like a BagOfWords, except that it has
+	a simpler constructor — it just accepts a list of tokens.
+	In Java, you could write multiple constructors for one class.
+	In Python, I'd have to rewrite the constructor inelegantly to make
+	these a single class. So. Two classes.
+	'''
 
-			if thisstd == 0:
-				print("Problematic standard deviation of zero for feature " + afeature)
-				thisstd = 0.0000001
-				# Cheesy hack is my middle name.
+	def __init__(self, listofwords):
+		''' Construct a WordVector from a list.
+		'''
 
-			means.append(thismean)
-			stdevs.append(thisstd)
+		self.rawcounts = dict()
+		self.totalcount = 0
 
-		self.means = Series(means, index = featurelist)
-		self.stdevs = Series(stdevs, index = featurelist)
+		for word in listofwords:
+			self.totalcount += 1
+			if word in self.rawcounts:
+				self.rawcounts[word] += 1
+			else:
+				self.rawcounts[word] = 1
 
-		# Done.
+		self.numrawcounts = len(self.rawcounts)
+
+	def selectfeatures(self, featurelist):
+		''' A WordVector is created with merely a dictionary of raw token counts.
+		One could call this a sparse table. It has no entries where features are
+		missing.
+
+		We need to organize these as an ordered series of features, which includes
+		only the features we have chosen to use in the current model, and has zeroes for
+		missing values.
+		'''
+
+		self.featurelist = featurelist
+		self.numfeatures = len(featurelist)
+		self.features = Series(self.rawcounts, index = featurelist, dtype = 'float64')
+		# Pandas has the nice feature of building a series from a dictionary if it's
+		# provided an index of values. So this effectively builds a series of entries
+		# ordered by the keys in 'featurelist,' with NaN in places where rawcounts
+		# had no corresponding key.
+
+		self.features[self.features.isnull()] = 0
+		# This replaces NaN with zero, since missing words are effectively words with
+		# count == 0.
+
+	def normalizefrequencies(self):
+		''' Simply divides all frequencies by the total token count for this volume.
+		'''
+
+		self.features = self.features / self.totalcount
+
+	def standardizefrequencies(self, standardizer):
+		''' Convert features to z-scores by centering them on the means and
+		scaling them by standard deviation.
+
+		standardizer = an object of class StandardizingVector, presumably created
+		either on the corpus that contains this volume, or on the training corpus
+		that created the model we are about to use on this volume.
+		'''
 
+		assert len(self.features) == len(standardizer.means)
 
+		self.features = (self.features - standardizer.means) / standardizer.stdevs
 
+class Corpus:
+	''' A Corpus holds the raw counts for a set of volumes as one matrix, with
+	a row for each volume and a column for each word in a shared vocabulary.
+	It does what a list of BagOfWords would do -- select features, normalize
+	and standardize them -- for all the volumes at once, and it can be passed
+	to StandardizingVector in place of a list of volumes.
 
+	The raw counts are stored sparsely (in CSR form); features are dense, as
+	they have to be once they're standardized.
+	'''
 
+	def __init__(self, volIDs, listofrawcounts, totalcounts):
+		self.volIDs = list(volIDs)
+		self.numvolumes = len(self.volIDs)
+		self.totalcounts = np.array(totalcounts, dtype = 'float64')
+
+		self.vocabulary = dict()
+		indptr = [0]
+		indices = list()
+		counts = list()
+		for rawcounts in listofrawcounts:
+			for word, count in rawcounts.items():
+				if word not in self.vocabulary:
+					self.vocabulary[word] = len(self.vocabulary)
+				indices.append(self.vocabulary[word])
+				counts.append(count)
+			indptr.append(len(indices))
+
+		self.indptr = np.array(indptr, dtype = 'int64')
+		self.indices = np.array(indices, dtype = 'int64')
+		self.counts = np.array(counts, dtype = 'float64')
+		self.rows = np.repeat(np.arange(self.numvolumes), np.diff(self.indptr))
+
+		self.featurelist = list()
+		self.numfeatures = 0
+		self.features = np.zeros((self.numvolumes, 0))
+
+	def wordcounts(self):
+		''' A dictionary pairing each word with its total count across the
+		corpus, as you'd get by adding up the rawcounts of every volume.
+		'''
 
+		totals = np.bincount(self.indices, weights = self.counts, minlength = len(self.vocabulary))
+		return {word: int(totals[idx]) for word, idx in self.vocabulary.items()}
 
+	def selectfeatures(self, featurelist):
+		''' Builds the matrix of features: a column for each word in featurelist,
+		with zeroes where a volume doesn't contain the word.
+		'''
 
+		columns = np.full(len(self.vocabulary), -1, dtype = 'int64')
+		for idx, word in enumerate(featurelist):
+			if word in self.vocabulary:
+				columns[self.vocabulary[word]] = idx
 
+		wordcolumns = columns[self.indices]
+		keep = wordcolumns >= 0
 
+		self.featurelist = featurelist
+		self.numfeatures = len(featurelist)
+		self.features = np.zeros((self.numvolumes, self.numfeatures))
+		self.features[self.rows[keep], wordcolumns[keep]] = self.counts[keep]
 
+	def normalizefrequencies(self):
+		''' Divides each volume's frequencies by its total token count.
+		'''
 
+		self.features = self.features / self.totalcounts[ : , np.newaxis]
 
+	def standardizefrequencies(self, standardizer):
+		''' Converts features to z-scores, using the means and standard deviations
+		in standardizer (a StandardizingVector).
+		'''
+
+		assert self.numfeatures == len(standardizer.means)
+
+		means = standardizer.means[self.featurelist].values
+		stdevs = standardizer.stdevs[self.featurelist].values
+		self.features = (self.features - means) / stdevs
+
+	def dataframe(self):
+		''' The features as a DataFrame, with volumes as rows (indexed by volID)
+		and features as columns.
+		'''
 
+		return DataFrame(self.features, index = self.volIDs, columns = self.featurelist)
 
+def corpus_from_files(volumeIDs, volumepaths, include_punctuation):
+	''' Reads each file into a Corpus, without keeping a BagOfWords for each.
+	'''
+
+	listofrawcounts = list()
+	totalcounts = list()
+	for filepath in volumepaths:
+		rawcounts, totalcount = read_counts(filepath, include_punctuation)
+		listofrawcounts.append(rawcounts)
+		totalcounts.append(totalcount)
+
+	return Corpus(volumeIDs, listofrawcounts, totalcounts)
+
+def corpus_from_volumes(listofvolumes):
+	''' Makes a Corpus from a list of BagOfWords or WordVector objects.
+	'''
 
+	volIDs = [getattr(avolume, 'volID', idx) for idx, avolume in enumerate(listofvolumes)]
+	return Corpus(volIDs, [x.rawcounts for x in listofvolumes], [x.totalcount for x in listofvolumes])
@@ -1,7 +1,6 @@
 import os, sys
 import numpy as np
-import pandas as pd
-from bagofwords import BagOfWords, StandardizingVector
+from bagofwords import StandardizingVector, corpus_from_files
 import epistolarymetadata
 import pickle
 from sklearn.linear_model import LogisticRegression
@@ -13,12 +12,9 @@ def select_common_features(trainingset, n):
 	Not a sophisticated feature-selection strategy, but in many
 	cases it gets the job done.
 	'''
-	allwordcounts = dict()
-
-	for avolume in trainingset:
-		utils.add_dicts(avolume.rawcounts, allwordcounts)
-		# The add_dicts function will add up all the raw counts into
-		# a single master dictionary.
+	allwordcounts = trainingset.wordcounts()
+	# The trainingset is a Corpus; this adds up all the raw counts into
+	# a single master dictionary.
 
 	descendingbyfreq = utils.sortkeysbyvalue(allwordcounts, whethertoreverse = True)
 	# This returns a list of 2-tuple (frequency, word) pairs.
@@ -67,14 +63,10 @@ def train_a_model(sourcefolder, extension, include_punctuation, maxfeatures, out
 			volumeIDs.append(volID)
 			volumepaths.append(path)
 
-	# Now we actually read volumes and create a training corpus, which will
-	# be a list of bags of words.
+	# Now we actually read volumes and create a training corpus, which
+	# holds the raw counts for every volume in a single matrix.
 
-	trainingset = list()
-	for volID, filepath in zip(volumeIDs, volumepaths):
-		volume = BagOfWords(filepath, volID, include_punctuation)
-		# That reads the volume from disk.
-		trainingset.append(volume)
+	trainingset = corpus_from_files(volumeIDs, volumepaths, include_punctuation)
 
 	# We select the most common words as features.
 	featurelist = select_common_features(trainingset, maxfeatures)
@@ -82,39 +74,25 @@ def train_a_model(sourcefolder, extension, include_punctuation, maxfeatures, out
 	# Note that the number of features we actually got is not necessarily
 	# the same as maxfeatures.
 
-	for volume in trainingset:
-		volume.selectfeatures(featurelist)
-		volume.normalizefrequencies()
-		# The volume now contains feature frequencies:
-		# raw counts have been divided by the total number of words in the volume.
+	trainingset.selectfeatures(featurelist)
+	trainingset.normalizefrequencies()
+	# The corpus now contains feature frequencies: each volume's
+	# raw counts have been divided by the total number of words in the volume.
 
 	standardizer = StandardizingVector(trainingset, featurelist)
 	# This object calculates the means and standard deviations of all features
 	# across the training set.
 
-	listofvolumefeatures = list()
-	for volume in trainingset:
-		volume.standardizefrequencies(standardizer)
-		# We have now converted frequencies to z scores. This is important for
-		# regularized logistic regression -- otherwise the regularization
-		# gets distributed unevenly across variables because they're scaled
-		# differently.
-
-		listofvolumefeatures.append(volume.features)
-
-	# Now let's make a data frame by concatenating each volume as a separate column,
-	# aligned on the features that index rows.
-
-	data = pd.concat(listofvolumefeatures, axis = 1)
-	data.columns = volumeIDs
-
-	# Name the columns for volumes. Then transpose the matrix:
+	trainingset.standardizefrequencies(standardizer)
+	# We have now converted frequencies to z scores. This is important for
+	# regularized logistic regression -- otherwise the regularization
+	# gets distributed unevenly across variables because they're scaled
+	# differently.
 
-	data = data.T
+	data = trainingset.dataframe()
 
 	# So that we have a matrix with features (variables) as columns and instances (volumes)
-	# as rows. Would have been easier to make this directly, but I don't know a neat
-	# way to do it in pandas.
+	# as rows, indexed by volume ID.
 
 	classvector = epistolarymetadata.get_genrevector(volumeIDs, "nonepistolary / epistolary")
 	# This part is going to be very specific to the model you train, so I've
@@ -1,8 +1,24 @@
 # CollectByYear.py
 
+# Sums the word counts produced by extract.py into yearly totals.
+#
+# Usage: python3 CollectByYear.py <root directory> <pre|post> [number of workers]
+#
+# The root directory holds the subdirectories created by extract.py -sub. We don't
+# build a dictionary of dictionaries for every year and word. Instead each word gets an
+# integer id, and each (year, word) pair becomes a single integer key, so counts can be
+# held in a pair of numpy arrays and summed by sorting. Subdirectories can be
+# collected in parallel; their partial results get merged at the end.
+
 import sys, os
-import FileCabinet
-import SonicScrewdriver as utils
+from array import array
+from multiprocessing import Pool
+import numpy as np
+
+extension = ".fic.tsv"
+
+# Years are packed into the low bits of the key: key = wordid * YEARSPAN + year.
+YEARSPAN = 4096
 
 def dirty_pairtree(htid):
 	period = htid.find('.')
@@ -14,91 +30,198 @@ def dirty_pairtree(htid):
 	dirtyname = prefix + "." + postfix
 	return dirtyname
 
-def add_counts(wordcounts, year, word, count):
-	if year in wordcounts:
-
-		if word in wordcounts[year]:
-			wordcounts[year][word] += count
+def read_dates(metafile):
+	'''Reads only the volume ID (first column) and date from the metadata table,
+	rather than the whole table, and returns a dict pairing IDs with integer years.
+	Dates that can't be read become 0.'''
+
+	dates = dict()
+
+	with open(metafile, encoding = 'utf-8') as f:
+		fieldnames = f.readline().rstrip().split('\t')
+		datecolumn = fieldnames.index('date')
+
+		for line in f:
+			line = line.rstrip()
+			if len(line) < 1:
+				continue
+			fields = line.split('\t')
+			if len(fields) > datecolumn:
+				date = fields[datecolumn]
+			else:
+				date = ""
+			try:
+				intdate = int(date[0:4])
+			except:
+				# No readable date
+				intdate = 0
+			dates[fields[0]] = intdate
+
+	return dates
+
+def sum_by_key(keys, counts):
+	'''Returns the unique keys, in sorted order, and the sum of counts for each.'''
+	if len(keys) < 1:
+		return keys, counts
+	order = np.argsort(keys, kind = 'mergesort')
+	keys = keys[order]
+	counts = counts[order]
+	starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+	return keys[starts], np.add.reduceat(counts, starts)
+
+class YearCounter:
+	'''Accumulates counts for (year, word) pairs. New counts go into pending arrays;
+	when those get long, compact() sums them into sorted arrays of unique keys
+	and totals, so memory stays proportional to the number of distinct pairs.'''
+
+	def __init__(self, compactafter = 5000000):
+		self.vocabulary = dict()
+		self.words = list()
+		self.keys = np.zeros(0, dtype = 'int64')
+		self.counts = np.zeros(0, dtype = 'int64')
+		self.pendingkeys = array('q')
+		self.pendingcounts = array('q')
+		self.compactafter = compactafter
+
+	def wordid(self, word):
+		if word in self.vocabulary:
+			return self.vocabulary[word]
 		else:
-			wordcounts[year][word] = count
-
-	else:
-		wordcounts[year] = dict()
-		wordcounts[year][word] = count
-
-
-extension = ".fic.tsv"
-
-args = sys.argv
-
-d = args[1]
-# We assume that the root directory to collect is passed in as the first command-line
-# argument.
-
-prepost = args[2]
-# We take the second command-line argument as a flag that tells us whether this dataset is
-# pre or post 1900. We have different metadata tables for the two datasets.
-
-if prepost == "post":
-	metafile = '/projects/ichass/usesofscale/20cmeta/MonographMetadata.tsv'
-else:
-	metafile = '/projects/ichass/usesofscale/hathimeta/ExtractedMetadata.tsv'
-
-rows, columns, table = utils.readtsv(metafile)
-
-subdirectories = [os.path.join(d,o) for o in os.listdir(d) if os.path.isdir(os.path.join(d,o))]
-
-wordcounts = dict()
-
-for subdir in subdirectories:
+			newid = len(self.words)
+			self.vocabulary[word] = newid
+			self.words.append(word)
+			return newid
+
+	def add(self, year, word, count):
+		self.pendingkeys.append(self.wordid(word) * YEARSPAN + year)
+		self.pendingcounts.append(count)
+		if len(self.pendingkeys) >= self.compactafter:
+			self.compact()
+
+	def compact(self):
+		if len(self.pendingkeys) < 1:
+			return
+		allkeys = np.concatenate([self.keys, np.frombuffer(self.pendingkeys, dtype = 'int64')])
+		allcounts = np.concatenate([self.counts, np.frombuffer(self.pendingcounts, dtype = 'int64')])
+		self.keys, self.counts = sum_by_key(allkeys, allcounts)
+		self.pendingkeys = array('q')
+		self.pendingcounts = array('q')
+
+	def partial_result(self):
+		'''A compact, picklable summary that can be merged into another counter.'''
+		self.compact()
+		return self.words, self.keys, self.counts
+
+	def merge(self, partial):
+		words, keys, counts = partial
+		if len(keys) < 1:
+			return
+		translation = np.array([self.wordid(word) for word in words], dtype = 'int64')
+		newkeys = translation[keys // YEARSPAN] * YEARSPAN + (keys % YEARSPAN)
+		self.compact()
+		allkeys = np.concatenate([self.keys, newkeys])
+		allcounts = np.concatenate([self.counts, counts])
+		self.keys, self.counts = sum_by_key(allkeys, allcounts)
+
+	def write(self, outputpath):
+		'''Writes year, word, count lines, ordered by year and then by word.
+		Word ids depend on the order partial results were merged in, which
+		varies from run to run with several workers, so we sort on the words
+		themselves.'''
+		self.compact()
+		years = self.keys % YEARSPAN
+		wordids = self.keys // YEARSPAN
+		alphabetical = np.empty(len(self.words), dtype = 'int64')
+		alphabetical[np.argsort(np.array(self.words, dtype = str), kind = 'mergesort')] = np.arange(len(self.words))
+		order = np.lexsort((alphabetical[wordids], years))
+		with open(outputpath, mode='w', encoding = 'utf-8') as f:
+			for idx in order:
+				outline = str(years[idx]) +'\t' + self.words[wordids[idx]] + '\t' + str(self.counts[idx]) + '\n'
+				f.write(outline)
+
+# The dates get handed to each worker process once, when the pool starts.
+dates = dict()
+
+def set_dates(datedict):
+	global dates
+	dates = datedict
+
+def collect_subdirectory(subdir):
+	'''Sums the counts for every dated volume in a subdirectory, and returns
+	a partial result for YearCounter.merge.'''
+
+	counter = YearCounter()
 	filelist = [o for o in os.listdir(subdir) if not o.startswith('.')]
+	numvolumes = 0
 
 	for filename in filelist:
 		dirtyID = filename.replace(extension, '')
 		dirtyID = dirty_pairtree(dirtyID)
 		filepath = os.path.join(subdir, filename)
 
-		if dirtyID in rows:
-			date = table["date"][dirtyID]
-			try:
-				intdate = int(date[0:4])
-			except:
-				# No readable date
-				intdate = 0
+		if dirtyID in dates:
+			intdate = dates[dirtyID]
 		else:
 			intdate = 0
 
 		if intdate > 1699 and intdate < 2000:
 
-			print(dirtyID)
+			numvolumes += 1
 
 			with open(filepath, encoding='utf-8') as f:
-				filelines = f.readlines()
+				for line in f:
+					line = line.rstrip()
+					fields = line.split('\t')
+					if len(fields) < 2:
+						continue
+					word = fields[0]
+					count = int(fields[1])
+					counter.add(intdate, word, count)
 
-			for line in filelines:
-				line = line.rstrip()
-				fields = line.split('\t')
-				word = fields[0]
-				count = int(fields[1])
-				add_counts(wordcounts, intdate, word, count)
+	print(subdir + ': ' + str(numvolumes) + ' volumes.')
 
-outputpath = os.path.join(d, 'summedbyyear.tsv')
-with open(outputpath, mode='w', encoding = 'utf-8') as f:
-	for year, subdictionary in wordcounts.items():
+	return counter.partial_result()
 
-		for word, count in subdictionary.items():
-			outline = str(year) +'\t' + word + '\t' + str(count) + '\n'
-			f.write(outline)
-
-print('Done.')
+if __name__ == '__main__':
 
+	args = sys.argv
 
+	d = args[1]
+	# We assume that the root directory to collect is passed in as the first command-line
+	# argument.
 
+	prepost = args[2]
+	# We take the second command-line argument as a flag that tells us whether this dataset is
+	# pre or post 1900. We have different metadata tables for the two datasets.
 
+	if len(args) > 3:
+		workers = int(args[3])
+	else:
+		workers = 1
+	# An optional third argument sets the number of processes.
 
+	if prepost == "post":
+		metafile = '/projects/ichass/usesofscale/20cmeta/MonographMetadata.tsv'
+	else:
+		metafile = '/projects/ichass/usesofscale/hathimeta/ExtractedMetadata.tsv'
 
+	set_dates(read_dates(metafile))
 
+	subdirectories = [os.path.join(d,o) for o in os.listdir(d) if os.path.isdir(os.path.join(d,o))]
 
+	wordcounts = YearCounter()
 
+	if workers > 1:
+		pool = Pool(processes = workers, initializer = set_dates, initargs = (dates,))
+		for partial in pool.imap_unordered(collect_subdirectory, subdirectories):
+			wordcounts.merge(partial)
+		pool.close()
+		pool.join()
+	else:
+		for subdir in subdirectories:
+			wordcounts.merge(collect_subdirectory(subdir))
 
+	outputpath = os.path.join(d, 'summedbyyear.tsv')
+	wordcounts.write(outputpath)
 
+	print('Done.')
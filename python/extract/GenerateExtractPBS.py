@@ -8,5 +8,5 @@ for i in range (0, 53):
         file.write('#PBS -q ichass\n')
         file.write('#PBS -m be\n')
         file.write('cd $PBS_O_WORKDIR\n')
-        file.write('python3 extract.py -idfile /projects/ichass/usesofscale/hathimeta/pre20cslices/slice' + str(i) + '.txt -g fic -v -sub -rh' + '\n')
+        file.write('python3 extract.py -idfile /projects/ichass/usesofscale/hathimeta/pre20cslices/slice' + str(i) + '.txt -g fic -v -sub -rh -workers 12' + '\n')
 
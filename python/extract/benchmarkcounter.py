@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+# benchmarkcounter.py
+
+# Times wordcounter.count_tokens with wordlists of increasing size, to confirm that the
+# cost per token doesn't grow with the number of target words. The token streams are
+# rebuilt from the sample volumes in ../classify/data, which are lists of word counts.
+#
+# Usage:
+#   python3 benchmarkcounter.py [folder of .tsv volumes]
+#
+# Like wordcounter itself, this needs a PathDictionary.txt pointing to the rule files.
+
+import os, sys, time, random
+import wordcounter
+
+def read_stream(filepath):
+    '''Turns a tsv of word counts back into a (shuffled) stream of tokens.'''
+    tokens = list()
+    with open(filepath, encoding = 'utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 2:
+                continue
+            tokens.extend([fields[0]] * int(fields[1]))
+    random.shuffle(tokens)
+    return tokens
+
+if __name__ == '__main__':
+
+    args = sys.argv
+
+    if len(args) > 1:
+        sourcedir = args[1]
+    else:
+        sourcedir = '../classify/data'
+
+    random.seed(0)
+    filelist = sorted([x for x in os.listdir(sourcedir) if x.endswith('.tsv')])[0:20]
+    streams = [read_stream(os.path.join(sourcedir, x)) for x in filelist]
+    numtokens = sum([len(x) for x in streams])
+
+    vocabulary = set()
+    for stream in streams:
+        vocabulary.update([x.lower() for x in stream])
+    vocabulary = sorted(vocabulary)
+
+    print('Volumes: ' + str(len(streams)) + '    tokens: ' + str(numtokens))
+
+    for wordlistsize in [10, 1000, 10000, 100000]:
+        # Real words, padded out with words that never occur.
+        targetwords = vocabulary[0 : wordlistsize]
+        for i in range(wordlistsize - len(targetwords)):
+            targetwords.append('notaword' + str(i))
+        targetphrases = [(targetwords[i], targetwords[i + 1]) for i in range(0, len(targetwords) - 1, 10)]
+
+        start = time.time()
+        targetspec = wordcounter.TargetSpec(targetwords, targetphrases)
+        preparation = time.time() - start
+
+        start = time.time()
+        for stream in streams:
+            wordcounter.count_tokens(stream, targetspec = targetspec)
+        elapsed = time.time() - start
+
+        pertoken = elapsed / numtokens * 1000000
+        print('Wordlist of ' + str(wordlistsize).rjust(6) + ':  ' + str(round(pertoken, 3)) + ' microsec per token  (prepared in ' + str(round(preparation, 4)) + ' sec)')
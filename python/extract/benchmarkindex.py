@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# benchmarkindex.py
+
+# Measures what it costs to consult the index of genre predictions. Before
+# version 2, genrefilter.matching_pages read the whole index from disk for every
+# slice of 100 volumes; now extract.py loads it once and passes it in.
+#
+# Usage:
+#   python3 benchmarkindex.py                     (a synthetic index of 2 million volumes)
+#   python3 benchmarkindex.py predictions.index   (a real index)
+#
+# The script writes temporary copies of the index (text and binary) in the
+# current directory and deletes them when it's done.
+
+import os, sys, time, random
+from requestpredict import PredictIndex
+
+def synthetic_index(numvolumes):
+    index = PredictIndex()
+    for i in range(numvolumes):
+        htid = 'mdp.39015' + str(i).zfill(9)
+        index._index[htid] = '/projects/ichass/usesofscale/pagepredicts/mdp/' + htid + '.predict'
+    return index
+
+def time_load(sourcefile):
+    start = time.time()
+    index = PredictIndex()
+    index.readFromDisk(sourcefile)
+    return index, time.time() - start
+
+def time_lookups(index, htids):
+    start = time.time()
+    found = 0
+    for htid in htids:
+        if htid in index._index:
+            found += 1
+    return time.time() - start
+
+if __name__ == '__main__':
+
+    args = sys.argv
+
+    if len(args) > 1:
+        source = PredictIndex()
+        source.readFromDisk(args[1])
+    else:
+        source = synthetic_index(2000000)
+
+    textpath = 'benchmark.index'
+    binarypath = 'benchmark.pickle'
+
+    with open(textpath, mode='w', encoding='utf-8') as file:
+        for htid in sorted(source._index):
+            file.write(htid + '\t' + source._index[htid] + '\n')
+    source.writeBinary(binarypath)
+
+    allids = list(source._index.keys())
+    random.shuffle(allids)
+    slicesize = 100
+    numslices = 50
+    slices = [allids[i * slicesize : (i + 1) * slicesize] for i in range(numslices)]
+
+    print('Volumes in index: ' + str(len(allids)))
+
+    textindex, textload = time_load(textpath)
+    binaryindex, binaryload = time_load(binarypath)
+    print('Startup, text index:   ' + str(round(textload, 3)) + ' sec')
+    print('Startup, binary index: ' + str(round(binaryload, 3)) + ' sec')
+
+    # Old behavior: every slice of 100 volumes reloads the index.
+    lookuptime = 0
+    for aslice in slices:
+        lookuptime += time_lookups(textindex, aslice)
+    oldperslice = textload + (lookuptime / numslices)
+    print('Per slice, reloading the index:  ' + str(round(oldperslice, 4)) + ' sec')
+
+    # New behavior: the index is already in memory.
+    lookuptime = 0
+    for aslice in slices:
+        lookuptime += time_lookups(binaryindex, aslice)
+    newperslice = lookuptime / numslices
+    print('Per slice, index loaded once:    ' + str(round(newperslice, 6)) + ' sec')
+
+    fiftythousand = 50000 / slicesize
+    print('Estimated index cost for a 50k-volume idfile:')
+    print('    before: ' + str(round(oldperslice * fiftythousand, 1)) + ' sec')
+    print('    after:  ' + str(round(binaryload + newperslice * fiftythousand, 1)) + ' sec')
+
+    os.remove(textpath)
+    os.remove(binarypath)
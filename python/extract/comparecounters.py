@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# comparecounters.py
+
+# Checks that wordcounter.count_tokens_fast returns exactly the same results as
+# wordcounter.count_tokens over a corpus of volumes, and reports the speed of
+# each in tokens per second, so we can keep track of it from one version to the next.
+#
+# Usage:
+#   python3 comparecounters.py [folder] [-wordlist path] [-phraselist path]
+#
+# The folder can contain .norm.txt volumes, or .tsv files of word counts (like the
+# samples in ../classify/data), which get turned back into shuffled token streams.
+# Like wordcounter itself, this needs a PathDictionary.txt pointing to the rule files.
+
+import os, sys, time, random
+import argumentparser
+import wordcounter
+
+def read_stream(filepath):
+    tokens = list()
+    with open(filepath, encoding = 'utf-8') as f:
+        if filepath.endswith('.tsv'):
+            for line in f:
+                fields = line.rstrip('\n').split('\t')
+                if len(fields) != 2:
+                    continue
+                tokens.extend([fields[0]] * int(fields[1]))
+            random.shuffle(tokens)
+        else:
+            tokens = wordcounter.makestream([f.readlines()])
+    return tokens
+
+if __name__ == '__main__':
+
+    args = sys.argv
+    if len(args) > 1 and not args[1].startswith('-'):
+        sourcedir = args[1]
+        argdict = argumentparser.simple_parse(args[1:])
+    else:
+        sourcedir = '../classify/data'
+        argdict = argumentparser.simple_parse(args)
+
+    if '-wordlist' in argdict:
+        with open(argdict['-wordlist'], encoding = 'utf-8') as f:
+            targetwords = [x.rstrip() for x in f.readlines()]
+    else:
+        targetwords = []
+
+    if '-phraselist' in argdict:
+        with open(argdict['-phraselist'], encoding = 'utf-8') as f:
+            targetphrases = [tuple(x.rstrip().split(" ")) for x in f.readlines()]
+    else:
+        targetphrases = []
+
+    targetspec = wordcounter.TargetSpec(targetwords, targetphrases)
+
+    random.seed(0)
+    filelist = sorted([x for x in os.listdir(sourcedir) if x.endswith('.tsv') or x.endswith('.norm.txt')])
+
+    numtokens = 0
+    reference = 0
+    fast = 0
+    mismatches = list()
+
+    for filename in filelist:
+        tokens = read_stream(os.path.join(sourcedir, filename))
+        numtokens += len(tokens)
+
+        start = time.time()
+        expected = wordcounter.count_tokens(tokens, targetspec = targetspec)
+        reference += time.time() - start
+
+        start = time.time()
+        result = wordcounter.count_tokens_fast(tokens, targetspec = targetspec)
+        fast += time.time() - start
+
+        if result != expected:
+            mismatches.append(filename)
+
+    print('Volumes: ' + str(len(filelist)) + '    tokens: ' + str(numtokens))
+    print('count_tokens:       ' + str(int(numtokens / reference)) + ' tokens/sec')
+    print('count_tokens_fast:  ' + str(int(numtokens / fast)) + ' tokens/sec')
+
+    if len(mismatches) > 0:
+        print('Results differ for ' + str(len(mismatches)) + ' volumes:')
+        for filename in mismatches:
+            print('    ' + filename)
+        sys.exit(1)
+    else:
+        print('Results identical for all volumes.')
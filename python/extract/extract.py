@@ -17,18 +17,28 @@
 # -g or -genre    A genre or comma-separated list of genres to fetch.
 # -id             A specified volume to fetch.
 # -idfile         Path to a file listing multiple volume IDs.
-# -index          Overrides default index for prediction files.
+# -index          Overrides default index for prediction files. An index saved by
+#                 requestpredict.py -pickle (ending in .pickle) loads much faster;
+#                 predictions packed by requestpredict.py -pack (ending in .pack)
+#                 avoid reading a JSON file per volume.
 # -root           Overrides default rootpath.
 # -wordlist       Overrides default feature set (all features.)
 # -phraselist     Defines a list of two-word phrases to be extracted. At present we don't
 #                 provide for longer phrases. Default is, no such list.
 # -rh             Remove running headers from the selected volumes.
+# -rhwindow       Number of previous pages searched for repeated headers. Default is 2.
 # -o              Output folder. Otherwise defaults to output folder in PathDictionary.
 # -v              Verbose.
 # -sub            Make subdirectories for the top-level HathiTrust domains within the
 #                 output folder.
 # -threshold      Sets the threshold (ratio of pages in genre / total pages) that a
 #                 volume must exceed in order to be extracted.
+# -resume         Skip volumes recorded as finished in the journal of an interrupted run.
+# -journal        Path for that journal. Defaults to <idfile name>.journal in the output folder.
+# -store          Folder for a feature store (see featurestore.py). Counts are added to
+#                 the store instead of being written as a tsv for each volume.
+# -workers        Number of processes to use. Volumes are read, counted and written in
+#                 parallel; output is the same as a serial run. Default is 1.
 #
 # The only options that are mandatory are the ones providing volumes to process, and genre(s) to
 # select. All the other options have default settings.
@@ -37,6 +47,7 @@
 # the folder containing parsing rules.
 
 import sys, os
+from multiprocessing import Pool
 import argumentparser
 import FileCabinet
 import genrefilter
@@ -83,62 +94,234 @@ def all_nonalphanumeric(astring):
             break
     return nonalphanum
 
-def process_volumes(volumedictionary, targetwords, targetphrases, argdict, outputfolder, fileswritten, genrelabel, make_subdirectories, verbose):
+def count_volume(volID, pagedictionary, targetspec, argdict, verbose):
+
+    '''Counts features in a single volume, represented as a dictionary that pairs page
+    numbers with pages (lists of lines), after removing headers if that option has been
+    selected. Returns a list of (count, word) tuples sorted in descending order, and the
+    number of alphanumeric tokens.
+    '''
+    global romannumerals
+
+    pagelist = collapsed_list(pagedictionary)
+
+    if "-rh" in argdict:
+        if "-rhwindow" in argdict:
+            window = int(argdict["-rhwindow"])
+        else:
+            window = 2
+        pagelist, removed = header.remove_headers(pagelist, romannumerals, window)
+
+        # if verbose:
+        #     print(removed)
+
+    tokenstream = wordcounter.makestream(pagelist)
+    wordcounts, wordsfused, triplets, alphanum_tokens = wordcounter.count_tokens_fast(tokenstream, verbose = verbose, targetspec = targetspec)
+
+    sortedcounts = sort_wordcounts(wordcounts)
+
+    # if verbose:
+    #     print(volID + "\tfused: " + str(wordsfused) + "\ttriplets: " + str(triplets))
+
+    return sortedcounts, alphanum_tokens
+
+def write_volume(volID, sortedcounts, alphanum_tokens, outputfolder, genrelabel, make_subdirectories, store = None):
+
+    '''Writes the counts for a volume to file in an appropriate subdirectory, or, if
+    a featurestore.FeatureStoreWriter is provided, adds them to the store instead.
+
+    Returns a (filename, alphanum_tokens, totalcount) tuple for the list of files
+    written, or None if nothing was written.
+    '''
+
+    if len(sortedcounts) < 1:
+        return None
+
+    filename = clean_pairtree(volID)
+
+    if store is not None:
+        totalcount = store.add_volume(filename, sortedcounts, alphanum_tokens)
+        return (filename, alphanum_tokens, totalcount)
+
+    if make_subdirectories:
+        prefix = filename.split(".")[0]
+        subdirectory = outputfolder + prefix
+        if not os.path.isdir(subdirectory):
+            os.makedirs(subdirectory, exist_ok = True)
+            # Several workers may be trying to create the same subdirectory.
+        thisdirectory = subdirectory + '/'
+    else:
+        thisdirectory = outputfolder
+
+    outpath = thisdirectory + filename + '.' + genrelabel + '.tsv'
+
+    # We write for instance as
+    # /projects/ichass/usesofscale/extracted/loc/loc.ark+=13960=t02z1cb4d.fic.tsv
+
+    totalcount = 0
+
+    with open(outpath, mode='w', encoding = 'utf-8') as f:
+        for count, word in sortedcounts:
+            outline = word + '\t' + str(count) + '\n'
+            f.write(outline)
+            totalcount += count
+
+    return (filename, alphanum_tokens, totalcount)
+
+def process_volume(volID, pagedictionary, targetspec, argdict, outputfolder, genrelabel, make_subdirectories, verbose, store = None):
+
+    '''Processes a single volume, represented as a dictionary that pairs page numbers
+    with pages (lists of lines), by removing headers if that option has been selected,
+    counting features, and writing those features to file (or to the store).
+
+    Returns a (filename, alphanum_tokens, totalcount) tuple for the list of files
+    written, or None if nothing was written.
+    '''
+
+    sortedcounts, alphanum_tokens = count_volume(volID, pagedictionary, targetspec, argdict, verbose)
+
+    return write_volume(volID, sortedcounts, alphanum_tokens, outputfolder, genrelabel, make_subdirectories, store)
+
+def read_journal(journalpath):
+    ''' Reads the journal left by an earlier, interrupted run. Returns the set of
+    volume IDs already finished, and the (filename, alphanum_tokens, totalcount)
+    tuples for the files they wrote.
+    '''
+
+    finished = set()
+    fileswritten = list()
+
+    if not os.path.exists(journalpath):
+        return finished, fileswritten
+
+    with open(journalpath, encoding = 'utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) != 4:
+                # Probably a line cut short when the job was killed.
+                continue
+            volID, filename, alphanum_tokens, totalcount = fields
+            finished.add(volID)
+            if len(filename) > 0:
+                fileswritten.append((filename, int(alphanum_tokens), int(totalcount)))
+
+    return finished, fileswritten
+
+def record_volume(journal, volID, written):
+    ''' Adds a finished volume to the journal, and flushes it right away so
+    that the record survives if the job is killed.
+    '''
+
+    if journal is None:
+        return
+
+    if written is None:
+        # The volume was processed, but nothing was written.
+        journal.write(volID + '\t\t\t\n')
+    else:
+        filename, alphanum_tokens, totalcount = written
+        journal.write(volID + '\t' + filename + '\t' + str(alphanum_tokens) + '\t' + str(totalcount) + '\n')
+
+    journal.flush()
+
+class DeferredJournal:
+    ''' Used in place of the journal file when counts go to a feature store.
+    Counts in the store aren't safe until their shard has been written, so we
+    hold the journal lines until the store tells us (by calling commit) that
+    the shard is on disk.
+    '''
+
+    def __init__(self, journalfile):
+        self.journalfile = journalfile
+        self.pending = list()
+
+    def write(self, line):
+        self.pending.append(line)
+
+    def flush(self):
+        pass
+
+    def commit(self):
+        for line in self.pending:
+            self.journalfile.write(line)
+        self.journalfile.flush()
+        self.pending = list()
+
+    def close(self):
+        self.commit()
+        self.journalfile.close()
+
+def process_volumes(volumedictionary, targetspec, argdict, outputfolder, fileswritten, genrelabel, make_subdirectories, verbose, journal = None, store = None):
 
     ''' Accepts a dictionary where volume IDs are keys and the values are themselves dictionaries
     that pair page numbers with pages (lists of lines).
 
     Processes these volumes by removing headers, if that option has been selected, counting features,
-    and then writing those features to file in an appropriate subdirectory.
+    and then writing those features to file in an appropriate subdirectory. Each volume is
+    recorded in the journal, if one is provided, as soon as it's finished.
     '''
-    global romannumerals
 
     for volID, pagedictionary in volumedictionary.items():
 
-        pagelist = collapsed_list(pagedictionary)
+        written = process_volume(volID, pagedictionary, targetspec, argdict, outputfolder, genrelabel, make_subdirectories, verbose, store)
 
-        if "-rh" in argdict:
-            pagelist, removed = header.remove_headers(pagelist, romannumerals)
+        record_volume(journal, volID, written)
 
-            # if verbose:
-            #     print(removed)
+        # Only now that the volume's journal line is queued can its shard be
+        # written (and the line committed with it).
+        if store is not None:
+            store.flush_if_full()
 
-        tokenstream = wordcounter.makestream(pagelist)
-        wordcounts, wordsfused, triplets, alphanum_tokens = wordcounter.count_tokens(tokenstream, targetwords=targetwords, targetphrases=targetphrases, verbose = verbose)
+        if written is not None:
+            fileswritten.append(written)
 
-        sortedcounts = sort_wordcounts(wordcounts)
+def extract_one_volume(volumetuple):
+    ''' The unit of work for the -workers option. Reads a single volume that
+    genrefilter has already selected, then processes it exactly as process_volumes
+    would. Since it runs in a separate process, everything it needs is packed
+    into a single tuple.
 
-        if len(sortedcounts) > 0:
+    Returns None if the volume couldn't be read; otherwise a (volID, written)
+    tuple, where written is the result of process_volume. If we're writing to
+    a feature store, only the parent process can do that, so instead of written
+    we return the (sortedcounts, alphanum_tokens) from count_volume.
+    '''
 
-            filename = clean_pairtree(volID)
+    htid, listofgenres, fullpath, targetgenres, targetspec, argdict, outputfolder, genrelabel, make_subdirectories, verbose = volumetuple
 
-            if make_subdirectories:
-                prefix = filename.split(".")[0]
-                subdirectory = outputfolder + prefix
-                if not os.path.isdir(subdirectory):
-                    os.makedirs(subdirectory)
-                thisdirectory = subdirectory + '/'
-            else:
-                thisdirectory = outputfolder
+    pagedictionary = genrefilter.read_volume(htid, listofgenres, fullpath, targetgenres)
 
-            outpath = thisdirectory + filename + '.' + genrelabel + '.tsv'
+    if pagedictionary is None:
+        return None
 
-            # We write for instance as
-            # /projects/ichass/usesofscale/extracted/loc/loc.ark+=13960=t02z1cb4d.fic.tsv
+    if "-store" in argdict:
+        return (htid, count_volume(htid, pagedictionary, targetspec, argdict, verbose))
 
-            totalcount = 0
+    written = process_volume(htid, pagedictionary, targetspec, argdict, outputfolder, genrelabel, make_subdirectories, verbose)
 
-            with open(outpath, mode='w', encoding = 'utf-8') as f:
-                for count, word in sortedcounts:
-                    outline = word + '\t' + str(count) + '\n'
-                    f.write(outline)
-                    totalcount += count
+    return (htid, written)
 
-            fileswritten.append((filename, alphanum_tokens, totalcount))
+def parallel_tasks(htidList, targetgenres, targetspec, argdict, outputfolder, genrelabel, make_subdirectories, verbose, threshold, predictions):
+    ''' Generates a tuple for extract_one_volume for every volume that passes
+    the genre threshold. We still consult the predictions a hundred volumes at
+    a time, but the pool consumes these lazily, so workers never wait for a
+    whole slice to finish.
+    '''
 
-        # if verbose:
-        #     print(volID + "\tfused: " + str(wordsfused) + "\ttriplets: " + str(triplets))
+    numIDs = len(htidList)
+    floor = 0
 
+    while floor < numIDs:
+        ceiling = floor + 100
+        if ceiling > numIDs:
+            ceiling = numIDs
+
+        subset = htidList[floor : ceiling]
+
+        for htid, listofgenres, fullpath in genrefilter.selected_volumes(subset, targetgenres, argdict, threshold, predictions):
+            yield (htid, listofgenres, fullpath, targetgenres, targetspec, argdict, outputfolder, genrelabel, make_subdirectories, verbose)
+
+        floor = ceiling
 
 def main(argdict):
     ''' The main body of this module. Its one argument is a dictionary of command-line options
@@ -209,6 +392,9 @@ def main(argdict):
     else:
         targetphrases = []
 
+    # Sets of target words and phrases, built once and used for every volume.
+    targetspec = wordcounter.TargetSpec(targetwords, targetphrases)
+
     if '-o' in argdict:
         outputfolder = argdict['-o']
     else:
@@ -221,7 +407,47 @@ def main(argdict):
     else:
         threshold = 0.1
 
-    fileswritten = list()
+    # Number of worker processes. With the default of one, volumes are processed
+    # serially in this process.
+    if "-workers" in argdict:
+        workers = int(argdict["-workers"])
+    else:
+        workers = 1
+
+    # We keep a journal of finished volumes, so that a job killed at walltime can be
+    # resumed with -resume. By default it's named after the idfile and lives in the
+    # output folder.
+    if "-journal" in argdict:
+        journalpath = argdict["-journal"]
+    elif len(htidListFile) > 0:
+        journalpath = outputfolder + os.path.basename(htidListFile) + '.journal'
+    else:
+        journalpath = outputfolder + 'extract.journal'
+
+    if "-resume" in argdict:
+        finished, fileswritten = read_journal(journalpath)
+        htidList = [x for x in htidList if x.rstrip() not in finished]
+        print('Resuming: ' + str(len(finished)) + ' volumes already finished.')
+        journal = open(journalpath, mode = 'a', encoding = 'utf-8')
+    else:
+        fileswritten = list()
+        journal = open(journalpath, mode = 'w', encoding = 'utf-8')
+
+    # Instead of a tsv per volume, we can write all the counts to a feature store.
+    if "-store" in argdict:
+        import featurestore
+        if len(htidListFile) > 0:
+            shardprefix = os.path.basename(htidListFile)
+        else:
+            shardprefix = 'extract'
+        journal = DeferredJournal(journal)
+        store = featurestore.FeatureStoreWriter(argdict["-store"], prefix = shardprefix, onflush = journal.commit)
+    else:
+        store = None
+
+    # The index of genre predictions gets loaded once and shared by every slice.
+    predictions = genrefilter.load_predictions(argdict)
+
     numIDs = len(htidList)
 
     # The list of volumes to process may well be too long to fit them all into memory.
@@ -229,20 +455,53 @@ def main(argdict):
     # a large number, except that in most cases many volumes will not be read by
     # genrefilter because the percentage of pages matching the genre target is too low.
 
-    floor = 0
+    if workers > 1:
+        # Each worker reads, cleans, counts and writes one volume at a time. imap returns
+        # results in the order of the tasks, so fileswritten comes out in the same order
+        # as it would in a serial run.
 
-    while floor < numIDs:
-        ceiling = floor + 100
-        if ceiling > numIDs:
-            ceiling = numIDs
+        print('Extracting with ' + str(workers) + ' workers.')
+        tasks = parallel_tasks(htidList, targetgenres, targetspec, argdict, outputfolder, genrelabel, make_subdirectories, verbose, threshold, predictions)
 
-        subset = htidList[floor : ceiling]
+        pool = Pool(processes = workers)
+        for result in pool.imap(extract_one_volume, tasks):
+            if result is None:
+                continue
 
-        volumedictionary = genrefilter.matching_pages(subset, targetgenres, argdict, threshold)
+            volID, written = result
+            if store is not None:
+                sortedcounts, alphanum_tokens = written
+                written = write_volume(volID, sortedcounts, alphanum_tokens, outputfolder, genrelabel, make_subdirectories, store)
 
-        process_volumes(volumedictionary, targetwords, targetphrases, argdict, outputfolder, fileswritten, genrelabel, make_subdirectories, verbose)
+            record_volume(journal, volID, written)
 
-        floor = ceiling
+            if store is not None:
+                store.flush_if_full()
+
+            if written is not None:
+                fileswritten.append(written)
+
+        pool.close()
+        pool.join()
+
+    else:
+        floor = 0
+
+        while floor < numIDs:
+            ceiling = floor + 100
+            if ceiling > numIDs:
+                ceiling = numIDs
+
+            subset = htidList[floor : ceiling]
+
+            volumedictionary = genrefilter.matching_pages(subset, targetgenres, argdict, threshold, predictions)
+
+            process_volumes(volumedictionary, targetspec, argdict, outputfolder, fileswritten, genrelabel, make_subdirectories, verbose, journal, store)
+
+            floor = ceiling
+
+    if store is not None:
+        store.close()
 
     # Now output fileswritten.
 
@@ -256,6 +515,11 @@ def main(argdict):
         for filename, alphanum_tokens, totalcount in fileswritten:
             f.write(filename + '\t' + str(alphanum_tokens) +'\t' + str(totalcount) + '\n')
 
+    # Everything in the journal is now in filenames.txt, so the journal has done its job.
+    # Removing it means a later -resume can't add these rows to filenames.txt twice.
+    journal.close()
+    os.remove(journalpath)
+
     print("Done.")
 
 if __name__ == '__main__':
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+
+# featurestore.py
+
+# An alternative to writing one <htid>.<genre>.tsv file per volume. Extracted
+# volumes get appended to a store: a folder of .npz shards, each holding a
+# few thousand volumes as a sparse matrix in CSR form (indptr, indices and
+# counts), along with the shard's own vocabulary and a list of the volume IDs
+# in it. Downstream scripts can then read a handful of large files instead of
+# opening millions of small ones.
+#
+# Each shard has its own vocabulary, so several jobs can write to the same
+# store at once as long as each uses a different prefix for its shards.
+# FeatureStore merges the vocabularies when it reads them.
+#
+# Writing:
+#   store = FeatureStoreWriter('/path/to/store/', prefix = 'slice12')
+#   store.add_volume(volid, sortedcounts, alphanum_tokens)
+#   store.flush_if_full()
+#   store.close()
+#
+# add_volume never writes a shard itself; the caller calls flush_if_full once
+# it has done whatever bookkeeping should be committed along with the volume
+# (extract.py queues the volume's journal line first).
+#
+# Reading:
+#   store = FeatureStore('/path/to/store/')
+#   store.volume_counts(volid)          -> dict of word counts for one volume
+#   for volid, counts in store.iter_volumes(): ...
+#   volids, vocabulary, matrix = store.matrix()   -> a whole-corpus matrix
+
+import os
+import numpy as np
+
+SHARDEXTENSION = '.npz'
+
+class FeatureStoreWriter:
+
+    def __init__(self, storefolder, prefix = 'shard', shardsize = 2000, onflush = None):
+        '''If provided, onflush is called with no arguments each time a shard
+        has been safely written to disk.'''
+
+        if not os.path.isdir(storefolder):
+            os.makedirs(storefolder, exist_ok = True)
+
+        self.storefolder = storefolder
+        self.prefix = prefix
+        self.shardsize = shardsize
+        self.onflush = onflush
+        self.shardnumber = 0
+        self._start_shard()
+
+    def _start_shard(self):
+        self.volids = list()
+        self.alphanum = list()
+        self.totals = list()
+        self.vocabulary = dict()
+        self.indptr = [0]
+        self.indices = list()
+        self.counts = list()
+
+    def add_volume(self, volid, sortedcounts, alphanum_tokens):
+        '''Adds a volume, given as a list of (count, word) tuples. Returns the total
+        of all counts, to match what extract.py records in filenames.txt.'''
+
+        totalcount = 0
+        for count, word in sortedcounts:
+            if word in self.vocabulary:
+                wordid = self.vocabulary[word]
+            else:
+                wordid = len(self.vocabulary)
+                self.vocabulary[word] = wordid
+            self.indices.append(wordid)
+            self.counts.append(count)
+            totalcount += count
+
+        self.indptr.append(len(self.indices))
+        self.volids.append(volid)
+        self.alphanum.append(alphanum_tokens)
+        self.totals.append(totalcount)
+
+        return totalcount
+
+    def flush_if_full(self):
+        '''Writes the current shard if it has reached shardsize.'''
+        if len(self.volids) >= self.shardsize:
+            self.flush()
+
+    def flush(self):
+        if len(self.volids) < 1:
+            return
+
+        vocablist = [''] * len(self.vocabulary)
+        for word, wordid in self.vocabulary.items():
+            vocablist[wordid] = word
+
+        shardname = self.prefix + '-' + str(self.shardnumber).zfill(5) + SHARDEXTENSION
+        while os.path.exists(os.path.join(self.storefolder, shardname)):
+            # Don't overwrite shards from an earlier (perhaps interrupted) run.
+            self.shardnumber += 1
+            shardname = self.prefix + '-' + str(self.shardnumber).zfill(5) + SHARDEXTENSION
+
+        # We write to a temporary name and then rename, so a job killed in the middle
+        # of writing never leaves a truncated shard behind.
+        temppath = os.path.join(self.storefolder, shardname + '.part')
+        with open(temppath, mode = 'wb') as f:
+            np.savez(f,
+                volids = np.array(self.volids, dtype = str),
+                alphanum = np.array(self.alphanum, dtype = 'int64'),
+                totals = np.array(self.totals, dtype = 'int64'),
+                vocabulary = np.array(vocablist, dtype = str),
+                indptr = np.array(self.indptr, dtype = 'int64'),
+                indices = np.array(self.indices, dtype = 'int32'),
+                counts = np.array(self.counts, dtype = 'int64'))
+        os.rename(temppath, os.path.join(self.storefolder, shardname))
+
+        self.shardnumber += 1
+        self._start_shard()
+
+        if self.onflush is not None:
+            self.onflush()
+
+    def close(self):
+        self.flush()
+
+class FeatureStore:
+
+    def __init__(self, storefolder):
+        self.storefolder = storefolder
+        self.shardpaths = sorted([os.path.join(storefolder, x) for x in os.listdir(storefolder) if x.endswith(SHARDEXTENSION)])
+
+        # The volume index pairs each volume ID with a shard and a row in that shard.
+        self.volumeindex = dict()
+        for shardnumber, shardpath in enumerate(self.shardpaths):
+            with np.load(shardpath) as shard:
+                for row, volid in enumerate(shard['volids']):
+                    self.volumeindex[str(volid)] = (shardnumber, row)
+
+        self._cachednumber = -1
+        self._cachedshard = None
+
+    def _shard(self, shardnumber):
+        if shardnumber != self._cachednumber:
+            with np.load(self.shardpaths[shardnumber]) as shard:
+                self._cachedshard = {key: shard[key] for key in shard.files}
+            self._cachednumber = shardnumber
+        return self._cachedshard
+
+    def volumes(self):
+        return list(self.volumeindex.keys())
+
+    def __contains__(self, volid):
+        return volid in self.volumeindex
+
+    def __len__(self):
+        return len(self.volumeindex)
+
+    def volume_counts(self, volid):
+        '''Returns a dict pairing words with counts for one volume.'''
+        shardnumber, row = self.volumeindex[volid]
+        shard = self._shard(shardnumber)
+        return _row_dict(shard, row)
+
+    def volume_totals(self, volid):
+        '''Returns (alphanum_tokens, totalcount) as recorded in filenames.txt.'''
+        shardnumber, row = self.volumeindex[volid]
+        shard = self._shard(shardnumber)
+        return int(shard['alphanum'][row]), int(shard['totals'][row])
+
+    def iter_volumes(self):
+        '''Yields (volid, dict of word counts) for every volume, reading each
+        shard once, in order.'''
+        for shardnumber in range(len(self.shardpaths)):
+            shard = self._shard(shardnumber)
+            for row, volid in enumerate(shard['volids']):
+                yield str(volid), _row_dict(shard, row)
+
+    def matrix(self, vocabulary = None, dense = False):
+        '''Returns (volids, vocabulary, matrix), where matrix has a row for each
+        volume and a column for each word. If a vocabulary (list of words) is
+        provided, only those columns are returned, in that order; otherwise the
+        vocabulary is every word in the store. The matrix is a scipy.sparse CSR
+        matrix unless dense is True, in which case it's a numpy array.'''
+
+        if vocabulary is None:
+            vocabulary = list()
+            wordids = dict()
+            for shardnumber in range(len(self.shardpaths)):
+                for word in self._shard(shardnumber)['vocabulary']:
+                    word = str(word)
+                    if word not in wordids:
+                        wordids[word] = len(vocabulary)
+                        vocabulary.append(word)
+        else:
+            vocabulary = list(vocabulary)
+            wordids = {word: idx for idx, word in enumerate(vocabulary)}
+
+        volids = list()
+        rowparts = list()
+        colparts = list()
+        countparts = list()
+        rowoffset = 0
+
+        for shardnumber in range(len(self.shardpaths)):
+            shard = self._shard(shardnumber)
+
+            # Translate this shard's word ids into columns of the whole matrix;
+            # words not in the vocabulary get -1 and are dropped.
+            translation = np.array([wordids.get(str(word), -1) for word in shard['vocabulary']], dtype = 'int64')
+
+            numrows = len(shard['volids'])
+            rows = np.repeat(np.arange(numrows, dtype = 'int64'), np.diff(shard['indptr']))
+            if len(translation) > 0:
+                columns = translation[shard['indices']]
+            else:
+                columns = np.zeros(0, dtype = 'int64')
+            keep = columns >= 0
+
+            rowparts.append(rows[keep] + rowoffset)
+            colparts.append(columns[keep])
+            countparts.append(shard['counts'][keep])
+            volids.extend([str(x) for x in shard['volids']])
+            rowoffset += numrows
+
+        if len(rowparts) > 0:
+            rows = np.concatenate(rowparts)
+            columns = np.concatenate(colparts)
+            counts = np.concatenate(countparts)
+        else:
+            rows = columns = counts = np.zeros(0, dtype = 'int64')
+
+        shape = (len(volids), len(vocabulary))
+
+        if dense:
+            matrix = np.zeros(shape, dtype = 'int64')
+            np.add.at(matrix, (rows, columns), counts)
+        else:
+            from scipy.sparse import csr_matrix
+            matrix = csr_matrix((counts, (rows, columns)), shape = shape)
+
+        return volids, vocabulary, matrix
+
+def _row_dict(shard, row):
+    start = shard['indptr'][row]
+    end = shard['indptr'][row + 1]
+    vocabulary = shard['vocabulary']
+    counts = shard['counts']
+    indices = shard['indices']
+    return {str(vocabulary[indices[i]]): int(counts[i]) for i in range(start, end)}
@@ -8,7 +8,7 @@
 # Written by Ted Underwood and Mike Black, Fall 2014
 
 import sys
-from requestpredict import PredictIndex
+from requestpredict import PredictIndex, PackedPredictions
 from FileCabinet import pairtreepath
 from argumentparser import simple_parse
 
@@ -39,14 +39,9 @@ def get_pages(filepath):
 
         return pagelist
 
-def matching_pages(htidList, targetgenres, argdict, threshold):
-    '''Fetches pages matching the specified genres in specified volumes.
-    The third argument to this function is an 'argument dictionary'
-    that transmits certain command-line options to be parsed
-    here if necessary.
-
-    Note that this function will only return volumes if the proportion
-    of pages matching targetgenres in the volume is > threshold.
+def prediction_paths(argdict):
+    '''Returns the prediction index and the root path for volumes,
+    allowing either to be overridden on the command line.
     '''
 
     # The default prediction index is:
@@ -57,20 +52,52 @@ def matching_pages(htidList, targetgenres, argdict, threshold):
         predictIndexFile = argdict["-index"]
 
     rootpath = '/projects/ichass/usesofscale/nonserials/'
-    # But we can override this with the "-index" option.
+    # But we can override this with the "-root" option.
     if "-root" in argdict:
         rootpath= argdict["-root"]
 
+    return predictIndexFile, rootpath
+
+def load_predictions(argdict):
+    '''Loads the prediction index named on the command line (or the default).
+    Reading the index is expensive, so callers should do this once per run and
+    pass the result to matching_pages or selected_volumes.
+    '''
+
+    predictIndexFile, rootpath = prediction_paths(argdict)
+
+    if predictIndexFile.endswith('.pack'):
+        # All the predictions packed in a single file by requestpredict.py -pack.
+        return PackedPredictions(predictIndexFile)
+
     predictions = PredictIndex()
     predictions.readFromDisk(predictIndexFile,verbose=False)
 
-    pull = dict()
+    return predictions
+
+def selected_volumes(htidList, targetgenres, argdict, threshold, predictions = None):
+    '''Checks the genre predictions for each volume in htidList, and returns
+    a list of (htid, listofgenres, fullpath) tuples for volumes where the
+    proportion of pages matching targetgenres is >= threshold.
+
+    This doesn't read any pages, so it's cheap; the tuples it returns can be
+    handed to read_volume, either here or in a worker process.
+
+    If no index of predictions is supplied, we load one.
+    '''
+
+    predictIndexFile, rootpath = prediction_paths(argdict)
+
+    if predictions is None:
+        predictions = load_predictions(argdict)
+
+    selected = list()
 
     for htid in htidList:
 
         htid = htid.rstrip()
 
-        listofgenres = predictions.getPredictions(htid)
+        listofgenres, genrecounts = predictions.getPageGenres(htid)
 
         # First we check whether there are enough matching pages to justify reading the volume.
 
@@ -79,9 +106,9 @@ def matching_pages(htidList, targetgenres, argdict, threshold):
             continue
 
         matched = 0
-        for genre in listofgenres:
+        for genre, count in genrecounts.items():
             if genre in targetgenres:
-                matched += 1
+                matched += count
 
         ratio = matched / len(listofgenres)
 
@@ -91,26 +118,100 @@ def matching_pages(htidList, targetgenres, argdict, threshold):
         firstpathpart, postfix = pairtreepath(htid,rootpath)
         fullpath = firstpathpart + postfix + '/' + postfix + ".norm.txt"
 
-        pagelist = get_pages(fullpath)
+        selected.append((htid, listofgenres, fullpath))
 
-        if len(pagelist) < 1:
-            print(htid + " not found.")
-            continue
+    return selected
 
-        if len(pagelist) != len(listofgenres):
-            print("Discrepancy in htid " + htid + " with " + str(len(pagelist)) + " pages but " + str(len(listofgenres)) + " predicted genres.")
-            continue
+def stream_pages(fileobject, wanted):
+    '''A generator that scans a volume for <pb> markers and yields a
+    (pagenumber, page) tuple for every page. Lines are only kept for
+    pages where wanted(pagenumber) is true; for other pages, page is None.
+    '''
+
+    pagenum = 0
+    keep = wanted(pagenum)
+    page = list()
+
+    for line in fileobject:
+        line = line.rstrip()
+        if line == "<pb>":
+            if keep:
+                yield pagenum, page
+            else:
+                yield pagenum, None
+            pagenum += 1
+            keep = wanted(pagenum)
+            page = list()
+        elif keep:
+            page.append(line)
+
+    if keep:
+        yield pagenum, page
+    else:
+        yield pagenum, None
+
+def read_volume(htid, listofgenres, fullpath, targetgenres):
+    '''Reads a volume and returns a dictionary pairing page numbers with
+    the pages (lists of lines) whose predicted genre is in targetgenres.
+    Returns None if the volume can't be found, or if its length doesn't
+    match the predictions.
+
+    We stream through the file, so only the matching pages are ever held
+    in memory.
+    '''
+
+    numgenres = len(listofgenres)
+
+    def wanted(pagenum):
+        return pagenum < numgenres and listofgenres[pagenum] in targetgenres
+
+    pagedict = dict()
+    pagecount = 0
+
+    try:
+        with open(fullpath, encoding="utf-8") as f:
+            for pagenum, page in stream_pages(f, wanted):
+                pagecount += 1
+                if page is not None:
+                    pagedict[pagenum] = page
+    except:
+        pagecount = 0
+
+    if pagecount < 1:
+        print(htid + " not found.")
+        return None
+
+    if pagecount != numgenres:
+        print("Discrepancy in htid " + htid + " with " + str(pagecount) + " pages but " + str(numgenres) + " predicted genres.")
+        return None
+
+    # We have now tested all the conditions that could cause us to abort this process.
+    # We discovered none of them.
+
+    return pagedict
+
+def matching_pages(htidList, targetgenres, argdict, threshold, predictions = None):
+    '''Fetches pages matching the specified genres in specified volumes.
+    The third argument to this function is an 'argument dictionary'
+    that transmits certain command-line options to be parsed
+    here if necessary.
+
+    Note that this function will only return volumes if the proportion
+    of pages matching targetgenres in the volume is > threshold.
+
+    The optional predictions argument is an index already loaded by
+    load_predictions. If it's omitted, the index is read from disk
+    on every call.
+    '''
+
+    pull = dict()
 
-        # We have now tested all the conditions that could cause us to abort this process.
-        # We discovered none of them. So proceed to filter the pages and add them to the
-        # result.
+    for htid, listofgenres, fullpath in selected_volumes(htidList, targetgenres, argdict, threshold, predictions):
 
-        pull[htid] = dict()
+        pagedict = read_volume(htid, listofgenres, fullpath, targetgenres)
 
-        for idx, page in enumerate(pagelist):
-            thisgenre = listofgenres[idx]
-            if thisgenre in targetgenres:
-                pull[htid][idx] = page
+        if pagedict is not None:
+            pull[htid] = pagedict
 
     return pull
 
@@ -13,11 +13,43 @@
 # text but only to identify it so that it can be given extra weight in
 # page classification.
 
+# Comparing lines is the expensive part, so lines_match uses cheap upper bounds
+# on the similarity ratio to rule out most pairs, and remembers the answer for
+# pairs it has already seen (a running header can repeat hundreds of times in a
+# volume). The window of previous pages to compare can be widened or narrowed.
+
 from difflib import SequenceMatcher
 
-def find_headers(pagelist, romannumerals):
+def lines_match(lineA, lineB, memo):
+	'''Returns True if SequenceMatcher would rate the similarity of lineA and
+	lineB above .8. Results are stored in memo, a dict keyed by pairs of lines.'''
+
+	pair = (lineA, lineB)
+	if pair in memo:
+		return memo[pair]
+
+	if lineA == lineB:
+		match = True
+	else:
+		lengths = len(lineA) + len(lineB)
+		# This is exactly SequenceMatcher's real_quick_ratio, computed without
+		# building the matcher.
+		if lengths < 1 or (2.0 * min(len(lineA), len(lineB))) / lengths <= .8:
+			match = False
+		else:
+			s = SequenceMatcher(None, lineA, lineB)
+			if s.quick_ratio() <= .8:
+				match = False
+			else:
+				match = s.ratio() > .8
+
+	memo[pair] = match
+	return match
+
+def find_headers(pagelist, romannumerals, window = 2):
 	'''Identifies repeated page headers and returns them as a list keyed to
-	original page locations.'''
+	original page locations. Lines are compared to lines on the previous
+	"window" pages.'''
 
 	# For very short documents, this is not a meaningful task.
 
@@ -85,21 +117,22 @@ def find_headers(pagelist, romannumerals):
 		newset = set()
 		repeated.append(newset)
 
+	memo = dict()
+
 	for index in range(2, len(firsttwos)):
 		# We can be sure the 2 index is legal because we have previously filtered
-		# short documents.
+		# short documents. Early pages are compared with as many previous pages
+		# as there are, so a wider window only adds comparisons.
 
 		indexedlines = firsttwos[index]
 
-		for j in range (index - 2, index):
+		for j in range (max(0, index - window), index):
 
 			previouslines = firsttwos[j]
 
 			for lineA in indexedlines:
 				for lineB in previouslines:
-					s = SequenceMatcher(None, lineA, lineB)
-					similarity = s.ratio()
-					if similarity > .8:
+					if lines_match(lineA, lineB, memo):
 						repeated[index].add(lineA)
 						repeated[j].add(lineB)
 
@@ -117,9 +150,10 @@ def find_headers(pagelist, romannumerals):
 
 	return listoftokenstreams
 
-def remove_headers(pagelist, romannumerals):
+def remove_headers(pagelist, romannumerals, window = 2):
 	'''Identifies repeated page headers and removes them from
-	the pages; then returns the edited pagelist.'''
+	the pages; then returns the edited pagelist. Lines are compared
+	to lines on the previous "window" pages.'''
 
 	# For very short documents, this is not a meaningful task.
 
@@ -185,24 +219,24 @@ def remove_headers(pagelist, romannumerals):
 		newset = set()
 		repeated.append(newset)
 
+	memo = dict()
+
 	for index in range(2, len(firsttwos)):
 		# We can be sure the 2 index is legal because we have previously filtered
-		# short documents.
+		# short documents. Early pages are compared with as many previous pages
+		# as there are, so a wider window only adds comparisons.
 
 		indexedlines = firsttwos[index]
 
-		for j in range (index - 2, index):
+		for j in range (max(0, index - window), index):
 
 			previouslines = firsttwos[j]
 
 			for lineA in indexedlines:
 				for lineB in previouslines:
-					s = SequenceMatcher(None, lineA[0], lineB[0])
-					# The zero indexes above are just selecting the string part
-					# of a string, index tuple.
-
-					similarity = s.ratio()
-					if similarity > .8:
+					if lines_match(lineA[0], lineB[0], memo):
+						# The zero indexes above are just selecting the string part
+						# of a string, index tuple.
 						repeated[index].add(lineA)
 						repeated[j].add(lineB)
 
@@ -3,12 +3,25 @@
 import os
 import sys
 import json
+import mmap
+import pickle
+import struct
 
 # HOWTO:
 # Create a PredictIndex object and either use buildFromDisk or readFromDisk to initialize the index
 # To pull the entire smoothedPrediction list for any htid, use getPredictions (returns list)
 # To pull just page numbers for a specific genre code, use getOnlyGenre (returns dict w/page numbers as key, values are empty lists)
 #
+# The index can also be saved in binary form with writeBinary. readFromDisk recognizes a file
+# ending in .pickle and loads it directly, which is much faster than parsing the text index.
+# To convert an existing text index: python3 requestpredict.py -pickle predictions.index predictions.pickle
+#
+# For large runs, the predictions themselves can be packed into a single file, so we don't have
+# to open and parse thousands of small JSON files. Build it from an index with
+#   python3 requestpredict.py -pack predictions.index predictions.pack
+# and then open it as PackedPredictions('predictions.pack'). Both classes support getPredictions
+# and getPageGenres (which returns the list of page genres along with a count of pages per genre).
+#
 # See name == main for example use
 
 class PredictIndex:
@@ -36,7 +49,26 @@ class PredictIndex:
         if verbose:
             print('Complete')
 
+    def writeBinary(self,target='predictions.pickle',verbose=False):
+        if verbose:
+            print('Writing binary predictions index to ' + target)
+        with open(target,mode='wb') as file:
+            pickle.dump(self._index, file, protocol=pickle.HIGHEST_PROTOCOL)
+        if verbose:
+            print('Complete')
+
+    def readBinary(self,sourceFile='predictions.pickle',verbose=False):
+        with open(sourceFile,mode='rb') as file:
+            self._index = pickle.load(file)
+
+        if verbose:
+            print('Loaded index with ' + str(len(self._index)) + ' predictions')
+
     def readFromDisk(self,sourceFile='predictions.index',verbose=False):
+        if sourceFile.endswith('.pickle'):
+            self.readBinary(sourceFile,verbose)
+            return
+
         if os.path.exists(sourceFile):
             with open(sourceFile,encoding='utf-8') as file:
                 lines = file.readlines()
@@ -75,6 +107,16 @@ class PredictIndex:
                 print("Unable to read, or more likely parse, genre predictions for " + htid)
                 return []
 
+    def getPageGenres(self,htid):
+        listofgenres = self.getPredictions(htid)
+        genrecounts = dict()
+        for genre in listofgenres:
+            if genre in genrecounts:
+                genrecounts[genre] += 1
+            else:
+                genrecounts[genre] = 1
+        return listofgenres, genrecounts
+
     def getOnlyGenre(self,htid,genre):
         pages = dict()
         with open(self._index[htid],encoding='utf-8') as file:
@@ -84,9 +126,143 @@ class PredictIndex:
                 pages[idx] = list()
         return pages
 
+class PackedPredictions:
+    '''All the smoothed predictions from a PredictIndex, packed into one file.
+
+    The file begins with PACKMAGIC and the length of a JSON header. The header lists
+    the genre codes, and maps each htid to the offset and length of its pages
+    plus the number of pages in each genre. The rest of the file is one byte per page,
+    giving the genre as an index into the list of codes. We memory-map that part,
+    so the pages themselves are only read when asked for. The header, though, holds
+    an entry for every volume, and is parsed in full when the file is opened, so
+    opening takes time and memory in proportion to the number of volumes.
+    '''
+
+    PACKMAGIC = b'GENREPACK1'
+
+    def __init__(self,sourceFile='predictions.pack',verbose=False):
+        self._file = open(sourceFile,mode='rb')
+        magic = self._file.read(len(self.PACKMAGIC))
+        if magic != self.PACKMAGIC:
+            raise ValueError(sourceFile + ' is not a packed predictions file.')
+        headerlength = struct.unpack('<Q', self._file.read(8))[0]
+        header = json.loads(self._file.read(headerlength).decode('utf-8'))
+        self._genres = header['genres']
+        self._volumes = header['volumes']
+        self._datastart = len(self.PACKMAGIC) + 8 + headerlength
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if verbose:
+            print('Loaded packed predictions for ' + str(len(self._volumes)) + ' volumes')
+
+    @classmethod
+    def build(cls,predictindex,target='predictions.pack',verbose=False):
+        '''Reads every prediction file listed in a PredictIndex and writes them
+        to target as a single packed file.'''
+
+        genres = list()
+        genrecodes = dict()
+        volumes = dict()
+        offset = 0
+
+        with open(target + '.data',mode='wb') as datafile:
+            for htid in sorted(predictindex._index):
+                listofgenres = predictindex.getPredictions(htid)
+                if len(listofgenres) < 1:
+                    continue
+
+                codes = bytearray()
+                counts = [0] * len(genres)
+                for genre in listofgenres:
+                    if genre not in genrecodes:
+                        if len(genres) > 255:
+                            raise ValueError('Too many genre codes to pack in one byte.')
+                        genrecodes[genre] = len(genres)
+                        genres.append(genre)
+                        counts.append(0)
+                    code = genrecodes[genre]
+                    codes.append(code)
+                    counts[code] += 1
+
+                datafile.write(codes)
+                volumes[htid] = [offset, len(codes), counts]
+                offset += len(codes)
+
+        header = json.dumps({'genres': genres, 'volumes': volumes}).encode('utf-8')
+
+        with open(target,mode='wb') as packfile:
+            packfile.write(cls.PACKMAGIC)
+            packfile.write(struct.pack('<Q', len(header)))
+            packfile.write(header)
+            with open(target + '.data',mode='rb') as datafile:
+                while True:
+                    chunk = datafile.read(1 << 20)
+                    if not chunk:
+                        break
+                    packfile.write(chunk)
+
+        os.remove(target + '.data')
+
+        if verbose:
+            print('Packed predictions for ' + str(len(volumes)) + ' volumes into ' + target)
+
+    def getCodes(self,htid):
+        '''Returns the genre codes for each page as bytes; look them up in genres().'''
+        if htid not in self._volumes:
+            return b''
+        offset, length, counts = self._volumes[htid]
+        start = self._datastart + offset
+        return self._data[start : start + length]
+
+    def genres(self):
+        return list(self._genres)
+
+    def getPredictions(self,htid):
+        return [self._genres[code] for code in self.getCodes(htid)]
+
+    def getPageGenres(self,htid):
+        if htid not in self._volumes:
+            return [], dict()
+        offset, length, counts = self._volumes[htid]
+        genrecounts = dict()
+        for code, count in enumerate(counts):
+            if count > 0:
+                genrecounts[self._genres[code]] = count
+        return self.getPredictions(htid), genrecounts
+
+    def getRatios(self,htid):
+        '''Returns a dict pairing each genre with the proportion of pages in that genre.'''
+        if htid not in self._volumes:
+            return dict()
+        offset, length, counts = self._volumes[htid]
+        ratios = dict()
+        for code, count in enumerate(counts):
+            if count > 0:
+                ratios[self._genres[code]] = count / length
+        return ratios
+
+    def getOnlyGenre(self,htid,genre):
+        pages = dict()
+        for idx,code in enumerate(self.getPredictions(htid)):
+            if code == genre:
+                pages[idx] = list()
+        return pages
+
 if __name__ == '__main__':
     args = sys.argv
     debug = True
+    if len(args) == 4 and args[1] == '-pickle':
+        index = PredictIndex()
+        index.readFromDisk(args[2],verbose=debug)
+        index.writeBinary(args[3],verbose=debug)
+        quit()
+
+    if len(args) == 4 and args[1] == '-pack':
+        index = PredictIndex()
+        index.readFromDisk(args[2],verbose=debug)
+        PackedPredictions.build(index,args[3],verbose=debug)
+        quit()
+
     if len(args) < 2:
         print('Running in diagnostic mode')
         htids = 'sampleset.txt'
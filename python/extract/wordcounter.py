@@ -252,11 +252,41 @@ def all_nonalphanumeric(astring):
             break
     return nonalphanum
 
-def count_word(aword, countdict, targetwords):
+class TargetSpec:
+    ''' The words and phrases that count_tokens should count, prepared once per run
+    so that checking a token doesn't depend on the length of the wordlist.
+
+    Words are held in a frozenset, which also includes each phrase as a space-separated
+    string (since that's how a fused phrase gets counted). Two-word phrases are held in a
+    dict that pairs each first word with a frozenset of the second words that can follow it.
+    If no words or phrases are provided, countall is True and every token gets counted.
+    '''
+
+    def __init__(self, targetwords = [], targetphrases = []):
+        words = set(targetwords)
+        phrases = dict()
+
+        for aphrase in targetphrases:
+            aphrase = tuple(aphrase)
+            words.add(" ".join(aphrase))
+            if len(aphrase) == 2:
+                if aphrase[0] in phrases:
+                    phrases[aphrase[0]].add(aphrase[1])
+                else:
+                    phrases[aphrase[0]] = {aphrase[1]}
+
+        self.words = frozenset(words)
+        self.phrases = {first: frozenset(seconds) for first, seconds in phrases.items()}
+        self.countall = len(self.words) < 1
+
+    def is_phrase(self, firstword, secondword):
+        return firstword in self.phrases and secondword in self.phrases[firstword]
+
+def count_word(aword, countdict, targetspec):
     countthis = False
-    if len(targetwords) < 1:
+    if targetspec.countall:
         countthis = True
-    elif aword in targetwords:
+    elif aword in targetspec.words:
         countthis = True
 
     if countthis:
@@ -267,7 +297,7 @@ def count_word(aword, countdict, targetwords):
 
     return countthis
 
-def count_tokens(tokens, targetwords = [], targetphrases = [], verbose = False):
+def count_tokens(tokens, targetwords = [], targetphrases = [], verbose = False, targetspec = None):
     ''' This function is originally designed to count words in a stream that has already passed
     through normalization by the MultiNormalizeOCR module and tokenization by the function as_stream,
     in this module. But it can be applied to token streams from other sources, as long as the stream
@@ -283,7 +313,8 @@ def count_tokens(tokens, targetwords = [], targetphrases = [], verbose = False):
     keys are words and values are counts. However, it's possible to pass in special lists if you
     want to count only certain words or phrases. If keyword arguments are provided for EITHER
     targetwords or targetphrases, then the function will count ONLY the words/phrases
-    in those lists.
+    in those lists. When counting many volumes, it's faster to build a TargetSpec from
+    those lists once and pass it in as targetspec.
 
     We lowercase all words and strip trailing apostrophe-s. We also convert numbers into collective
     features such as |romannumeral| or |arabic3digit|.
@@ -297,13 +328,12 @@ def count_tokens(tokens, targetwords = [], targetphrases = [], verbose = False):
     triplets = 0
     alphanum_tokens = 0
 
-    # The phrases in targetphrases are stored as tuples. But we also need them to be in the list
-    # of targetwords as space-separated strings. Otherwise they won't be recognized by count_word.
+    # The phrases in targetphrases are stored as tuples. But we also need them to be among
+    # the target words as space-separated strings. Otherwise they won't be recognized by
+    # count_word. TargetSpec takes care of that.
 
-    for aphrase in targetphrases:
-        stringversion = " ".join(aphrase)
-        if not stringversion in targetwords:
-            targetwords.append(stringversion)
+    if targetspec is None:
+        targetspec = TargetSpec(targetwords, targetphrases)
 
     counts = dict()
 
@@ -330,7 +360,7 @@ def count_tokens(tokens, targetwords = [], targetphrases = [], verbose = False):
             continue
 
         if all_nonalphanumeric(thisword):
-            count_word(thisword, counts, targetwords)
+            count_word(thisword, counts, targetspec)
             continue
 
         # This is an alphanumeric token: a word or number, not punctuation.
@@ -352,7 +382,7 @@ def count_tokens(tokens, targetwords = [], targetphrases = [], verbose = False):
             aprefix, afterword, asuffix = strip_punctuation(afterword)
             possiblehyphenate = thisword + "-" + afterword
             if possiblehyphenate in lexicon:
-                count_word(possiblehyphenate, counts, targetwords)
+                count_word(possiblehyphenate, counts, targetspec)
                 skipflag = 2
                 triplets += 1
 
@@ -368,13 +398,13 @@ def count_tokens(tokens, targetwords = [], targetphrases = [], verbose = False):
             # We want to permit searching for numbers as part of phrases, so we need to check now
             # whether e.g. ("|arabic2digit|", "pounds") is in targetphrases
 
-            if (arabic, nextword) in targetphrases:
+            if targetspec.is_phrase(arabic, nextword):
                 fused = arabic + " " + nextword
-                count_word(fused, counts, targetwords)
+                count_word(fused, counts, targetspec)
                 skipflag = 1
                 wordsfused += 1
             else:
-                count_word(arabic, counts, targetwords)
+                count_word(arabic, counts, targetspec)
 
             continue
 
@@ -401,36 +431,36 @@ def count_tokens(tokens, targetwords = [], targetphrases = [], verbose = False):
         # We record punctuation in the word counts
 
         if len(thisprefix) > 0:
-            count_word(thisprefix, counts, targetwords)
+            count_word(thisprefix, counts, targetspec)
 
         if len(thissuffix) > 0:
-            count_word(thissuffix, counts, targetwords)
+            count_word(thissuffix, counts, targetspec)
 
         # Also possessives, which might be meaningful features.
 
         if thispossessive:
-            count_word("|'s|", counts, targetwords)
+            count_word("|'s|", counts, targetspec)
 
         # In principle we should do that for nextword as well, in cases of fusion. But that's
         # going to be a rare occurrences, and we're talking about very common features here, so
         # it's an edge case perhaps better ignored.
 
         if thisword in romannumerals:
-            count_word("|romannumeral|", counts, targetwords)
+            count_word("|romannumeral|", counts, targetspec)
             continue
 
         # Is this part of a phrase that needs fusing?
 
-        if (thisword, nextword) in targetphrases:
+        if targetspec.is_phrase(thisword, nextword):
             newtoken = thisword + " " + nextword
-            count_word(newtoken, counts, targetwords)
+            count_word(newtoken, counts, targetspec)
             wordsfused += 1
             skipflag = 1
             continue
 
         if (thisword, nextword) in fuserules:
             newtoken = fuserules[(thisword,nextword)]
-            count_word(newtoken, counts, targetwords)
+            count_word(newtoken, counts, targetspec)
             wordsfused += 1
             skipflag = 1
             continue
@@ -444,7 +474,7 @@ def count_tokens(tokens, targetwords = [], targetphrases = [], verbose = False):
 
             wordparts = newtoken.split(" ")
             for aword in wordparts:
-                count_word(aword, counts, targetwords)
+                count_word(aword, counts, targetspec)
             continue
 
         if "-" in thisword:
@@ -452,24 +482,190 @@ def count_tokens(tokens, targetwords = [], targetphrases = [], verbose = False):
             # Note that the corrected forms in hyphenrules and fuserules get added to the lexicon.
 
             if thisword in lexicon:
-                count_word(thisword, counts, targetwords)
+                count_word(thisword, counts, targetspec)
             else:
                 wordparts = thisword.split("-")
                 for aword in wordparts:
-                    count_word(aword, counts, targetwords)
+                    count_word(aword, counts, targetspec)
             continue
 
         # We've tested all the fancy stuff, and it wasn't needed, so just do the basic.
-        count_word(thisword, counts, targetwords)
+        count_word(thisword, counts, targetspec)
 
 
     return counts, wordsfused, triplets, alphanum_tokens
 
+def classify_token(token):
+    ''' Does all the per-token work of count_tokens in a single pass and returns it
+    as a tuple, so that count_tokens_fast can do it once for each distinct token
+    in a volume rather than once for every occurrence. The fields are:
+
+    nonalphanumeric    True if the (original-case) token has no letters or digits
+    arabic             the collective number feature, or "none"
+    prefix, suffix     punctuation stripped from the lowercased token
+    core               what remains, before removal of apostrophe-s
+    word               what remains, after removal of apostrophe-s
+    possessive         True if apostrophe-s was removed
+    asnext             the form this token takes when it's the *next* word
+                       in a possible phrase
+
+    We call the same helper functions as count_tokens, rather than regexes, because
+    regex character classes don't agree exactly with str.isalpha() and str.isdigit().
+    '''
+
+    nonalphanumeric = all_nonalphanumeric(token)
+    lowered = token.lower()
+    arabic = arabic_digits(lowered)
+
+    prefix, core, suffix = strip_punctuation(lowered)
+    if core.endswith("'s") and len(core) > 4:
+        possessive = True
+        word = core[0:-2]
+    else:
+        possessive = False
+        word = core
+
+    asnext = lowered
+    if not all_nonalphanumeric(asnext):
+        asnext = strip_punctuation(asnext)[1]
+    if asnext.endswith("'s") and len(asnext) > 4:
+        asnext = asnext[0:-2]
+
+    return (nonalphanumeric, arabic, prefix, core, suffix, word, possessive, asnext)
+
+def count_tokens_fast(tokens, targetwords = [], targetphrases = [], verbose = False, targetspec = None):
+    ''' Returns exactly the same results as count_tokens, but classifies each distinct
+    token only once per volume (using classify_token) and caches the result. Since
+    a few thousand word types account for most of the tokens in a volume, this
+    removes most of the character-by-character work. The arguments are the same
+    as for count_tokens.
+    '''
+
+    global lexicon, hyphenrules, fuserules, romannumerals
+
+    if targetspec is None:
+        targetspec = TargetSpec(targetwords, targetphrases)
+
+    streamlen = len(tokens)
+    skipflag = 0
+    wordsfused = 0
+    triplets = 0
+    alphanum_tokens = 0
+
+    counts = dict()
+    classified = dict()
+    eofile = classify_token("#EOFile")
+
+    for i in range(0, streamlen):
+
+        thisword = tokens[i]
+
+        if len(thisword) < 1 or len(thisword) > 30:
+            continue
+
+        if (thisword.startswith('<') and thisword.endswith('>')) or thisword == '\n':
+            continue
+
+        if skipflag > 0:
+            skipflag = skipflag - 1
+            continue
 
+        if thisword in classified:
+            thisclass = classified[thisword]
+        else:
+            thisclass = classify_token(thisword)
+            classified[thisword] = thisclass
 
+        nonalphanumeric, arabic, thisprefix, thiscore, thissuffix, thisword, thispossessive, asnext = thisclass
 
+        if nonalphanumeric:
+            count_word(tokens[i], counts, targetspec)
+            continue
 
+        alphanum_tokens += 1
 
+        if i < (streamlen - 1):
+            nexttoken = tokens[i + 1]
+            if nexttoken in classified:
+                nextclass = classified[nexttoken]
+            else:
+                nextclass = classify_token(nexttoken)
+                classified[nexttoken] = nextclass
+        else:
+            nexttoken = "#EOFile"
+            nextclass = eofile
 
+        nextlower = nexttoken.lower()
 
+        if (nextlower == "-" or nextlower == "—") and i < (streamlen - 2):
+            aftertoken = tokens[i + 2]
+            if aftertoken in classified:
+                afterclass = classified[aftertoken]
+            else:
+                afterclass = classify_token(aftertoken)
+                classified[aftertoken] = afterclass
+            possiblehyphenate = tokens[i].lower() + "-" + afterclass[3]
+            if possiblehyphenate in lexicon:
+                count_word(possiblehyphenate, counts, targetspec)
+                skipflag = 2
+                triplets += 1
 
+        if arabic != "none":
+            if targetspec.is_phrase(arabic, nextlower):
+                fused = arabic + " " + nextlower
+                count_word(fused, counts, targetspec)
+                skipflag = 1
+                wordsfused += 1
+            else:
+                count_word(arabic, counts, targetspec)
+
+            continue
+
+        nextword = nextclass[7]
+
+        if len(thisprefix) > 0:
+            count_word(thisprefix, counts, targetspec)
+
+        if len(thissuffix) > 0:
+            count_word(thissuffix, counts, targetspec)
+
+        if thispossessive:
+            count_word("|'s|", counts, targetspec)
+
+        if thisword in romannumerals:
+            count_word("|romannumeral|", counts, targetspec)
+            continue
+
+        if targetspec.is_phrase(thisword, nextword):
+            newtoken = thisword + " " + nextword
+            count_word(newtoken, counts, targetspec)
+            wordsfused += 1
+            skipflag = 1
+            continue
+
+        if (thisword, nextword) in fuserules:
+            newtoken = fuserules[(thisword,nextword)]
+            count_word(newtoken, counts, targetspec)
+            wordsfused += 1
+            skipflag = 1
+            continue
+
+        if thisword in hyphenrules:
+            newtoken = hyphenrules[thisword]
+            wordparts = newtoken.split(" ")
+            for aword in wordparts:
+                count_word(aword, counts, targetspec)
+            continue
+
+        if "-" in thisword:
+            if thisword in lexicon:
+                count_word(thisword, counts, targetspec)
+            else:
+                wordparts = thisword.split("-")
+                for aword in wordparts:
+                    count_word(aword, counts, targetspec)
+            continue
+
+        count_word(thisword, counts, targetspec)
+
+    return counts, wordsfused, triplets, alphanum_tokens
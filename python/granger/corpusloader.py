@@ -0,0 +1,233 @@
+# corpusloader.py
+
+# Reads a folder of volume word-count files (word \t count on each line)
+# once, into a sparse matrix with a row for each volume and a column for
+# each distinct word. The modeling scripts used to read every file twice:
+# once to count document frequencies and choose a vocabulary, and again to
+# build features for that vocabulary. With the matrix in memory, both can
+# be done by slicing it.
+#
+# Parsing a few thousand volumes still takes a while, so the matrix is cached
+# on disk next to the source folder, and reused as long as neither the folder
+# nor any file in it has been modified since.
+#
+#   corpus = corpusloader.load_corpus(sourcefolder, '.poe.tsv')
+#   vocablist = corpus.top_words(3200, volids)
+#   counts = corpus.features(volids, vocablist)
+#   totals = corpus.totals(volids)
+
+import os
+import numpy as np
+
+CACHEVERSION = 1
+
+def initial_letter(word):
+    '''The usual rule for words that can be in the vocabulary.'''
+    return len(word) > 0 and word[0].isalpha()
+
+def longer_than_one(word):
+    '''The rule used in some scripts, which also drops one-letter words.'''
+    return len(word) > 1 and word[0].isalpha()
+
+class VolumeMatrix:
+    '''Word counts for a set of volumes, in CSR form. Within each row, words
+    are kept in the order they appear in the file, so we can break ties in
+    document frequency the same way Counter.most_common did.
+    '''
+
+    def __init__(self, volids, vocabulary, indptr, indices, counts):
+        self.volids = [str(x) for x in volids]
+        self.vocabulary = [str(x) for x in vocabulary]
+        self.indptr = np.asarray(indptr, dtype = 'int64')
+        self.indices = np.asarray(indices, dtype = 'int64')
+        self.counts = np.asarray(counts, dtype = 'int64')
+        self.rowindex = {volid: idx for idx, volid in enumerate(self.volids)}
+        self.wordindex = {word: idx for idx, word in enumerate(self.vocabulary)}
+
+        cumulative = np.concatenate([[0], np.cumsum(self.counts)])
+        self.rowtotals = cumulative[self.indptr[1 : ]] - cumulative[self.indptr[ : -1]]
+
+    def __contains__(self, volid):
+        return volid in self.rowindex
+
+    def __len__(self):
+        return len(self.volids)
+
+    def _entries(self, volids):
+        '''Returns (rowpositions, indices, counts) for the nonzero entries in the
+        rows for volids, in that order; rowpositions count from 0 within volids.
+        '''
+        rows = np.array([self.rowindex[volid] for volid in volids], dtype = 'int64')
+        starts = self.indptr[rows]
+        lengths = self.indptr[rows + 1] - starts
+        if lengths.sum() < 1:
+            empty = np.zeros(0, dtype = 'int64')
+            return empty, empty, empty
+
+        positions = np.repeat(np.arange(len(rows)), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        entries = np.repeat(starts, lengths) + offsets
+        return positions, self.indices[entries], self.counts[entries]
+
+    def allowed(self, wordfilter):
+        '''A boolean array, True for words that pass wordfilter.'''
+        return np.array([wordfilter(word) for word in self.vocabulary], dtype = bool)
+
+    def top_words(self, k, volids = None, wordfilter = initial_letter):
+        '''The k words that occur in the most volumes, among the volumes in volids
+        (all volumes by default). Ties are broken by first appearance, so this
+        matches Counter.most_common(k) over the same volumes read in the same order.
+        '''
+        if volids is None:
+            volids = self.volids
+        positions, indices, counts = self._entries(volids)
+
+        docfreq = np.bincount(indices, minlength = len(self.vocabulary))
+        firstseen = np.full(len(self.vocabulary), len(indices), dtype = 'int64')
+        present, firstpositions = np.unique(indices, return_index = True)
+        firstseen[present] = firstpositions
+
+        candidates = np.flatnonzero((docfreq > 0) & self.allowed(wordfilter))
+        order = np.lexsort((firstseen[candidates], -docfreq[candidates]))
+        return [self.vocabulary[x] for x in candidates[order[0 : k]]]
+
+    def features(self, volids, vocablist):
+        '''A dense array of counts, with a row for each volume in volids and
+        a column for each word in vocablist.
+        '''
+        columns = np.full(len(self.vocabulary), -1, dtype = 'int64')
+        for idx, word in enumerate(vocablist):
+            if word in self.wordindex:
+                columns[self.wordindex[word]] = idx
+
+        positions, indices, counts = self._entries(volids)
+        wordcolumns = columns[indices]
+        keep = wordcolumns >= 0
+
+        matrix = np.zeros((len(volids), len(vocablist)))
+        matrix[positions[keep], wordcolumns[keep]] = counts[keep]
+        return matrix
+
+    def sparse_features(self, volids, vocablist):
+        '''Like features, but returns a scipy.sparse CSR matrix, for
+        vocabularies too large to hold densely.
+        '''
+        from scipy.sparse import csr_matrix
+
+        columns = np.full(len(self.vocabulary), -1, dtype = 'int64')
+        for idx, word in enumerate(vocablist):
+            if word in self.wordindex:
+                columns[self.wordindex[word]] = idx
+
+        positions, indices, counts = self._entries(volids)
+        wordcolumns = columns[indices]
+        keep = wordcolumns >= 0
+
+        return csr_matrix((counts[keep], (positions[keep], wordcolumns[keep])), shape = (len(volids), len(vocablist)))
+
+    def totals(self, volids, wordfilter = None):
+        '''The total count of words in each volume; if a wordfilter (or a set
+        of words) is given, only words that pass it are counted.
+        '''
+        if wordfilter is None:
+            return self.rowtotals[np.array([self.rowindex[volid] for volid in volids], dtype = 'int64')]
+
+        if isinstance(wordfilter, (set, frozenset, dict, list)):
+            wordset = set(wordfilter)
+            allowed = np.array([word in wordset for word in self.vocabulary], dtype = bool)
+        else:
+            allowed = self.allowed(wordfilter)
+
+        positions, indices, counts = self._entries(volids)
+        keep = allowed[indices]
+        return np.bincount(positions[keep], weights = counts[keep], minlength = len(volids)).astype('int64')
+
+    def volume_counts(self, volid):
+        '''A dict pairing words with counts for one volume.'''
+        row = self.rowindex[volid]
+        start = self.indptr[row]
+        end = self.indptr[row + 1]
+        return {self.vocabulary[self.indices[i]]: int(self.counts[i]) for i in range(start, end)}
+
+def read_folder(sourcefolder, extension):
+    '''Parses every file in sourcefolder ending with extension.'''
+
+    filenames = sorted([x for x in os.listdir(sourcefolder) if x.endswith(extension)])
+
+    volids = list()
+    vocabulary = dict()
+    indptr = [0]
+    indices = list()
+    counts = list()
+
+    for filename in filenames:
+        volids.append(filename.replace(extension, ""))
+        with open(os.path.join(sourcefolder, filename), encoding = 'utf-8') as f:
+            for line in f:
+                fields = line.strip().split('\t')
+                if len(fields) > 2 or len(fields) < 2:
+                    continue
+
+                word = fields[0]
+                if word in vocabulary:
+                    wordid = vocabulary[word]
+                else:
+                    wordid = len(vocabulary)
+                    vocabulary[word] = wordid
+                indices.append(wordid)
+                counts.append(int(fields[1]))
+        indptr.append(len(indices))
+
+    vocablist = [''] * len(vocabulary)
+    for word, wordid in vocabulary.items():
+        vocablist[wordid] = word
+
+    return VolumeMatrix(volids, vocablist, indptr, indices, counts)
+
+def folder_key(sourcefolder, extension):
+    '''Changes whenever a file is added, removed or modified.'''
+    filenames = [x for x in os.listdir(sourcefolder) if x.endswith(extension)]
+    newest = 0
+    for filename in filenames:
+        newest = max(newest, os.stat(os.path.join(sourcefolder, filename)).st_mtime_ns)
+    return np.array([CACHEVERSION, os.stat(sourcefolder).st_mtime_ns, newest, len(filenames)], dtype = 'int64')
+
+def default_cachepath(sourcefolder, extension):
+    '''Beside the source folder, not inside it, since writing there would
+    change the folder's mtime.'''
+    sourcefolder = os.path.abspath(sourcefolder)
+    parent, foldername = os.path.split(sourcefolder)
+    return os.path.join(parent, foldername + extension + '.cache.npz')
+
+def load_corpus(sourcefolder, extension, cachepath = None, usecache = True):
+    '''Returns a VolumeMatrix for every file in sourcefolder ending with
+    extension, from the cache if it's still valid.
+    '''
+    if cachepath is None:
+        cachepath = default_cachepath(sourcefolder, extension)
+
+    key = folder_key(sourcefolder, extension)
+
+    if usecache and os.path.isfile(cachepath):
+        with np.load(cachepath) as cache:
+            if np.array_equal(cache['key'], key):
+                print('Reading cached corpus from ' + cachepath)
+                return VolumeMatrix(cache['volids'], cache['vocabulary'], cache['indptr'], cache['indices'], cache['counts'])
+
+    corpus = read_folder(sourcefolder, extension)
+
+    if usecache:
+        # Write to a temporary name and then rename, so an interrupted
+        # run never leaves a truncated cache.
+        temppath = cachepath + '.part'
+        with open(temppath, mode = 'wb') as f:
+            np.savez(f,
+                key = key,
+                volids = np.array(corpus.volids, dtype = str),
+                vocabulary = np.array(corpus.vocabulary, dtype = str),
+                indptr = corpus.indptr,
+                indices = corpus.indices.astype('int32'),
+                counts = corpus.counts)
+        os.rename(temppath, cachepath)
+
+    return corpus
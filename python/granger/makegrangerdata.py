@@ -1,6 +1,7 @@
 import numpy as np
 import csv, os, random
-from collections import Counter
+
+import corpusloader
 
 def dirty_pairtree(htid):
     period = htid.find('.')
@@ -79,23 +80,14 @@ for filename in allthefiles:
 
 classdict, datedict = get_classvector(classpath, volumeIDs)
 
-# make a vocabulary list and a volsize dict
-wordcounts = Counter()
-volsizes = Counter()
+# Every volume is parsed once (or read from a cache) into a sparse matrix;
+# the vocabulary and the counts below are both taken from that.
+corpus = corpusloader.load_corpus(sourcefolder, extension)
+volsizes = dict(zip(volumeIDs, corpus.totals(volumeIDs, corpusloader.longer_than_one)))
 datebins = [1840,1845,1850,1855,1860,1865,1870,1875,1880,1885,1890,1895,1900,1905,1910,1915,1920]
 # datebins = [1840,1850,1860,1870,1880,1890,1900,1910,1920]
 NUMBINS = len(datebins)
 
-for volid, volpath in zip(volumeIDs, volumepaths):
-    with open(volpath, encoding = 'utf-8') as f:
-        for line in f:
-            fields = line.strip().split('\t')
-            word = fields[0]
-            if len(word) > 1 and word[0].isalpha():
-                count = int(fields[1])
-                wordcounts[word] += 1
-                volsizes[volid] += count
-
 etymo = set()
 with open('/Users/tunder/Dropbox/PythonScripts/mine/metadata/ReMergedEtymologies.txt', encoding = 'utf-8') as f:
     for line in f:
@@ -104,7 +96,7 @@ with open('/Users/tunder/Dropbox/PythonScripts/mine/metadata/ReMergedEtymologies
         if date > 800 and date < 1150:
             etymo.add(fields[0])
 
-vocablist = [x[0] for x in wordcounts.most_common(VOCABSIZE)]
+vocablist = corpus.top_words(VOCABSIZE, volumeIDs, corpusloader.longer_than_one)
 VOCABSIZE = len(vocablist)
 vocabset = set(vocablist)
 vocabmapper = dict()
@@ -135,17 +127,11 @@ for volid in volumeIDs:
             binsizesforcategory[category][idx] += volsizes[volid]
             break
 
-for volid, volpath in zip(volumeIDs, volumepaths):
-    with open(volpath, encoding = 'utf-8') as f:
-        for line in f:
-            fields = line.strip().split('\t')
-            word = fields[0]
-            if word in vocabset:
-                count = int(fields[1])
-                dateidx = datemapper[volid]
-                category = classdict[volid]
-                vocabidx = vocabmapper[word]
-                binsforcategory[category][dateidx][vocabidx] += count
+counts = corpus.features(volumeIDs, vocablist)
+for rowidx, volid in enumerate(volumeIDs):
+    dateidx = datemapper[volid]
+    category = classdict[volid]
+    binsforcategory[category][dateidx] += counts[rowidx]
 
 # Normalize counts to relative frequencies.
 for category in [0, 1]:
@@ -1,5 +1,7 @@
 # make_word_year_matrix.py
 import glob
+import numpy as np
+from wordtopicyear import WordTopicYear
 
 def get_one_file (filepath):
     filepath = filepath.replace('~', '/Users/tunderwood')
@@ -57,14 +59,40 @@ for line in filelines[1:]:
     fields = line.split(',')
     transrules[fields[0]] = fields[1]
     
+# Words are given integer ids as they're first seen, and every word in a
+# wordcounts file is mapped to its id once (or to -1 if it's on the stoplist),
+# so the stoplist and translation rules aren't consulted for every line.
+# Counts are collected as arrays of (word id, year, count) and summed by
+# wordtopicyear, treating the whole corpus as a single topic.
+
+vocabulary = dict()
+wordids = dict()
+
+def word_id(word):
+    global vocabulary, wordids, stoplist, transrules
+    if word in stoplist:
+        wordid = -1
+    else:
+        translated = word
+        if word in transrules:
+            translated = transrules[word]
+        if translated not in vocabulary:
+            vocabulary[translated] = len(vocabulary)
+        wordid = vocabulary[translated]
+
+    wordids[word] = wordid
+    return wordid
+
 def get_one_folder (dirpath):
-    global docdates, stoplist, transrules
+    global docdates, wordids
     dirpath = dirpath.replace('~', '/Users/tunderwood')
     dirpath = dirpath + "/wordcounts/*.CSV"
     filelist = glob.glob(dirpath)
     print(len(filelist))
 
-    folder_dictionary = dict()
+    folderids = list()
+    folderyears = list()
+    foldercounts = list()
 
     for filepath in filelist:
         slashparts = filepath.split('/')
@@ -74,7 +102,7 @@ def get_one_folder (dirpath):
             date = docdates[fileid]
         else:
             continue
-    
+
         with open(filepath, encoding = 'utf-8') as file:
             filelines = file.readlines()
 
@@ -82,99 +110,72 @@ def get_one_folder (dirpath):
             line = line.rstrip()
             fields = line.split(',')
             word = fields[0]
-            if word in stoplist:
-                continue
-            if word in transrules:
-                word = transrules[word]
-            
-            count = int(fields[1])
-            if (word, date) in folder_dictionary:
-                folder_dictionary[(word, date)] += count
+            if word in wordids:
+                wordid = wordids[word]
             else:
-                folder_dictionary[(word, date)] = count
+                wordid = word_id(word)
+            if wordid < 0:
+                continue
 
-    return(folder_dictionary)
+            folderids.append(wordid)
+            folderyears.append(date)
+            foldercounts.append(int(fields[1]))
+
+    return(folderids, folderyears, foldercounts)
 
 directories = ["~/Journals/ELH-CI", "~/Journals/MLR/mlr1905-1970",
 "~/Journals/MLR/mlr1971-2013", "~/Journals/ModPhil", "~/Journals/NLH",
 "~/Journals/PMLA", "~/Journals/RES/RESto1980",
 "~/Journals/RES/RESfrom1981"]
 
-maindictionary = dict()
-
-minyear = 3000
-maxyear = 0
-
-totalfreqs = dict()
-yearlysums = dict()
+allids = list()
+allyears = list()
+allcounts = list()
 
 for adirectory in directories:
     print(adirectory)
-    records = get_one_folder(adirectory)
-    for key, value in records.items():
-        
-        if key in maindictionary:
-            maindictionary[key] += value
-        else:
-            maindictionary[key] = value
+    folderids, folderyears, foldercounts = get_one_folder(adirectory)
+    allids.extend(folderids)
+    allyears.extend(folderyears)
+    allcounts.extend(foldercounts)
 
-        word, year = key
-        if year < minyear:
-            minyear = year
-        if year > maxyear:
-            maxyear = year
+allyears = np.array(allyears, dtype = 'int64')
+tensor = WordTopicYear(allids, np.zeros(len(allids), dtype = 'int64'), allyears, allcounts)
 
-        if word in totalfreqs:
-            totalfreqs[word] += value
-        else:
-            totalfreqs[word] = value
-
-        if year in yearlysums:
-            yearlysums[year] += value
-        else:
-            yearlysums[year] = value
+words = [''] * len(vocabulary)
+for word, wordid in vocabulary.items():
+    words[wordid] = word
 
-listoftuples = list()
-for word, count in totalfreqs.items():
-    listoftuples.append((count,word))
+minyear = tensor.firstyear
+maxyear = tensor.firstyear + tensor.numyears - 1
 
-listoftuples = sorted(listoftuples, reverse = True)
+# The 100,000 commonest words, with ties broken by reverse alphabetical
+# order, as sorting (count, word) tuples in reverse used to do.
+totalfreqs = tensor.type_totals()
+alphabetical = np.empty(len(words), dtype = 'int64')
+alphabetical[sorted(range(len(words)), key = lambda x: words[x])] = np.arange(len(words))
+vocab = np.lexsort((-alphabetical, -totalfreqs))[0:100000]
 
-vocab = listoftuples[0:100000]
+wordbyyear = tensor.word_by_year(vocab)
 
 with open("/Users/tunderwood/Journals/tmhls/hls_wordcounts.tsv", mode = 'w', encoding = 'utf-8') as file:
     listofyears = [str(x) for x in range(minyear, (maxyear + 1))]
     yearrange = len(listofyears)
     header = "word\ttotal\t" + "\t".join(listofyears) + "\n"
     file.write(header)
-    for atuple in vocab:
-        total_count, word = atuple
-        listofyears = list()
-        for year in range(minyear, (maxyear + 1)):
-            if (word, year) in maindictionary:
-                count = maindictionary[(word, year)]
-            else:
-                count = 0
-                
-            listofyears.append(str(count))
+    for wordid, yearcounts in zip(vocab.tolist(), wordbyyear.tolist()):
+        assert(len(yearcounts) == yearrange)
 
-        assert(len(listofyears) == yearrange)
-
-        outline = word + '\t' + str(total_count) + '\t' + '\t'.join(listofyears) + '\n'
+        outline = words[wordid] + '\t' + str(totalfreqs[wordid]) + '\t' + '\t'.join([str(x) for x in yearcounts]) + '\n'
         file.write(outline)
 
-yearlyoutput = list()
-for year, count in yearlysums.items():
-    yearlyoutput.append((year,count))
-
-yearlyoutput = sorted(yearlyoutput)
+# Only years in which some volume had a counted word.
+yearlysums = tensor.year_totals()
+yearspresent = np.unique(allyears)
 
 with open("/Users/tunderwood/Journals/tmhls/hls_yearlycounts.tsv", mode = 'w', encoding = 'utf-8') as file:
     file.write('year\tsumtotal\n')
-    for atuple in yearlyoutput:
-        year, count = atuple
+    for year in yearspresent.tolist():
+        count = yearlysums[year - minyear]
         outline = str(year) + '\t' + str(count) + '\n'
         file.write(outline)
-        
-
-    
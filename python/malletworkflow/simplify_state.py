@@ -1,64 +1,408 @@
-import gzip
-import sys
+#!/usr/bin/env python3
 
-from collections import defaultdict
+# simplify_state.py
 
+# Originally written by Andrew Goldstone for Python 2; rewritten for Python 3
+# so that a large state can be reduced in one pass.
+#
 # Take a mallet state.gz file and produce a csv of doc-type-topic
-# counts. Output to stdout.
+# counts, and (from the same pass) the doc-topic counts matrix that
+# make_doc_topics used to build by re-reading that csv.
+#
+# USAGE: python3 simplify_state.py state.gz > state_tallied.csv
 #
-# USAGE: python simplify_state.py state.gz > state_tallied.csv
+#    or: python3 simplify_state.py state.gz --tallies state_tallied.csv.gz
+#            --doctopics document_topics.csv --ids id_file --workers 4 --pigz
 #
 # The mallet state is saved in a gz file with lots of redundant
 # information. For our purposes, we don't know the order of tokens in
 # documents, so we can "reduce" the state information to a list of
 # 4-tuples: doc,type,topic,count.
 #
-# We keep the zero-indexing of docs, types, and topics used by mallet, though 
+# We keep the zero-indexing of docs, types, and topics used by mallet, though
 # in R we will typically add 1 to each of these on import.
+#
+# Output formats follow the extension of each path. Tallies ending in .npz are
+# saved as integer arrays (doc, type, topic, count); otherwise they're written
+# as csv, gzipped if the path ends in .gz. Doc-topics ending in .npy are saved
+# as a matrix with a row for each doc; otherwise they're written as csv in the
+# format make_doc_topics has always produced.
+#
+# The state is read in chunks of a few megabytes, and each chunk is parsed
+# into integer arrays with numpy rather than line by line. Tallies are counted
+# by sorting, and written out as soon as each document is complete, so memory
+# use doesn't grow with the size of the state (unless tallies go to .npz).
+# Decompression can be handed to pigz, running alongside the parser, and
+# chunks can be parsed by a pool of workers.
+
+import gzip, shutil, subprocess, sys
+import argparse
+import numpy as np
+from multiprocessing import Pool
+
+CHUNKBYTES = 2 ** 24
+
+POWERSOFTEN = 10 ** np.arange(19, dtype = 'int64')
+
+def open_state(state_file, pigz = False):
+    ''' Returns the decompressed state as a binary stream, and the pigz
+    process producing it (or None).
+    '''
+    if not state_file.endswith('.gz'):
+        return open(state_file, mode = 'rb'), None
+
+    if pigz:
+        if shutil.which('pigz') is not None:
+            process = subprocess.Popen(['pigz', '-dc', state_file], stdout = subprocess.PIPE)
+            return process.stdout, process
+        else:
+            print('pigz not found; decompressing with gzip.', file = sys.stderr)
+
+    return gzip.open(state_file, mode = 'rb'), None
+
+def read_chunks(f, chunkbytes = CHUNKBYTES):
+    ''' Yields the state in chunks that each hold a whole number of lines.
+    Comment lines at the start of the state are yielded first, as one chunk
+    of their own.
+    '''
+    header = b''
+    remainder = b''
+    inheader = True
+
+    while True:
+        data = f.read(chunkbytes)
+        if len(data) < 1:
+            break
+
+        data = remainder + data
+        lastbreak = data.rfind(b'\n')
+        if lastbreak < 0:
+            remainder = data
+            continue
+
+        remainder = data[lastbreak + 1 : ]
+        data = data[ : lastbreak + 1]
+
+        while inheader and data.startswith(b'#'):
+            linebreak = data.find(b'\n') + 1
+            header += data[ : linebreak]
+            data = data[linebreak : ]
+
+        if inheader and len(data) > 0:
+            inheader = False
+            yield header
+
+        if len(data) > 0:
+            yield data
+
+    if inheader:
+        yield header + remainder
+    elif len(remainder.strip()) > 0:
+        yield remainder + b'\n'
+
+def read_header(header):
+    ''' Returns the list of alpha values in the state's header, which
+    has one for each topic.
+    '''
+    for line in header.decode('utf-8').splitlines():
+        if line.startswith('#alpha :'):
+            return [float(x) for x in line.split(':', 1)[1].split()]
+    return []
+
+def int_column(buf, starts, ends):
+    ''' Converts the digits in buf between each start and end into an integer.'''
+    width = int((ends - starts).max())
+    positions = ends[ : , np.newaxis] - 1 - np.arange(width)
+    digits = buf[positions].astype('int64') - 48
+    digits[positions < starts[ : , np.newaxis]] = 0
+    return digits.dot(POWERSOFTEN[ : width])
+
+def parse_lines(chunk):
+    ''' The slow way to parse a chunk: line by line.'''
+    docs = list()
+    types = list()
+    topics = list()
+
+    for line in chunk.splitlines():
+        fields = line.split()
+        if len(fields) < 6:
+            continue
+        # The type's string form is the only field that might contain spaces,
+        # so we count back from the end for the topic.
+        docs.append(int(fields[0]))
+        types.append(int(fields[3]))
+        topics.append(int(fields[-1]))
+
+    return np.array(docs, dtype = 'int64'), np.array(types, dtype = 'int64'), np.array(topics, dtype = 'int64')
+
+def parse_chunk(chunk):
+    ''' Returns arrays of doc, typeindex and topic for each line of a
+    chunk of the state: doc source pos typeindex type topic.
+    '''
+    buf = np.frombuffer(chunk, dtype = 'uint8')
+    separators = np.flatnonzero((buf == 32) | (buf == 10))
+    numlines = chunk.count(b'\n')
+
+    # Every line should have six fields. If any doesn't, or a field is
+    # empty, fall back on splitting lines.
+    if len(separators) != 6 * numlines or numlines < 1 or separators[-1] != len(buf) - 1:
+        return parse_lines(chunk)
+
+    ends = separators.reshape(-1, 6)
+    starts = np.empty_like(ends)
+    starts[ : , 1 : ] = ends[ : , : -1] + 1
+    starts[0, 0] = 0
+    starts[1 : , 0] = ends[ : -1, 5] + 1
+
+    columns = list()
+    for column in (0, 3, 5):
+        s = starts[ : , column]
+        e = ends[ : , column]
+        if np.any(e <= s):
+            return parse_lines(chunk)
+        columns.append(int_column(buf, s, e))
+
+    numeric = buf[np.concatenate([starts[ : , [0, 3, 5]].ravel(), ends[ : , [0, 3, 5]].ravel() - 1])]
+    if np.any(numeric < 48) or np.any(numeric > 57):
+        return parse_lines(chunk)
+
+    return tuple(columns)
+
+def tally(docs, types, topics, weights = None):
+    ''' Counts each distinct (doc, type, topic), and returns arrays of
+    doc, type, topic and count, sorted in that order.
+    '''
+    if len(docs) < 1:
+        empty = np.zeros(0, dtype = 'int64')
+        return empty, empty, empty, empty
+
+    firstdoc = docs.min()
+    numtypes = types.max() + 1
+    numtopics = topics.max() + 1
+    keys = ((docs - firstdoc) * numtypes + types) * numtopics + topics
 
-def process_file(state_file):
+    if weights is None:
+        keys, counts = np.unique(keys, return_counts = True)
+    else:
+        keys, inverse = np.unique(keys, return_inverse = True)
+        counts = np.bincount(inverse.ravel(), weights = weights, minlength = len(keys))
 
-    # utility function for printing our type-topic tallies as we go
-    def output_tally(doc,tally):
-        for typeindex in tally:
-            for topic in tally[typeindex]:
-                print "{},{},{},{}".format(doc,typeindex,topic,
-                        tally[typeindex][topic])
+    topics = keys % numtopics
+    keys = keys // numtopics
+    return keys // numtypes + firstdoc, keys % numtypes, topics, counts.astype('int64')
 
-    with gzip.open(state_file, 'rb') as f:
-        doc_tally = defaultdict(lambda : defaultdict(int))
-        last_doc = 0    # assume we start at doc 0
+def tally_chunk(chunk):
+    return tally(*parse_chunk(chunk))
 
+def tally_state(state_file, workers = 1, pigz = False, chunkbytes = CHUNKBYTES):
+    ''' Yields the header's alpha values, and then blocks of tallies (doc,
+    type, topic and count arrays) in order of doc. Each document's
+    tallies are all in one block.
+    '''
+    f, process = open_state(state_file, pigz)
+    chunks = read_chunks(f, chunkbytes)
+
+    yield read_header(next(chunks, b''))
+
+    if workers > 1:
+        pool = Pool(processes = workers)
+        blocks = pool.imap(tally_chunk, chunks)
+    else:
+        pool = None
+        blocks = map(tally_chunk, chunks)
+
+    # We can assume that the state is written out doc-by-doc, but a doc
+    # can be split between chunks. So the tallies for the last doc in each
+    # block are held back, and combined with the next block's if it
+    # continues the same doc.
+    pending = None
+
+    for block in blocks:
+        if len(block[0]) < 1:
+            continue
+
+        if pending is not None:
+            if block[0][0] == pending[0][-1]:
+                samedoc = np.searchsorted(block[0], block[0][0], side = 'right')
+                head = [np.concatenate([x, y[ : samedoc]]) for x, y in zip(pending, block)]
+                head = tally(head[0], head[1], head[2], weights = head[3])
+                block = tuple([np.concatenate([x, y[samedoc : ]]) for x, y in zip(head, block)])
+            else:
+                yield pending
+
+        lastdoc = np.searchsorted(block[0], block[0][-1], side = 'left')
+        if lastdoc > 0:
+            yield tuple([x[ : lastdoc] for x in block])
+        pending = tuple([x[lastdoc : ] for x in block])
+
+    if pending is not None:
+        yield pending
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+
+    f.close()
+    if process is not None:
+        process.wait()
+
+def open_output(path):
+    ''' A text file, gzipped if the path ends in .gz, or stdout for "-".'''
+    if path == '-':
+        return sys.stdout
+    elif path.endswith('.gz'):
+        # gzip's default level, 9, takes several times longer than
+        # the whole reduction, for files only a little smaller.
+        return gzip.open(path, mode = 'wt', encoding = 'utf-8', compresslevel = 4)
+    else:
+        return open(path, mode = 'w', encoding = 'utf-8')
+
+def write_tallies(f, block):
+    lines = ['{},{},{},{}\n'.format(*row) for row in zip(*[x.tolist() for x in block])]
+    f.write(''.join(lines))
+
+def read_tallies(ss_file, chunklines = 1000000):
+    ''' Yields blocks of (doc, type, topic, count) arrays from tallies
+    written by process_file, as csv, csv.gz or npz.'''
+
+    if ss_file.endswith('.npz'):
+        with np.load(ss_file) as tallies:
+            yield tallies['doc'], tallies['type'], tallies['topic'], tallies['count']
+        return
+
+    if ss_file.endswith('.gz'):
+        f = gzip.open(ss_file, mode = 'rb')
+    else:
+        f = open(ss_file, mode = 'rb')
+
+    # header line
+    f.readline()
+
+    while True:
+        lines = f.readlines(chunklines * 16)
+        if len(lines) < 1:
+            break
+        fields = np.array(b','.join([x.strip() for x in lines]).split(b','), dtype = 'int64').reshape(-1, 4)
+        yield fields[ : , 0], fields[ : , 1], fields[ : , 2], fields[ : , 3]
+
+    f.close()
+
+def doc_topic_triples(block):
+    ''' Sums a block of tallies over types, returning (doc, topic, count) arrays.'''
+    docs, types, topics, counts = block
+    if len(docs) < 1:
+        return docs, topics, counts
+
+    firstdoc = docs[0]
+    numtopics = topics.max() + 1
+    sums = np.bincount((docs - firstdoc) * numtopics + topics, weights = counts)
+    nonzero = np.flatnonzero(sums)
+    return nonzero // numtopics + firstdoc, nonzero % numtopics, sums[nonzero].astype('int64')
+
+def doc_topic_matrix(triples, numtopics = 0, numdocs = 0):
+    ''' Builds the doc-topic matrix from a list of (doc, topic, count)
+    triples. Docs with no tokens get a row of zeroes.
+    '''
+    docs = np.concatenate([x[0] for x in triples] + [np.zeros(0, dtype = 'int64')])
+    topics = np.concatenate([x[1] for x in triples] + [np.zeros(0, dtype = 'int64')])
+    counts = np.concatenate([x[2] for x in triples] + [np.zeros(0, dtype = 'int64')])
+
+    if len(docs) > 0:
+        numdocs = max(numdocs, int(docs.max()) + 1)
+        numtopics = max(numtopics, int(topics.max()) + 1)
+
+    matrix = np.zeros((numdocs, numtopics), dtype = 'int64')
+    np.add.at(matrix, (docs, topics), counts)
+    return matrix
+
+def read_ids(id_file):
+    with open(id_file, encoding = 'utf-8') as f:
+        ids = [line.strip() for line in f.readlines()]
+    return ids
+
+def write_doc_topics(path, matrix, ids = None):
+    ''' Writes the doc-topic matrix, as a .npy array or as csv with a header
+    (topic1, topic2 ... id) and the doc's id at the end of each row.
+    '''
+    if path.endswith('.npy'):
+        np.save(path, matrix)
+        return
+
+    if ids is None:
+        ids = [str(x) for x in range(matrix.shape[0])]
+
+    numtopics = matrix.shape[1]
+    f = open_output(path)
+    f.write(','.join(['topic' + str(t + 1) for t in range(numtopics)] + ['id']) + '\n')
+    for row, doc_id in zip(matrix.tolist(), ids):
+        f.write(','.join([str(x) for x in row] + [doc_id]) + '\n')
+    if f is not sys.stdout:
+        f.close()
+
+def process_file(state_file, tallypath = '-', doctopicpath = None, id_file = None, numtopics = 0, workers = 1, pigz = False):
+    ''' Reduces the state, writing tallies to tallypath and doc-topics to
+    doctopicpath (either can be None). Returns the doc-topic matrix.
+    '''
+    blocks = tally_state(state_file, workers = workers, pigz = pigz)
+
+    alpha = next(blocks)
+    numtopics = max(numtopics, len(alpha))
+
+    if tallypath is None or tallypath.endswith('.npz'):
+        f = None
+    else:
+        f = open_output(tallypath)
         # header line
-        print "doc,type,topic,count"
+        f.write("doc,type,topic,count\n")
 
-        for line in f:
-            if line[0] == "#":
-                continue
+    kept = list()
+    triples = list()
 
-            # We can assume that the state is written out doc-by-doc,
-            # so we only need to count up type-topic pairs until we get
-            # to the end of the state for a given doc
+    for block in blocks:
+        if f is not None:
+            write_tallies(f, block)
+        elif tallypath is not None:
+            kept.append(block)
+        triples.append(doc_topic_triples(block))
 
-            line.strip()
-            doc,source,pos,typeindex,word,topic = line.split()
+    if f is not None and f is not sys.stdout:
+        f.close()
 
-            doc = int(doc)
-            typeindex = int(typeindex)
-            topic = int(topic)
+    if tallypath is not None and tallypath.endswith('.npz'):
+        columns = [np.concatenate([x[i] for x in kept] + [np.zeros(0, dtype = 'int64')]) for i in range(4)]
+        np.savez_compressed(tallypath, doc = columns[0], type = columns[1], topic = columns[2], count = columns[3])
 
-            if last_doc != doc:
-                output_tally(last_doc,doc_tally)
-                doc_tally = defaultdict(lambda : defaultdict(int))
+    if id_file is not None:
+        ids = read_ids(id_file)
+    else:
+        ids = None
 
-            doc_tally[typeindex][topic] += 1 
-            last_doc = doc
+    # Every doc in the id file gets a row, even if it came out empty.
+    if ids is not None:
+        matrix = doc_topic_matrix(triples, numtopics, len(ids))
+        if matrix.shape[0] > len(ids):
+            raise ValueError('The state has ' + str(matrix.shape[0]) + ' docs, but ' + id_file + ' has only ' + str(len(ids)) + ' ids.')
+    else:
+        matrix = doc_topic_matrix(triples, numtopics)
 
-        # final doc: after end of for loop
-        if len(doc_tally) > 0:
-            output_tally(last_doc,doc_tally)
+    if doctopicpath is not None:
+        write_doc_topics(doctopicpath, matrix, ids)
 
+    return matrix
 
 if __name__=="__main__":
-    script,filename = sys.argv
-    process_file(filename)
+    parser = argparse.ArgumentParser(description = 'Reduces a mallet state file to doc-type-topic tallies and doc-topic counts.')
+    parser.add_argument('state_file')
+    parser.add_argument('--tallies', default = None, help = 'csv, csv.gz or npz; - for stdout (the default unless --doctopics is given)')
+    parser.add_argument('--doctopics', default = None, help = 'csv, csv.gz or npy')
+    parser.add_argument('--ids', default = None, help = 'file of doc ids, one per line, as made by get_doc_ids')
+    parser.add_argument('--topics', type = int, default = 0, help = 'number of topics, if the state has no alpha line')
+    parser.add_argument('--workers', type = int, default = 1)
+    parser.add_argument('--pigz', action = 'store_true', help = 'decompress with pigz')
+    args = parser.parse_args()
+
+    tallypath = args.tallies
+    if tallypath is None and args.doctopics is None:
+        tallypath = '-'
+
+    process_file(args.state_file, tallypath, args.doctopics, args.ids, args.topics, args.workers, args.pigz)
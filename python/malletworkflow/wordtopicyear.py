@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+
+# wordtopicyear.py
+
+# Joins the tallies in a simplified mallet state (doc, type, topic, count)
+# to the dates of documents, and sums them into a sparse tensor with an
+# axis for word types, one for topics and one for years. Everything is kept
+# as integer arrays, and each table is summed out of the tensor with a
+# single bincount, so the diachronic topic plots can be redone for any
+# corpus without walking documents in Python.
+#
+#   docyears = wordtopicyear.doc_years(ids, datedict)
+#   tensor = wordtopicyear.from_tallies('state_tallied.csv.gz', docyears)
+#   tensor.vocabulary = wordtopicyear.read_vocabulary('fiction.wordtopics')
+#
+#   tensor.topic_by_year()                  # topics x years
+#   tensor.word_by_year(['pound', 'dollar'])  # those words x years
+#   tensor.word_by_year(topics = [17])      # every word x years, in topic 17
+#
+# Rows and columns always count from zero; tensor.yearlabels() gives the
+# year for each column.
+#
+# USAGE: python3 wordtopicyear.py state_tallied.csv.gz id_file date_file tensor.npz
+#
+# where date_file is a tsv with a doc id and a year on each line.
+
+import sys
+import numpy as np
+from scipy.sparse import csr_matrix
+
+import simplify_state
+
+def read_vocabulary(wordtopicsfile):
+    ''' Reads the words for each type index from the file mallet writes
+    with --word-topic-counts-file (typeindex word topic:count ...).
+    '''
+    vocabulary = dict()
+    with open(wordtopicsfile, encoding = 'utf-8') as f:
+        for line in f:
+            fields = line.split(' ', 2)
+            if len(fields) < 2:
+                continue
+            vocabulary[int(fields[0])] = fields[1]
+
+    words = [''] * (max(vocabulary) + 1 if len(vocabulary) > 0 else 0)
+    for typeindex, word in vocabulary.items():
+        words[typeindex] = word
+    return words
+
+def read_dates(date_file):
+    ''' A dict pairing doc ids with years, from a tsv of id and year.'''
+    datedict = dict()
+    with open(date_file, encoding = 'utf-8') as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 2:
+                continue
+            try:
+                datedict[fields[0]] = int(fields[1])
+            except ValueError:
+                continue
+    return datedict
+
+def doc_years(ids, datedict):
+    ''' An array with the year of each doc, in mallet's doc order, or -1
+    for docs that have no date.
+    '''
+    return np.array([datedict.get(x, -1) for x in ids], dtype = 'int64')
+
+class WordTopicYear:
+    ''' Counts of each word type in each topic in each year, stored as
+    parallel arrays of coordinates and counts, sorted by type, topic and year.
+    '''
+
+    def __init__(self, types, topics, years, counts, numtypes = 0, numtopics = 0, firstyear = None, numyears = 0, vocabulary = None):
+        types = np.asarray(types, dtype = 'int64')
+        topics = np.asarray(topics, dtype = 'int64')
+        years = np.asarray(years, dtype = 'int64')
+        counts = np.asarray(counts, dtype = 'int64')
+
+        if len(years) > 0:
+            if firstyear is None:
+                firstyear = int(years.min())
+            numtypes = max(numtypes, int(types.max()) + 1)
+            numtopics = max(numtopics, int(topics.max()) + 1)
+            numyears = max(numyears, int(years.max()) - firstyear + 1)
+        elif firstyear is None:
+            firstyear = 0
+
+        self.numtypes = numtypes
+        self.numtopics = numtopics
+        self.firstyear = firstyear
+        self.numyears = numyears
+        self.vocabulary = vocabulary
+
+        # Sum any repeated coordinates.
+        keys = (types * numtopics + topics) * numyears + (years - firstyear)
+        keys, inverse = np.unique(keys, return_inverse = True)
+        self.counts = np.bincount(inverse.ravel(), weights = counts, minlength = len(keys)).astype('int64')
+
+        self.years = keys % numyears if numyears > 0 else keys
+        keys = keys // max(numyears, 1)
+        self.topics = keys % numtopics if numtopics > 0 else keys
+        self.types = keys // max(numtopics, 1)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def yearlabels(self):
+        return np.arange(self.firstyear, self.firstyear + self.numyears)
+
+    def type_ids(self, words):
+        ''' Converts a list of words (or type indexes) to type indexes.'''
+        if self.vocabulary is None:
+            return np.asarray(words, dtype = 'int64')
+
+        wordindex = {word: idx for idx, word in enumerate(self.vocabulary)}
+        return np.array([wordindex[x] if isinstance(x, str) else x for x in words], dtype = 'int64')
+
+    def _select(self, types = None, topics = None, years = None):
+        ''' A boolean mask for entries in the given types, topics and
+        years (each a list, or None for all).
+        '''
+        mask = np.ones(len(self.counts), dtype = bool)
+        if types is not None:
+            mask &= np.isin(self.types, self.type_ids(types))
+        if topics is not None:
+            mask &= np.isin(self.topics, np.asarray(topics, dtype = 'int64'))
+        if years is not None:
+            mask &= np.isin(self.years, np.asarray(years, dtype = 'int64') - self.firstyear)
+        return mask
+
+    def topic_by_year(self, types = None):
+        ''' A dense matrix of counts, topics x years, summed over all
+        types or only the given ones.
+        '''
+        mask = self._select(types = types)
+        cells = self.topics[mask] * self.numyears + self.years[mask]
+        table = np.bincount(cells, weights = self.counts[mask], minlength = self.numtopics * self.numyears)
+        return table.astype('int64').reshape(self.numtopics, self.numyears)
+
+    def word_by_year(self, types = None, topics = None):
+        ''' Counts of words x years, summed over all topics or only the
+        given ones. With a list of types (words or indexes) this returns a
+        dense matrix with a row for each, in that order; otherwise a sparse
+        matrix with a row for every type.
+        '''
+        if types is None:
+            mask = self._select(topics = topics)
+            return csr_matrix((self.counts[mask], (self.types[mask], self.years[mask])), shape = (self.numtypes, self.numyears))
+
+        typeids = self.type_ids(types)
+        rows = np.full(self.numtypes, -1, dtype = 'int64')
+        rows[typeids] = np.arange(len(typeids))
+
+        mask = self._select(types = typeids, topics = topics)
+        cells = rows[self.types[mask]] * self.numyears + self.years[mask]
+        table = np.bincount(cells, weights = self.counts[mask], minlength = len(typeids) * self.numyears)
+        return table.astype('int64').reshape(len(typeids), self.numyears)
+
+    def word_by_topic(self, years = None):
+        ''' A sparse matrix of counts, types x topics, summed over all
+        years or only the given ones.
+        '''
+        mask = self._select(years = years)
+        return csr_matrix((self.counts[mask], (self.types[mask], self.topics[mask])), shape = (self.numtypes, self.numtopics))
+
+    def year_totals(self):
+        return np.bincount(self.years, weights = self.counts, minlength = self.numyears).astype('int64')
+
+    def type_totals(self):
+        return np.bincount(self.types, weights = self.counts, minlength = self.numtypes).astype('int64')
+
+    def save(self, path):
+        if self.vocabulary is None:
+            vocabulary = np.zeros(0, dtype = str)
+        else:
+            vocabulary = np.array(self.vocabulary, dtype = str)
+
+        np.savez_compressed(path, types = self.types, topics = self.topics, years = self.years + self.firstyear,
+            counts = self.counts, shape = np.array([self.numtypes, self.numtopics, self.firstyear, self.numyears]),
+            vocabulary = vocabulary)
+
+def load(path):
+    with np.load(path) as saved:
+        numtypes, numtopics, firstyear, numyears = [int(x) for x in saved['shape']]
+        vocabulary = [str(x) for x in saved['vocabulary']]
+        if len(vocabulary) < 1:
+            vocabulary = None
+        return WordTopicYear(saved['types'], saved['topics'], saved['years'], saved['counts'],
+            numtypes, numtopics, firstyear, numyears, vocabulary)
+
+def from_blocks(blocks, docyears):
+    ''' Builds the tensor from blocks of (doc, type, topic, count) arrays,
+    as yielded by simplify_state.read_tallies or tally_state. docyears
+    gives the year of each doc; docs with a year of -1 are left out.
+    '''
+    docyears = np.asarray(docyears, dtype = 'int64')
+    parts = list()
+
+    for docs, types, topics, counts in blocks:
+        years = docyears[docs]
+        dated = years >= 0
+        # Reduce each block as we go, so memory is bounded by the size of
+        # the tensor rather than the size of the tallies.
+        parts.append(WordTopicYear(types[dated], topics[dated], years[dated], counts[dated]))
+
+    if len(parts) < 1:
+        return WordTopicYear([], [], [], [])
+
+    return WordTopicYear(np.concatenate([x.types for x in parts]),
+        np.concatenate([x.topics for x in parts]),
+        np.concatenate([x.years + x.firstyear for x in parts]),
+        np.concatenate([x.counts for x in parts]))
+
+def from_tallies(ss_file, docyears):
+    ''' Builds the tensor from a file of tallies written by simplify_state.'''
+    return from_blocks(simplify_state.read_tallies(ss_file), docyears)
+
+def from_state(state_file, docyears, workers = 1, pigz = False):
+    ''' Builds the tensor straight from a mallet state file.'''
+    blocks = simplify_state.tally_state(state_file, workers = workers, pigz = pigz)
+    # The first thing tally_state yields is the header's alpha values.
+    next(blocks)
+    return from_blocks(blocks, docyears)
+
+if __name__=="__main__":
+    script, ss_file, id_file, date_file, outpath = sys.argv
+
+    docyears = doc_years(simplify_state.read_ids(id_file), read_dates(date_file))
+    tensor = from_tallies(ss_file, docyears)
+    tensor.save(outpath)
+    print('Saved ' + str(len(tensor)) + ' type-topic-year counts, for ' + str(tensor.numyears) + ' years starting in ' + str(tensor.firstyear) + '.')
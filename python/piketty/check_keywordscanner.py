@@ -0,0 +1,114 @@
+# check_keywordscanner.py
+
+# A golden check for modelingcounter.extract_snippets, which uses
+# keywordscanner to pick the tokens worth testing. The function used to
+# normalize and test every token in the stream; that loop is kept below as
+# old_extract_snippets. This builds fixed random streams of awkward tokens
+# (punctuation, prices, non-ASCII digits, characters that get longer when
+# lowercased) and checks that the old loop, extract_snippets and
+# extract_snippets_by_set all return the same snippets.
+#
+# Run it after changing keywordscanner.py or the snippet code in
+# modelingcounter.py. Importing modelingcounter needs the rule files
+# named in PathDictionary.txt. keywordscanner.py is identical in piketty2,
+# where check_keywordscanner.py does the same for tokenizer.
+#
+# USAGE: python3 check_keywordscanner.py
+
+import random, sys
+
+import modelingcounter
+from modelingcounter import strip_punctuation, arabic_digits
+
+vocabulary = ['the', 'of', 'and', 'a', 'A', 'year', 'hundred', 'thousand', 'pound',
+    'pounds', 'Pounds,', '"pound"', 'pound-note', 'dollar', 'dollars;', 'crown',
+    'crowns.', 'guinea', 'guineas', 'shilling', 'rubles', 'money', 'sixpence',
+    '£5', '$20', '10s.', '1,000', '1850', '3rd', '٣٤', '²', '½', 'İstanbul',
+    'İpound', 'ǅ', 'ß', 'ﬁve', '--', '—', '.', '(', ')', '', 'x', 'Mr.']
+
+targetsets = {'money': {'pound', 'pounds', 'dollar', 'dollars', 'crown', 'crowns', 'guinea', 'guineas'},
+    'coins': {'shilling', 'sixpence', 'rubles'},
+    'odd': {'istanbul', 'ss', 'year'},
+    'none': set()}
+
+def old_extract_snippets(tokens, WINDOW, targetwords = {}):
+    ''' extract_snippets as it was before keywordscanner.'''
+
+    sniptuples = []
+    streamlen = len(tokens)
+    WINDOWDIAMETER = (2 * WINDOW) + 1
+
+    for idx, token in enumerate(tokens):
+
+        if idx < (WINDOW + 1):
+            continue
+        if (idx + WINDOW + 2) > streamlen:
+            continue
+
+        prefix, word, suffix = strip_punctuation(token)
+        word = word.lower()
+        code = arabic_digits(word)
+
+        if code == "|arabicprice|":
+            priceflag = True
+        else:
+            priceflag = False
+
+        if (word in targetwords) or priceflag:
+            snippet = tokens[idx - WINDOW : idx + WINDOW + 1]
+
+            snippettomodel = []
+
+            for i in range(WINDOWDIAMETER):
+                prefix, thisword, suffix = strip_punctuation(snippet[i].lower())
+                code = arabic_digits(thisword)
+                if code == "|arabicprice|":
+                    thisword = "|price|"
+                elif code != "none":
+                    thisword = "|number|"
+
+                snippettomodel.append(thisword)
+
+            if idx > 15 and idx + 15 < streamlen:
+                snippet = tokens[idx - 12: idx + 13]
+
+            sniptuples.append((snippet, snippettomodel))
+
+    return sniptuples
+
+def token_streams(numstreams = 100, seed = 1850):
+    rng = random.Random(seed)
+    for i in range(numstreams):
+        streamlen = rng.choice([0, 1, 5, 20, 200, 2000])
+        yield [rng.choice(vocabulary) for j in range(streamlen)]
+
+def check():
+    ''' Returns the number of mismatches, printing each one.'''
+
+    errors = 0
+
+    for streamnum, tokens in enumerate(token_streams()):
+        for WINDOW in [0, 3, 7, 12]:
+
+            bysets = modelingcounter.extract_snippets_by_set(tokens, WINDOW, targetsets)
+
+            for name, targetwords in targetsets.items():
+                expected = old_extract_snippets(tokens, WINDOW, targetwords)
+
+                if modelingcounter.extract_snippets(tokens, WINDOW, targetwords) != expected:
+                    print('extract_snippets differs: stream ' + str(streamnum) + ', window ' + str(WINDOW) + ', set ' + name)
+                    errors += 1
+
+                if bysets[name] != expected:
+                    print('extract_snippets_by_set differs: stream ' + str(streamnum) + ', window ' + str(WINDOW) + ', set ' + name)
+                    errors += 1
+
+    return errors
+
+if __name__ == '__main__':
+    errors = check()
+    if errors > 0:
+        print(str(errors) + ' mismatches.')
+        sys.exit(1)
+    else:
+        print('OK')
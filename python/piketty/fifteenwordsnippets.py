@@ -9,145 +9,67 @@
 # in order to make a prediction about the likelihood that this word refers to money. The
 # model I used is based on 700 manually-tagged snippets; it's about about 87% accurate,
 # five-fold crossvalidated.
+#
+# The ambiguous snippets in each volume are classified together, as one batch;
+# see snippetclassifier.
+#
+# Volumes from both corpora are run in parallel by snippetdriver, which writes
+# the snippets to a single TSV sorted by htid, along with a log of the time
+# spent on each volume.
+#
+# Usage: python3 fifteenwordsnippets.py [number of workers]
 
 import modelingcounter
+import snippetdriver
 import os, sys
 import SonicScrewdriver as utils
 import csv
-import pickle
-from bagofwords import WordVector, StandardizingVector
-from sklearn.linear_model import LogisticRegression
-
-# We start with a number of functions borrowed from other scripts; these were used to
-# generate the logistic model, so we use them also here to clean and normalize snippets.
-
-punctuple = ('.', ',', '?', '!', ';', '"', '“', '”', ':', '--', '—', ')', '(', "'", "`", "[", "]", "{", "}")
-
-def all_nonalphanumeric(astring):
-    nonalphanum = True
-    for character in astring:
-        if character.isalpha() or character.isdigit():
-            nonalphanum = False
-            break
-    return nonalphanum
-
-def strip_punctuation(astring):
-    global punctuple
-    keepclipping = True
-    suffix = ""
-    while keepclipping == True and len(astring) > 1:
-        keepclipping = False
-        if astring.endswith(punctuple):
-            suffix = astring[-1:] + suffix
-            astring = astring[:-1]
-            keepclipping = True
-    keepclipping = True
-    prefix = ""
-    while keepclipping == True and len(astring) > 1:
-        keepclipping = False
-        if astring.startswith(punctuple):
-            prefix = prefix + astring[:1]
-            astring = astring[1:]
-            keepclipping = True
-    return(prefix, astring, suffix)
-
-def as_wordlist(line):
-    ''' Converts a line into a list of words, splitting
-    tokens brutally and unreflectively at punctuation.
-    One of the effects will be to split possessives into noun
-    and s. But this might not be a bad thing for current
-    purposes.
-    '''
-
-    line = line.replace('”', ' ')
-    line = line.replace(':', ' ')
-    line = line.replace(';', ' ')
-    line = line.replace('—', ' ')
-    line = line.replace('--', ' ')
-    line = line.replace('.', ' ')
-    line = line.replace(',', ' ')
-    line = line.replace('-', ' ')
-    line = line.replace('—', ' ')
-    line = line.replace("'", ' ')
-    line = line.replace('"', ' ')
-
-    # That's not the most efficient way to do this computationally,
-    # but it prevents me from having to look up the .translate
-    # method.
-
-    words = line.split(' ')
-
-    wordlist = list()
-
-    for word in words:
-        word = word.lower()
-        prefix, word, suffix = strip_punctuation(word)
-        # In case we missed anything.
-
-        if len(word) > 0 and not all_nonalphanumeric(word):
-            wordlist.append(word)
-
-    return wordlist
-
-def is_money(wordlist, WINDOWRADIUS, model, features, standardizer):
-    # We're getting a wordlist generated by WINDOWRADIUS, but
-    # we only want the central seven words for our model.
-
-    startindex = WINDOWRADIUS - 3
-    endindex = WINDOWRADIUS + 4
-
-    modelsegment = ' '.join(wordlist[startindex : endindex])
-
-    # You'd think we could just take a list of words, but in
-    # generating the model we ran strings through a particular
-    # tokenizing process, and we should replicate that here.
-
-    normalizedlist = as_wordlist(modelsegment)
-    vector = WordVector(normalizedlist)
-    vector.selectfeatures(features)
-    # This turns a sparse dictionary into an array with zeroes
-    # for missing features.
-
-    vector.normalizefrequencies()
-    # raw counts are divided by total counts.
+from snippetclassifier import load_classifier, report, strip_punctuation
 
-    vector.standardizefrequencies(standardizer)
-    # features are now centered on the means, and divided by
-    # standard deviations, calculated on the training set
+def approve_contexts(htid, date, newcontexts, WINDOWRADIUS, classifier):
+    ''' Sorts snippets into categories by their central keyword, and returns
+    the ones that refer to money. Snippets with an ambiguous keyword are
+    collected first, so the classifier can score them all at once.
+    '''
 
-    classlabel = model.predict(vector.features)[0]
+    keywords = []
+    ambiguouscontexts = []
 
-    if classlabel == 1:
-        return True
-    elif classlabel == 0:
-        return False
-    else:
-        print("ANOMALY!")
-        print(classlabel)
-        return False
+    for snippet, snippettomodel in newcontexts:
 
-        # Cause that's how I do error handling.
+        keyword = snippettomodel[WINDOWRADIUS]
+        keyword = keyword.lower()
+        prefix, keyword, suffix = strip_punctuation(keyword)
+        keywords.append(keyword)
 
-# Main script.
+        if keyword not in wealthwords and keyword in ambiguouswords:
+            ambiguouscontexts.append(snippettomodel)
 
-# Let's load the model.
+    currencypredictions = iter(classifier.predict(ambiguouscontexts, WINDOWRADIUS))
 
-modelfolder = "/Volumes/TARDIS/work/moneycontext/"
-modelpath = modelfolder + "logisticmodel.p"
-with open(modelpath, mode = 'rb') as f:
-    logisticmodel = pickle.load(f)
+    approvedcontexts = []
 
-standardizerpath = modelfolder + 'standardizer.p'
-with open(standardizerpath, mode = 'rb') as f:
-    standardizer = pickle.load(f)
+    for (snippet, snippettomodel), keyword in zip(newcontexts, keywords):
 
-featurepath = modelfolder + 'featurelist.p'
-with open(featurepath, mode = 'rb') as f:
-    features = pickle.load(f)
+        if keyword in wealthwords:
+            category = 'wealth'
+        elif keyword in ambiguouswords:
+            currency = next(currencypredictions)
+            if currency:
+                category = 'money'
+            else:
+                category = "notmoney"
+        elif keyword in moneywords:
+            category = 'money'
+        else:
+            print('ANOMALY: ' + keyword)
+            # Cause that's how I do error handling.
+            category = 'null'
 
-# Now load HathiTrust metadata.
+        if category == 'money':
+            approvedcontexts.append((htid, date, snippet, keyword, category))
 
-rows, columns, table = utils.readtsv('/Volumes/TARDIS/work/metadata/MergedMonographs.tsv')
+    return approvedcontexts
 
 ambiguouswords = {'crown', 'crowns', 'guinea', 'guineas', 'nickel', 'sovereign', 'sovereigns', 'pound', 'pounds', 'quid'}
 
@@ -168,26 +90,26 @@ wealthwords = {'fortune', 'fortunes', 'wealth', 'rich', 'riches', 'money', 'mone
 
 alltargetwords = moneywords
 
-sourcedir = "/Volumes/TARDIS/work/moneytexts/"
-filelist = os.listdir(sourcedir)
-filelist = [x for x in filelist if x.endswith(".txt")]
-contexts = []
-
 WINDOWRADIUS = 7
 
-ctr = 0
+modelfolder = "/Volumes/TARDIS/work/moneycontext/"
+
+# Each process loads the model the first time it needs it.
+classifier = None
 
-for filename in filelist:
+def snippet_lines(htid, date, filepath):
+    ''' Returns a line of output for each money snippet in one volume, along
+    with the number of ambiguous snippets the classifier scored for it and the
+    seconds that took, so snippetdriver can report throughput for the whole run.
+    '''
+    global classifier
 
-    htid = utils.pairtreelabel(filename.replace('.fic.txt', ''))
+    if classifier is None:
+        classifier = load_classifier(modelfolder)
 
-    if htid not in rows:
-        print(htid)
-        continue
-    else:
-        date = utils.simple_date(htid, table)
+    scoredbefore = classifier.snippetsscored
+    secondsbefore = classifier.secondsspent
 
-    filepath = os.path.join(sourcedir, filename)
     with open(filepath, encoding = 'utf-8') as f:
         filelines = f.readlines()
     pagelist = [filelines]
@@ -198,129 +120,83 @@ for filename in filelist:
 
     tokenstream = modelingcounter.makestream(pagelist)
 
-    newcontexts = modelingcounter.extract_snippets(tokenstream,  WINDOWRADIUS, alltargetwords)
+    newcontexts = modelingcounter.extract_snippets(tokenstream, WINDOWRADIUS, alltargetwords)
+    approvedcontexts = approve_contexts(htid, date, newcontexts, WINDOWRADIUS, classifier)
 
-    approvedcontexts = []
+    lines = []
+    for context in approvedcontexts:
+        htid, date, alist, keyword, category = context
+        snippet = " ".join(alist)
+        snippet = snippet.replace('\t', '')
+        # Because we don't want stray tabs in our tab-separated values.
 
-    for snippet, snippettomodel in newcontexts:
+        lines.append(htid + '\t' + str(date) + '\t' + keyword + '\t' + category + '\t' + snippet)
 
-        keyword = snippettomodel[WINDOWRADIUS]
-        keyword = keyword.lower()
-        prefix, keyword, suffix = strip_punctuation(keyword)
+    counters = [classifier.snippetsscored - scoredbefore, classifier.secondsspent - secondsbefore]
+    return lines, counters
 
-        if keyword in wealthwords:
-            category = 'wealth'
-        elif keyword in ambiguouswords:
-            currency = is_money(snippettomodel, WINDOWRADIUS, logisticmodel, features, standardizer)
-            if currency:
-                category = 'money'
-            else:
-                category = "notmoney"
-        elif keyword in moneywords:
-            category = 'money'
-        else:
-            print('ANOMALY: ' + keyword)
-            # Cause that's how I do error handling.
-            category = 'null'
-
-        if category == 'money':
-            approvedcontexts.append((htid, date, snippet, keyword, category))
-
-    print(ctr)
-    ctr += 1
+if __name__ == '__main__':
 
-    outfile = "/Volumes/TARDIS/work/moneycontext/twentyfivesnippets.tsv"
-    with open(outfile, mode='a', encoding='utf-8') as f:
-        for context in approvedcontexts:
-            htid, date, alist, keyword, category = context
-            snippet = " ".join(alist)
-            snippet = snippet.replace('\t', '')
-            # Because we don't want stray tabs in our tab-separated values.
+    if len(sys.argv) > 1:
+        workers = int(sys.argv[1])
+    else:
+        workers = 1
 
-            f.write(htid + '\t' + str(date) + '\t' + keyword + '\t' + category + '\t' + snippet + '\n')
+    tasks = []
 
+    # Now load HathiTrust metadata.
 
-sourcedir = "/Volumes/TARDIS/work/US_NOVELS_1923-1950/"
+    rows, columns, table = utils.readtsv('/Volumes/TARDIS/work/metadata/MergedMonographs.tsv')
 
-filelist = os.listdir(sourcedir)
-fileset = set([x for x in filelist if x.endswith(".txt")])
-filelist = list(fileset)
+    sourcedir = "/Volumes/TARDIS/work/moneytexts/"
+    filelist = os.listdir(sourcedir)
+    filelist = [x for x in filelist if x.endswith(".txt")]
 
-metafile = os.path.join(sourcedir, "US_NOVELS_1923-1950_META.txt")
+    for filename in filelist:
 
-datedict = dict()
-dateset = set()
+        htid = utils.pairtreelabel(filename.replace('.fic.txt', ''))
 
-with open(metafile, newline='', encoding = 'utf-8') as f:
-    reader = csv.reader(f)
-    for fields in reader:
-        idcode = fields[0]
-        date = int(fields[8])
-        datedict[idcode] = date
-        dateset.add(date)
+        if htid not in rows:
+            print(htid)
+            continue
+        else:
+            date = utils.simple_date(htid, table)
 
-for filename in filelist:
+        tasks.append((htid, date, os.path.join(sourcedir, filename)))
 
-    htid = utils.pairtreelabel(filename.replace('.txt', ''))
+    # And the post-1923 corpus, which has its own metadata.
 
-    if htid not in datedict:
-        print(htid)
-        continue
-    else:
-        date = datedict[htid]
+    sourcedir = "/Volumes/TARDIS/work/US_NOVELS_1923-1950/"
 
-    filepath = os.path.join(sourcedir, filename)
-    with open(filepath, encoding = 'utf-8') as f:
-        filelines = f.readlines()
-    pagelist = [filelines]
+    filelist = os.listdir(sourcedir)
+    fileset = set([x for x in filelist if x.endswith(".txt")])
+    filelist = list(fileset)
 
-    # The wordcounter module expects a list of pages, each of which is a list of lines.
-    # Ebooks have no pages -- at least as I currently receive them -- so we treat it
-    # all as one giant page.
+    metafile = os.path.join(sourcedir, "US_NOVELS_1923-1950_META.txt")
 
-    tokenstream = modelingcounter.makestream(pagelist)
+    datedict = dict()
+    dateset = set()
 
-    newcontexts = modelingcounter.extract_snippets(tokenstream, WINDOWRADIUS, alltargetwords)
-    approvedcontexts = []
+    with open(metafile, newline='', encoding = 'utf-8') as f:
+        reader = csv.reader(f)
+        for fields in reader:
+            idcode = fields[0]
+            date = int(fields[8])
+            datedict[idcode] = date
+            dateset.add(date)
 
-    for snippet, snippettomodel in newcontexts:
+    for filename in filelist:
 
-        keyword = snippettomodel[WINDOWRADIUS]
-        keyword = keyword.lower()
-        prefix, keyword, suffix = strip_punctuation(keyword)
+        htid = utils.pairtreelabel(filename.replace('.txt', ''))
 
-        if keyword in wealthwords:
-            category = 'wealth'
-        elif keyword in ambiguouswords:
-            currency = is_money(snippettomodel, WINDOWRADIUS, logisticmodel, features, standardizer)
-            if currency:
-                category = 'money'
-            else:
-                category = "notmoney"
-        elif keyword in moneywords:
-            category = 'money'
+        if htid not in datedict:
+            print(htid)
+            continue
         else:
-            print('ANOMALY: ' + keyword)
-            # Cause that's how I do error handling.
-            category = 'null'
+            date = datedict[htid]
 
-        if category == 'money':
-            approvedcontexts.append((htid, date, snippet, keyword, category))
+        tasks.append((htid, date, os.path.join(sourcedir, filename)))
 
     outfile = "/Volumes/TARDIS/work/moneycontext/twentyfivesnippets.tsv"
-    with open(outfile, mode='a', encoding='utf-8') as f:
-        for context in approvedcontexts:
-            htid, date, alist, keyword, category = context
-            snippet = " ".join(alist)
-            snippet = snippet.replace('\t', '')
-            # Because we don't want stray tabs in our tab-separated values.
-
-            f.write(htid + '\t' + str(date) + '\t' + keyword + '\t' + category + '\t' + snippet + '\n')
-
-
-
-
-
-
-
-
+    snippetdriver.run_volumes(tasks, snippet_lines, outfile, workers = workers,
+        counternames = ['scored', 'classifyseconds'], report = report)
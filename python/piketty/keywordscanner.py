@@ -0,0 +1,99 @@
+# keywordscanner.py
+
+# Finds the places in a token stream where a snippet might need to be
+# extracted, without normalizing every token.
+#
+# extract_snippets used to strip punctuation from every token in a volume,
+# lowercase it and check it for digits, just to test it against a few dozen
+# target words. Almost all tokens fail that test. Here the whole stream is
+# joined into one string and lowercased in one call, and then searched for
+# the target words, for digits, and (optionally) for "year." Only the tokens
+# where something was found are candidates, and extract_snippets runs its
+# usual tests on those alone, so it returns exactly what it did before.
+#
+# The search only has to find a superset of the real hits: a token whose
+# stripped, lowercased form is a target word contains that word; a price
+# contains a digit; and "a year" needs "year" in the next token.
+#
+# One regex alternating between all the target words turned out to be slower
+# than searching for each word separately with str.find, since Python's re
+# module tries each alternative at every position. Digits are found with a
+# single character class.
+
+import re
+from bisect import bisect_right
+from itertools import accumulate
+
+# Every character that str.isdigit() accepts, since arabic_digits counts them
+# all. Characters outside the Basic Multilingual Plane make a character class
+# very slow to match, so instead of listing those we accept any of them.
+digitclass = ''.join(chr(i) for i in range(0x10000) if chr(i).isdigit())
+digitpattern = re.compile('[' + re.escape(digitclass) + '\U00010000-\U0010ffff]+')
+
+class KeywordScanner:
+
+    def __init__(self, targetwords, prices = True, yearlookahead = False):
+        ''' targetwords is a set of words, or a list of sets to search for in
+        the same pass. If prices is true, any token with a digit is a candidate.
+        If yearlookahead is true, so is any token followed by one containing
+        "year" (for "a year").
+        '''
+
+        if len(targetwords) > 0 and not isinstance(next(iter(targetwords)), str):
+            words = set()
+            for wordset in targetwords:
+                words.update(wordset)
+        else:
+            words = set(targetwords)
+
+        self.words = sorted(set([x.lower() for x in words if len(x) > 0]))
+        self.prices = prices
+        self.yearlookahead = yearlookahead
+
+    def candidates(self, tokens, WINDOW):
+        ''' Returns, in ascending order, the indexes of tokens that might be hits,
+        leaving out any too close to either end of the stream for a window of
+        radius WINDOW. Tokens can't contain linebreaks.
+        '''
+
+        streamlen = len(tokens)
+        if streamlen < 1:
+            return []
+
+        text = '\n'.join(tokens).lower()
+
+        if len(text) == streamlen - 1 + sum(map(len, tokens)):
+            lengths = map(len, tokens)
+        else:
+            # A few characters get longer when lowercased. Then we need the
+            # length of each token as it appears in the lowercased text.
+            lowered = [x.lower() for x in tokens]
+            text = '\n'.join(lowered)
+            lengths = map(len, lowered)
+
+        # The offset at which each token starts.
+        starts = [0]
+        starts.extend(accumulate(x + 1 for x in lengths))
+
+        offsets = list()
+        for word in self.words:
+            offset = text.find(word)
+            while offset >= 0:
+                offsets.append(offset)
+                offset = text.find(word, offset + 1)
+
+        if self.prices:
+            offsets.extend([match.start() for match in digitpattern.finditer(text)])
+
+        found = set([bisect_right(starts, x) - 1 for x in offsets])
+
+        if self.yearlookahead:
+            offset = text.find('year')
+            while offset >= 0:
+                found.add(bisect_right(starts, offset) - 2)
+                offset = text.find('year', offset + 1)
+
+        first = WINDOW + 1
+        last = streamlen - WINDOW - 2
+
+        return sorted([x for x in found if x >= first and x <= last])
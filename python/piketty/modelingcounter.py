@@ -20,6 +20,7 @@
 # It doesn't bundle personal names or place names, but that could be done at a later stage.
 
 import FileCabinet
+import keywordscanner
 
 pathdictionary = FileCabinet.loadpathdictionary()
 rulepath = pathdictionary['volumerulepath']
@@ -468,64 +469,100 @@ def count_tokens(tokens, targetwords = [], targetphrases = [], verbose = False):
     return counts, wordsfused, triplets, alphanum_tokens
 
 
-def extract_snippets(tokens, WINDOW, targetwords = {}):
-    ''' Get words on either side of a targetword.
-    WINDOW = the window radius.
-    Right now this function is built to return all prices,
-    whether |arabicprice| is in targetwords or not.
+# extract_snippets only tests the tokens a KeywordScanner picks out as
+# candidates. We keep one scanner for each set of target words, so its
+# sorted, lowercased word list isn't rebuilt for every volume.
+
+scanners = dict()
+
+def get_scanner(targetwords):
+    key = frozenset(targetwords)
+    if key not in scanners:
+        scanners[key] = keywordscanner.KeywordScanner(targetwords)
+    return scanners[key]
+
+def test_token(tokens, idx):
+    ''' Returns the normalized form of the token at idx, and a flag that is
+    True if it's a price.
     '''
 
-    sniptuples = []
+    prefix, word, suffix = strip_punctuation(tokens[idx])
+    word = word.lower()
+    code = arabic_digits(word)
+
+    if code == "|arabicprice|":
+        priceflag = True
+    else:
+        priceflag = False
+
+        # We set that flag to make it possible to search
+        # for all prices. It's still not possible to search for other numbers, though
+        # I could enable that here.
+
+    return word, priceflag
+
+def make_sniptuple(tokens, idx, WINDOW):
     streamlen = len(tokens)
     WINDOWDIAMETER = (2 * WINDOW) + 1
 
-    for idx, token in enumerate(tokens):
-
-        if idx < (WINDOW + 1):
-            continue
-        if (idx + WINDOW + 2) > streamlen:
-            continue
+    snippet = tokens[idx - WINDOW : idx + WINDOW + 1]
 
-        prefix, word, suffix = strip_punctuation(token)
-        word = word.lower()
-        code = arabic_digits(word)
+    snippettomodel = []
 
+    # We compress the very large range of possible numbers into
+    # two numeric codes.
+    for i in range(WINDOWDIAMETER):
+        prefix, thisword, suffix = strip_punctuation(snippet[i].lower())
+        code = arabic_digits(thisword)
         if code == "|arabicprice|":
-            priceflag = True
-        else:
-            priceflag = False
+            thisword = "|price|"
+        elif code != "none":
+            thisword = "|number|"
 
-            # We set that flag to make it possible to search
-            # for all prices. It's still not possible to search for other numbers, though
-            # I could enable that here.
+        snippettomodel.append(thisword)
 
-        if (word in targetwords) or priceflag:
-            snippet = tokens[idx - WINDOW : idx + WINDOW + 1]
+    if idx > 15 and idx + 15 < streamlen:
+        snippet = tokens[idx - 12: idx + 13]
+
+    return (snippet, snippettomodel)
 
-            snippettomodel = []
+def extract_snippets(tokens, WINDOW, targetwords = {}):
+    ''' Get words on either side of a targetword.
+    WINDOW = the window radius.
+    Right now this function is built to return all prices,
+    whether |arabicprice| is in targetwords or not.
+    '''
 
-            # We compress the very large range of possible numbers into
-            # two numeric codes.
-            for i in range(WINDOWDIAMETER):
-                prefix, thisword, suffix = strip_punctuation(snippet[i].lower())
-                code = arabic_digits(thisword)
-                if code == "|arabicprice|":
-                    thisword = "|price|"
-                elif code != "none":
-                    thisword = "|number|"
+    sniptuples = []
 
-                snippettomodel.append(thisword)
+    for idx in get_scanner(targetwords).candidates(tokens, WINDOW):
 
-            if idx > 15 and idx + 15 < streamlen:
-                snippet = tokens[idx - 12: idx + 13]
+        word, priceflag = test_token(tokens, idx)
 
-            sniptuples.append((snippet, snippettomodel))
+        if (word in targetwords) or priceflag:
+            sniptuples.append(make_sniptuple(tokens, idx, WINDOW))
 
     return sniptuples
 
+def extract_snippets_by_set(tokens, WINDOW, targetsets):
+    ''' Like extract_snippets, but searches for several sets of target words
+    in one pass. targetsets is a dict pairing names with sets of words; returns
+    a dict pairing the same names with the snippets that extract_snippets
+    would have returned for each set.
+    '''
 
+    snippetsbyset = {name: [] for name in targetsets}
+    scanner = get_scanner(set().union(*targetsets.values()))
 
+    for idx in scanner.candidates(tokens, WINDOW):
 
+        word, priceflag = test_token(tokens, idx)
 
+        sniptuple = None
+        for name, targetwords in targetsets.items():
+            if (word in targetwords) or priceflag:
+                if sniptuple is None:
+                    sniptuple = make_sniptuple(tokens, idx, WINDOW)
+                snippetsbyset[name].append(sniptuple)
 
-
+    return snippetsbyset
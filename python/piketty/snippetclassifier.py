@@ -0,0 +1,195 @@
+# snippetclassifier.py
+
+# Decides whether snippets built around an ambiguous currency word ('pound',
+# 'crown', 'sovereign' ...) really refer to money, using the logistic model,
+# standardizer and featurelist pickled by model_contexts.
+#
+# fifteenwordsnippets used to do this one snippet at a time, building a
+# WordVector, a pandas Series and a one-row frame for every call. Here all
+# the snippets from a volume (or a whole shard of volumes) are turned into one
+# sparse matrix of frequencies and scored with a single product. Since the
+# model is linear, standardizing can be folded into its coefficients:
+#
+#   coef . (x - means) / stdevs + intercept
+#       = x . (coef / stdevs) + (intercept - coef . (means / stdevs))
+#
+# so the frequencies never have to be made dense.
+
+import pickle, time
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# These functions are the ones that were used to tokenize snippets when the
+# model was trained, so we use them here too.
+
+punctuple = ('.', ',', '?', '!', ';', '"', '“', '”', ':', '--', '—', ')', '(', "'", "`", "[", "]", "{", "}")
+
+def all_nonalphanumeric(astring):
+    nonalphanum = True
+    for character in astring:
+        if character.isalpha() or character.isdigit():
+            nonalphanum = False
+            break
+    return nonalphanum
+
+def strip_punctuation(astring):
+    global punctuple
+    keepclipping = True
+    suffix = ""
+    while keepclipping == True and len(astring) > 1:
+        keepclipping = False
+        if astring.endswith(punctuple):
+            suffix = astring[-1:] + suffix
+            astring = astring[:-1]
+            keepclipping = True
+    keepclipping = True
+    prefix = ""
+    while keepclipping == True and len(astring) > 1:
+        keepclipping = False
+        if astring.startswith(punctuple):
+            prefix = prefix + astring[:1]
+            astring = astring[1:]
+            keepclipping = True
+    return(prefix, astring, suffix)
+
+def as_wordlist(line):
+    ''' Converts a line into a list of words, splitting
+    tokens brutally and unreflectively at punctuation.
+    One of the effects will be to split possessives into noun
+    and s. But this might not be a bad thing for current
+    purposes.
+    '''
+
+    line = line.replace('”', ' ')
+    line = line.replace(':', ' ')
+    line = line.replace(';', ' ')
+    line = line.replace('—', ' ')
+    line = line.replace('--', ' ')
+    line = line.replace('.', ' ')
+    line = line.replace(',', ' ')
+    line = line.replace('-', ' ')
+    line = line.replace('—', ' ')
+    line = line.replace("'", ' ')
+    line = line.replace('"', ' ')
+
+    # That's not the most efficient way to do this computationally,
+    # but it prevents me from having to look up the .translate
+    # method.
+
+    words = line.split(' ')
+
+    wordlist = list()
+
+    for word in words:
+        word = word.lower()
+        prefix, word, suffix = strip_punctuation(word)
+        # In case we missed anything.
+
+        if len(word) > 0 and not all_nonalphanumeric(word):
+            wordlist.append(word)
+
+    return wordlist
+
+def model_segment(wordlist, WINDOWRADIUS):
+    ''' We're getting a wordlist generated by WINDOWRADIUS, but
+    we only want the central seven words for our model. In generating
+    the model we ran strings through a particular tokenizing process,
+    and we replicate that here.
+    '''
+
+    startindex = WINDOWRADIUS - 3
+    endindex = WINDOWRADIUS + 4
+
+    modelsegment = ' '.join(wordlist[startindex : endindex])
+    return as_wordlist(modelsegment)
+
+class MoneyClassifier:
+
+    def __init__(self, model, features, standardizer):
+        self.features = list(features)
+        self.wordindex = {word: idx for idx, word in enumerate(self.features)}
+
+        means = standardizer.means[self.features].values
+        stdevs = standardizer.stdevs[self.features].values
+        coefficients = model.coef_[0]
+
+        self.weights = coefficients / stdevs
+        self.offset = model.intercept_[0] - np.sum(coefficients * means / stdevs)
+        self.classes = np.array(model.classes_)
+
+        # Running totals, so we can report throughput (see report).
+        self.snippetsscored = 0
+        self.secondsspent = 0
+
+    def vectorize(self, wordlists, WINDOWRADIUS):
+        ''' A sparse matrix with a row for each snippet and a column for each
+        feature, holding the frequency of the feature in the snippet's
+        central seven words.
+        '''
+
+        rows = list()
+        columns = list()
+        counts = list()
+        totals = np.zeros(len(wordlists))
+
+        for row, wordlist in enumerate(wordlists):
+            normalizedlist = model_segment(wordlist, WINDOWRADIUS)
+            totals[row] = len(normalizedlist)
+            for word in normalizedlist:
+                if word in self.wordindex:
+                    rows.append(row)
+                    columns.append(self.wordindex[word])
+                    counts.append(1)
+
+        # Repeated (row, column) pairs are summed, which gives us raw counts.
+        matrix = csr_matrix((counts, (rows, columns)), shape = (len(wordlists), len(self.features)), dtype = 'float64')
+
+        # raw counts are divided by total counts. (A segment with no words
+        # left after tokenizing just gets zeroes.)
+        totals[totals < 1] = 1
+        return csr_matrix(matrix.multiply(1 / totals[ : , np.newaxis]))
+
+    def predict(self, wordlists, WINDOWRADIUS):
+        ''' Returns a list with True for each snippet predicted to refer
+        to money.
+        '''
+
+        if len(wordlists) < 1:
+            return []
+
+        starttime = time.time()
+
+        matrix = self.vectorize(wordlists, WINDOWRADIUS)
+        scores = matrix.dot(self.weights) + self.offset
+        classlabels = self.classes[(scores > 0).astype('int')]
+
+        self.snippetsscored += len(wordlists)
+        self.secondsspent += time.time() - starttime
+
+        return [x == 1 for x in classlabels]
+
+def report(snippetsscored, secondsspent):
+    ''' Describes throughput, given the snippets scored and the seconds spent
+    in predict. Pass the totals from every process's classifier, to report
+    on a parallel run.
+    '''
+    if secondsspent > 0:
+        throughput = snippetsscored / secondsspent
+    else:
+        throughput = 0
+    return 'Classified ' + str(snippetsscored) + ' ambiguous snippets at ' + str(int(throughput)) + ' snippets/sec.'
+
+def load_classifier(modelfolder):
+    ''' Loads the model, standardizer and featurelist written by model_contexts.
+    '''
+
+    with open(modelfolder + "logisticmodel.p", mode = 'rb') as f:
+        logisticmodel = pickle.load(f)
+
+    with open(modelfolder + 'standardizer.p', mode = 'rb') as f:
+        standardizer = pickle.load(f)
+
+    with open(modelfolder + 'featurelist.p', mode = 'rb') as f:
+        features = pickle.load(f)
+
+    return MoneyClassifier(logisticmodel, features, standardizer)
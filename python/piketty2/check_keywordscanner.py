@@ -0,0 +1,114 @@
+# check_keywordscanner.py
+
+# A golden check for tokenizer.extract_snippets, which uses keywordscanner to
+# pick the tokens worth testing. The function used to normalize and test
+# every token in the stream; that loop is kept below as old_extract_snippets.
+# This builds fixed random streams of awkward tokens (punctuation, prices,
+# non-ASCII digits, "a year," characters that get longer when lowercased)
+# and checks that the old loop, extract_snippets and extract_snippets_by_set
+# all return the same snippets.
+#
+# Run it after changing keywordscanner.py or the snippet code in tokenizer.py.
+# keywordscanner.py is identical in piketty, where
+# check_keywordscanner.py does the same for modelingcounter.
+#
+# USAGE: python3 check_keywordscanner.py
+
+import random, sys
+
+import tokenizer
+from tokenizer import strip_punctuation, arabic_digits, digitpercent
+
+vocabulary = ['the', 'of', 'and', 'a', 'A', 'a.', 'year', 'year.', 'YEAR', 'years',
+    'yearly', 'hundred', 'Hundred', 'thousand', 'hundreds', 'thousands', 'pound',
+    'pounds', 'Pounds,', '"pound"', 'pound-note', 'dollar', 'dollars;', 'crown',
+    'crowns.', 'guinea', 'guineas', 'shilling', 'rubles', 'money', 'sixpence',
+    '£5', '$20', '10s.', '1,000', '1850', '3rd', '٣٤', '²', '½', 'İstanbul',
+    'İpound', 'ǅ', 'ß', 'ﬁve', '--', '—', '.', '(', ')', '', 'x', 'Mr.']
+
+targetsets = {'money': {'pound', 'pounds', 'dollar', 'dollars', 'crown', 'crowns', 'guinea', 'guineas'},
+    'coins': {'shilling', 'sixpence', 'rubles'},
+    'odd': {'istanbul', 'ss', 'year'},
+    'none': set()}
+
+def old_extract_snippets(tokens, WINDOW, targetwords = {}):
+    ''' extract_snippets as it was before keywordscanner.'''
+
+    sniptuples = []
+    streamlen = len(tokens)
+
+    for idx, token in enumerate(tokens):
+
+        if idx < (WINDOW + 1):
+            continue
+        if (idx + WINDOW + 2) > streamlen:
+            continue
+
+        prefix, word, suffix = strip_punctuation(token)
+        word = word.lower()
+        code = arabic_digits(word)
+
+        if code == "|arabicprice|":
+            specialcase = True
+        else:
+            specialcase = False
+
+        if word == 'a':
+            prefix, nextword, suffix = strip_punctuation(tokens[idx+1])
+
+            if nextword == "year":
+
+                prefix, prevword, suffix = strip_punctuation(tokens[idx-1])
+
+                if prevword == "thousand" or prevword == "hundred":
+                    specialcase = True
+                elif prevword == "hundreds" or prevword == "thousands":
+                    specialcase = True
+                elif digitpercent(prevword) > 0.6:
+                    specialcase = True
+                else:
+                    specialcase = False
+
+        if (word in targetwords) or specialcase:
+            snippet = tokens[idx - WINDOW : idx + WINDOW + 1]
+
+            sniptuples.append((snippet))
+
+    return sniptuples
+
+def token_streams(numstreams = 100, seed = 1850):
+    rng = random.Random(seed)
+    for i in range(numstreams):
+        streamlen = rng.choice([0, 1, 5, 20, 200, 2000])
+        yield [rng.choice(vocabulary) for j in range(streamlen)]
+
+def check():
+    ''' Returns the number of mismatches, printing each one.'''
+
+    errors = 0
+
+    for streamnum, tokens in enumerate(token_streams()):
+        for WINDOW in [0, 3, 7, 12]:
+
+            bysets = tokenizer.extract_snippets_by_set(tokens, WINDOW, targetsets)
+
+            for name, targetwords in targetsets.items():
+                expected = old_extract_snippets(tokens, WINDOW, targetwords)
+
+                if tokenizer.extract_snippets(tokens, WINDOW, targetwords) != expected:
+                    print('extract_snippets differs: stream ' + str(streamnum) + ', window ' + str(WINDOW) + ', set ' + name)
+                    errors += 1
+
+                if bysets[name] != expected:
+                    print('extract_snippets_by_set differs: stream ' + str(streamnum) + ', window ' + str(WINDOW) + ', set ' + name)
+                    errors += 1
+
+    return errors
+
+if __name__ == '__main__':
+    errors = check()
+    if errors > 0:
+        print(str(errors) + ' mismatches.')
+        sys.exit(1)
+    else:
+        print('OK')
@@ -5,8 +5,15 @@
 
 # This version differs in large part by dumping the contextual model we
 # originally used to filter snippets.
+#
+# Volumes are run in parallel by snippetdriver, which writes the snippets
+# to a single TSV sorted by htid, along with a log of the time spent on
+# each volume.
+#
+# Usage: python3 extract_snippets.py [number of workers]
 
 import tokenizer
+import snippetdriver
 import os, sys
 import SonicScrewdriver as utils
 import csv
@@ -82,10 +89,6 @@ def as_wordlist(line):
 
     return wordlist
 
-# Now load HathiTrust metadata.
-
-rows, columns, table = utils.readtsv('/Volumes/TARDIS/work/metadata/MergedMonographs.tsv')
-
 ambiguouswords = {'crown', 'crowns', 'guinea', 'guineas', 'nickel', 'sovereign', 'sovereigns', 'pound', 'pounds', 'quid'}
 
 moneywords = {'dollar', 'dollars', 'dime', 'dimes', 'nickel', 'nickels', 'pound', 'pounds', 'shilling', 'shillings', 'sovereign', 'sovereigns','cent', 'cents', 'centime', 'centimes', 'crown', 'crowns', 'halfcrown', 'half-crown','penny', 'pennies', 'pence', 'farthing', 'farthings', 'franc', 'francs', 'guilder', 'guilders', 'florin', 'florins', 'guinea', 'guineas', "ha'penny", 'tuppence', 'twopence', 'sixpence', '|arabicprice|', '|price|', 'quid', 'buck', 'bucks', 'ruble', 'rubles'}
@@ -98,26 +101,11 @@ moneywords = {'dollar', 'dollars', 'dime', 'dimes', 'nickel', 'nickels', 'pound'
 
 alltargetwords = moneywords
 
-sourcedir = "/Users/tunder/Dropbox/GenreProject/python/piketty2/anova/"
-filelist = os.listdir(sourcedir)
-filelist = [x for x in filelist if x.endswith(".txt")]
-contexts = []
-
 WINDOWRADIUS = 12
 
-ctr = 0
-
-for filename in filelist:
-
-    htid = utils.pairtreelabel(filename.replace('.norm.txt', ''))
-
-    if htid not in rows:
-        print(htid + ' MISSING')
-        continue
-    else:
-        date = utils.simple_date(htid, table)
+def snippet_lines(htid, date, filepath):
+    ''' Returns a line of output for each snippet in one volume.'''
 
-    filepath = os.path.join(sourcedir, filename)
     with open(filepath, encoding = 'utf-8') as f:
         filelines = f.readlines()
     pagelist = [filelines]
@@ -126,6 +114,8 @@ for filename in filelist:
 
     newcontexts = tokenizer.extract_snippets(tokenstream,  WINDOWRADIUS, alltargetwords)
 
+    lines = []
+
     for context in newcontexts:
         keyword = context[WINDOWRADIUS]
         keyword = keyword.lower()
@@ -135,12 +125,39 @@ for filename in filelist:
         snippet = snippet.replace('\t', '')
         # Because we don't want stray tabs in our tab-separated values.
 
-        print(htid + '\t' + str(date) + '\t' + keyword + '\t' + snippet)
+        lines.append(htid + '\t' + str(date) + '\t' + keyword + '\t' + snippet)
+
+    return lines
+
+if __name__ == '__main__':
+
+    if len(sys.argv) > 1:
+        workers = int(sys.argv[1])
+    else:
+        workers = 1
+
+    # Now load HathiTrust metadata.
 
+    rows, columns, table = utils.readtsv('/Volumes/TARDIS/work/metadata/MergedMonographs.tsv')
 
+    sourcedir = "/Users/tunder/Dropbox/GenreProject/python/piketty2/anova/"
+    outpath = "/Users/tunder/Dropbox/GenreProject/python/piketty2/anovasnippets.tsv"
+    filelist = os.listdir(sourcedir)
+    filelist = [x for x in filelist if x.endswith(".txt")]
 
+    tasks = []
 
+    for filename in filelist:
 
+        htid = utils.pairtreelabel(filename.replace('.norm.txt', ''))
 
+        if htid not in rows:
+            print(htid + ' MISSING')
+            continue
+        else:
+            date = utils.simple_date(htid, table)
 
+        filepath = os.path.join(sourcedir, filename)
+        tasks.append((htid, date, filepath))
 
+    snippetdriver.run_volumes(tasks, snippet_lines, outpath, workers = workers)
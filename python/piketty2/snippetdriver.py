@@ -0,0 +1,184 @@
+# snippetdriver.py
+
+# Runs snippet extraction over a list of volumes, in a pool of processes,
+# and collects the results into one file.
+#
+# Each worker writes the lines for the volumes it processes to its own shard
+# file, next to the final output, so workers never contend for a file and
+# nothing has to be sent back through the pool except a little timing
+# information. When every volume is done, the shards are merged into a single
+# TSV sorted by htid. Volumes are numbered in htid order before they're handed
+# out, and every line in a shard is tagged with its volume's number, so the
+# merged file comes out the same no matter how many workers there were or
+# which of them got which volume.
+#
+# The time taken for each volume, and the number of lines it produced, are
+# logged to a separate TSV, and progress is printed as volumes finish.
+#
+#   tasks = [(htid, date, filepath), ...]
+#   snippetdriver.run_volumes(tasks, snippet_lines, outpath, workers = 12)
+#
+# where snippet_lines(htid, date, filepath) returns a list of lines (without
+# newlines) for one volume. It has to be defined at the top level of a module,
+# so the pool can find it.
+#
+# A volume can also report counters of its own (e.g. how many snippets a
+# classifier scored, and how long that took). Pass their names as
+# counternames, and have snippet_lines return (lines, counters), with counters
+# a list of numbers in the same order. They're logged as extra columns in the
+# timing file, and summed over all workers; if report is given, it's called
+# with those sums and what it returns is printed with the progress.
+
+import os, sys, time, gzip, heapq
+from multiprocessing import Pool
+
+# Each worker process opens its shard once, the first time it's needed.
+shardfile = None
+shardpath = None
+
+def shard_prefix(outpath):
+    return outpath + '.shard'
+
+def open_output(path, mode):
+    ''' Output that ends in .gz is compressed.'''
+    if path.endswith('.gz'):
+        return gzip.open(path, mode = mode + 't', encoding = 'utf-8')
+    else:
+        return open(path, mode = mode, encoding = 'utf-8')
+
+def process_one_volume(task):
+    ''' Runs one volume, and appends its lines to this process's shard.
+    Returns the volume's number, htid, shard, time in seconds, number of lines,
+    and any counters the volume reported.
+    '''
+    global shardfile, shardpath
+
+    volumenumber, htid, date, filepath, processvolume, outpath, counternames = task
+
+    if shardfile is None:
+        shardpath = shard_prefix(outpath) + str(os.getpid())
+        shardfile = open(shardpath, mode = 'w', encoding = 'utf-8')
+
+    starttime = time.time()
+    lines = processvolume(htid, date, filepath)
+
+    if counternames is None:
+        counters = []
+    else:
+        lines, counters = lines
+
+    for line in lines:
+        shardfile.write(str(volumenumber) + '\t' + line + '\n')
+
+    # Pool workers exit without closing their files, so we flush
+    # after every volume rather than at the end.
+    shardfile.flush()
+
+    return volumenumber, htid, shardpath, time.time() - starttime, len(lines), counters
+
+def read_shard(path):
+    ''' Yields (volume number, line) pairs from a shard. Tasks go out to the
+    pool in order, so each worker sees its volumes in ascending order, and
+    each shard is already sorted.
+    '''
+    with open(path, encoding = 'utf-8') as f:
+        for line in f:
+            volumenumber, line = line.split('\t', 1)
+            yield int(volumenumber), line
+
+def merge_shards(shardpaths, outpath):
+    ''' Merges the shards into outpath, in order of volume number, and
+    removes them. Returns the number of lines written.
+    '''
+    numlines = 0
+    with open_output(outpath, 'w') as f:
+        for volumenumber, line in heapq.merge(*[read_shard(x) for x in shardpaths], key = lambda x: x[0]):
+            f.write(line)
+            numlines += 1
+
+    for path in shardpaths:
+        os.remove(path)
+
+    return numlines
+
+def remove_old_shards(outpath):
+    ''' Shards left by an interrupted run would otherwise be merged with new ones.'''
+    folder, prefix = os.path.split(shard_prefix(outpath))
+    if folder == '':
+        folder = '.'
+    for filename in os.listdir(folder):
+        if filename.startswith(prefix):
+            os.remove(os.path.join(folder, filename))
+
+def run_volumes(tasks, processvolume, outpath, workers = 1, timingpath = None, reportevery = 100, counternames = None, report = None):
+    ''' tasks is a list of (htid, date, filepath) tuples; processvolume is called
+    on each of them. Writes all the lines to outpath, sorted by htid, and the
+    time taken for each volume to timingpath (by default, outpath with its
+    extension replaced by .timing.tsv). Returns the number of lines written.
+    '''
+    global shardfile
+
+    if timingpath is None:
+        timingpath = outpath
+        if timingpath.endswith('.gz'):
+            timingpath = timingpath[ : -3]
+        timingpath = os.path.splitext(timingpath)[0] + '.timing.tsv'
+
+    # Number the volumes in htid order. Sorting on the filepath too settles
+    # the order of any files that map to the same htid.
+    tasks = sorted(tasks, key = lambda x: (x[0], x[2]))
+    numbered = [(idx, htid, date, filepath, processvolume, outpath, counternames) for idx, (htid, date, filepath) in enumerate(tasks)]
+    numvolumes = len(numbered)
+
+    remove_old_shards(outpath)
+
+    if workers > 1:
+        pool = Pool(processes = workers)
+        results = pool.imap_unordered(process_one_volume, numbered)
+    else:
+        pool = None
+        results = map(process_one_volume, numbered)
+
+    print('Extracting snippets from ' + str(numvolumes) + ' volumes with ' + str(workers) + ' workers.')
+
+    starttime = time.time()
+    shardpaths = set()
+    done = 0
+    totallines = 0
+
+    if counternames is None:
+        counternames = []
+    countertotals = [0] * len(counternames)
+
+    with open(timingpath, mode = 'w', encoding = 'utf-8') as timingfile:
+        timingfile.write('\t'.join(['htid', 'seconds', 'lines'] + counternames) + '\n')
+
+        for volumenumber, htid, path, seconds, numlines, counters in results:
+            shardpaths.add(path)
+            countertotals = [x + y for x, y in zip(countertotals, counters)]
+            timingfile.write('\t'.join([htid, str(round(seconds, 4)), str(numlines)] + [str(round(x, 4)) for x in counters]) + '\n')
+
+            done += 1
+            totallines += numlines
+            if done % reportevery == 0 or done == numvolumes:
+                elapsed = max(time.time() - starttime, 0.001)
+                rate = done / elapsed
+                remaining = (numvolumes - done) / rate
+                print(str(done) + ' / ' + str(numvolumes) + ' volumes, ' + str(totallines) + ' lines, ' + str(round(rate, 1)) + ' vols/sec, about ' + str(int(remaining)) + ' sec to go.')
+                if report is not None:
+                    print(report(*countertotals))
+                sys.stdout.flush()
+
+    if pool is not None:
+        pool.close()
+        pool.join()
+    else:
+        # In a serial run the "shard" belongs to this process, so close it here.
+        if shardfile is not None:
+            shardfile.close()
+            shardfile = None
+
+    numlines = merge_shards(sorted(shardpaths), outpath)
+    print('Wrote ' + str(numlines) + ' lines to ' + outpath + ' in ' + str(round(time.time() - starttime, 1)) + ' sec.')
+
+    return numlines
@@ -7,6 +7,8 @@
 # back through modelingcounter and worcounter to
 # Volume.py and then god knows where.
 
+import keywordscanner
+
 punctuple = ('.', ',', '?', '!', ';', '"', '“', '”', ':', '--', '—', ')', '(', "'", "`", "[", "]", "{", "}")
 
 def increment_dict(anitem, adictionary):
@@ -374,52 +376,66 @@ def digitpercent(astring):
 
     return digits / stringlength
 
-def extract_snippets(tokens, WINDOW, targetwords = {}):
-    ''' Get words on either side of a targetword.
-    WINDOW = the window radius.
-    Right now this function is built to return all prices,
-    whether |arabicprice| is in targetwords or not.
+# extract_snippets only tests the tokens a KeywordScanner picks out as
+# candidates. We keep one scanner for each set of target words, so its
+# sorted, lowercased word list isn't rebuilt for every volume.
+
+scanners = dict()
+
+def get_scanner(targetwords):
+    key = frozenset(targetwords)
+    if key not in scanners:
+        scanners[key] = keywordscanner.KeywordScanner(targetwords, yearlookahead = True)
+    return scanners[key]
+
+def test_token(tokens, idx):
+    ''' Returns the normalized form of the token at idx, and a flag that is
+    True if it's a price, or the "a" in "[number] a year."
     '''
 
-    sniptuples = []
-    streamlen = len(tokens)
-    WINDOWDIAMETER = (2 * WINDOW) + 1
+    prefix, word, suffix = strip_punctuation(tokens[idx])
+    word = word.lower()
+    code = arabic_digits(word)
 
-    for idx, token in enumerate(tokens):
+    if code == "|arabicprice|":
+        specialcase = True
+    else:
+        specialcase = False
 
-        if idx < (WINDOW + 1):
-            continue
-        if (idx + WINDOW + 2) > streamlen:
-            continue
+        # We set that flag to make it possible to search
+        # for all prices. It's still not possible to search for other numbers, though
+        # I could enable that here.
 
-        prefix, word, suffix = strip_punctuation(token)
-        word = word.lower()
-        code = arabic_digits(word)
+    if word == 'a':
+        prefix, nextword, suffix = strip_punctuation(tokens[idx+1])
 
-        if code == "|arabicprice|":
-            specialcase = True
-        else:
-            specialcase = False
+        if nextword == "year":
 
-            # We set that flag to make it possible to search
-            # for all prices. It's still not possible to search for other numbers, though
-            # I could enable that here.
+            prefix, prevword, suffix = strip_punctuation(tokens[idx-1])
 
-        if word == 'a':
-            prefix, nextword, suffix = strip_punctuation(tokens[idx+1])
+            if prevword == "thousand" or prevword == "hundred":
+                specialcase = True
+            elif prevword == "hundreds" or prevword == "thousands":
+                specialcase = True
+            elif digitpercent(prevword) > 0.6:
+                specialcase = True
+            else:
+                specialcase = False
 
-            if nextword == "year":
+    return word, specialcase
 
-                prefix, prevword, suffix = strip_punctuation(tokens[idx-1])
+def extract_snippets(tokens, WINDOW, targetwords = {}):
+    ''' Get words on either side of a targetword.
+    WINDOW = the window radius.
+    Right now this function is built to return all prices,
+    whether |arabicprice| is in targetwords or not.
+    '''
+
+    sniptuples = []
 
-                if prevword == "thousand" or prevword == "hundred":
-                    specialcase = True
-                elif prevword == "hundreds" or prevword == "thousands":
-                    specialcase = True
-                elif digitpercent(prevword) > 0.6:
-                    specialcase = True
-                else:
-                    specialcase = False
+    for idx in get_scanner(targetwords).candidates(tokens, WINDOW):
+
+        word, specialcase = test_token(tokens, idx)
 
         if (word in targetwords) or specialcase:
             snippet = tokens[idx - WINDOW : idx + WINDOW + 1]
@@ -428,9 +444,22 @@ def extract_snippets(tokens, WINDOW, targetwords = {}):
 
     return sniptuples
 
+def extract_snippets_by_set(tokens, WINDOW, targetsets):
+    ''' Like extract_snippets, but searches for several sets of target words
+    in one pass. targetsets is a dict pairing names with sets of words; returns
+    a dict pairing the same names with the snippets that extract_snippets
+    would have returned for each set.
+    '''
 
+    snippetsbyset = {name: [] for name in targetsets}
+    scanner = get_scanner(set().union(*targetsets.values()))
 
+    for idx in scanner.candidates(tokens, WINDOW):
 
+        word, specialcase = test_token(tokens, idx)
 
+        for name, targetwords in targetsets.items():
+            if (word in targetwords) or specialcase:
+                snippetsbyset[name].append(tokens[idx - WINDOW : idx + WINDOW + 1])
 
-
+    return snippetsbyset
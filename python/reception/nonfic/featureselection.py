@@ -0,0 +1,99 @@
+# featureselection.py
+
+# Bi-normal separation (see Forman, "An Extensive Empirical Study of Feature
+# Selection Metrics for Text Classification") for choosing a vocabulary.
+#
+# This used to be scored one word at a time, building a zero-padded array of
+# counts for each word and calling norm.ppf twice per word, which made it
+# impractical for large vocabularies. Here the whole vocabulary is scored at
+# once from a volume x word matrix of counts, which can be a numpy array or a
+# scipy.sparse matrix.
+
+import numpy as np
+from scipy.stats import norm
+
+def binormal_scores(countmatrix, classvector):
+    '''Returns a bi-normal separation score for each column of countmatrix,
+    given a class (1 or 0) for each row.
+
+    As in the original per-word version, a volume counts as "above" for a word
+    if its count is greater than the word's mean count across all volumes; the
+    two rates compared are
+
+        tpr = positives above / (positives above + negatives not above)
+        fpr = positives not above / (positives not above + negatives above)
+
+    Scores that come out infinite or undefined are set to zero.
+    '''
+
+    classvector = np.asarray(classvector) == 1
+    numrows, numwords = countmatrix.shape
+    totalpos = int(np.sum(classvector))
+    totalneg = numrows - totalpos
+
+    if hasattr(countmatrix, 'tocoo'):
+        # Counts are never negative, so a zero is never above the mean,
+        # and only the stored entries need to be compared.
+        coo = countmatrix.tocoo()
+        means = np.asarray(countmatrix.sum(axis = 0)).ravel() / numrows
+        above = coo.data > means[coo.col]
+        rowspositive = classvector[coo.row]
+        posabove = np.bincount(coo.col[above & rowspositive], minlength = numwords)
+        negabove = np.bincount(coo.col[above & ~rowspositive], minlength = numwords)
+    else:
+        countmatrix = np.asarray(countmatrix)
+        means = countmatrix.mean(axis = 0)
+        above = countmatrix > means
+        posabove = above[classvector].sum(axis = 0)
+        negabove = above[~classvector].sum(axis = 0)
+
+    posbelow = totalpos - posabove
+    negbelow = totalneg - negabove
+
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        tpr = posabove / (posabove + negbelow)
+        fpr = posbelow / (posbelow + negabove)
+        scores = np.abs(norm.ppf(tpr) - norm.ppf(fpr))
+
+    scores[~np.isfinite(scores)] = 0
+    return scores
+
+def binormal_matrix_select(vocablist, countmatrix, classvector, k, scorepath = 'bnsscores.tsv'):
+    '''Returns the k words in vocablist (the columns of countmatrix) with the
+    highest scores. If scorepath isn't None, every word's score is written there.
+    '''
+
+    scores = binormal_scores(countmatrix, classvector)
+
+    zipped = [x for x in zip(scores, vocablist)]
+    zipped.sort(reverse = True)
+
+    if scorepath is not None:
+        with open(scorepath, mode='w', encoding = 'utf-8') as f:
+            for score, word in zipped:
+                f.write(word + '\t' + str(score) + '\n')
+
+    return [x[1] for x in zipped[0:k]]
+
+def binormal_select(vocablist, positivecounts, negativecounts, totalpos, totalneg, k):
+    '''The old interface: positivecounts and negativecounts pair each word with
+    a list of its counts in the positive (or negative) volumes that contain it.
+    Volumes that don't contain a word count as zeroes.
+    '''
+    from scipy.sparse import csr_matrix
+
+    # Which volume a count came from doesn't affect the score, so the counts
+    # for each word are just stacked from the top of its column.
+    rows = list()
+    columns = list()
+    data = list()
+    for idx, word in enumerate(vocablist):
+        for offset, countsforword in [(0, positivecounts.get(word, [])), (totalpos, negativecounts.get(word, []))]:
+            rows.extend(range(offset, offset + len(countsforword)))
+            columns.extend([idx] * len(countsforword))
+            data.extend(countsforword)
+
+    countmatrix = csr_matrix((data, (rows, columns)), shape = (totalpos + totalneg, len(vocablist)))
+    classvector = [1] * totalpos + [0] * totalneg
+
+    return binormal_matrix_select(vocablist, countmatrix, classvector, k)
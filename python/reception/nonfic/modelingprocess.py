@@ -3,6 +3,7 @@
 import numpy as np
 import pandas as pd
 from sklearn.linear_model import LogisticRegression
+from standardizer import normalizearray
 
 def sliceframe(dataframe, yvals, excludedrows, testrow):
     numrows = len(dataframe)
@@ -19,39 +20,6 @@ def sliceframe(dataframe, yvals, excludedrows, testrow):
 
     return trainingset, newyvals, testset
 
-def normalizearray(featurearray, usedate):
-    '''Normalizes an array by centering on means and
-    scaling by standard deviations. Also returns the
-    means and standard deviations for features, so that
-    they can be pickled.
-    '''
-
-    numinstances, numfeatures = featurearray.shape
-    means = list()
-    stdevs = list()
-    lastcolumn = numfeatures - 1
-    for featureidx in range(numfeatures):
-
-        thiscolumn = featurearray.iloc[ : , featureidx]
-        thismean = np.mean(thiscolumn)
-
-        thisstdev = np.std(thiscolumn)
-
-        if (not usedate) or featureidx != lastcolumn:
-            # If we're using date we don't normalize the last column.
-            means.append(thismean)
-            stdevs.append(thisstdev)
-            featurearray.iloc[ : , featureidx] = (thiscolumn - thismean) / thisstdev
-        else:
-            print('FLAG')
-            means.append(thismean)
-            thisstdev = 0.1
-            stdevs.append(thisstdev)
-            featurearray.iloc[ : , featureidx] = (thiscolumn - thismean) / thisstdev
-            # We set a small stdev for date.
-
-    return featurearray, means, stdevs
-
 def model_one_volume(data5tuple):
     data, classvector, listtoexclude, i, usedate = data5tuple
     trainingset, yvals, testset = sliceframe(data, classvector, listtoexclude, i)
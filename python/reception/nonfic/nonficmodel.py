@@ -14,7 +14,8 @@ from multiprocessing import Pool
 from sklearn.linear_model import LogisticRegression
 import modelingprocess
 import metafilter
-from scipy.stats import norm
+from standardizer import normalizearray
+from featureselection import binormal_select
 
 usedate = False
 
@@ -199,80 +200,6 @@ def sliceframe(dataframe, yvals, excludedrows, testrow):
 
     return trainingset, newyvals, testset
 
-def normalizearray(featurearray, usedate):
-    '''Normalizes an array by centering on means and
-    scaling by standard deviations. Also returns the
-    means and standard deviations for features, so that
-    they can be pickled.
-    '''
-
-    numinstances, numfeatures = featurearray.shape
-    means = list()
-    stdevs = list()
-    lastcolumn = numfeatures - 1
-    for featureidx in range(numfeatures):
-
-        thiscolumn = featurearray.iloc[ : , featureidx]
-        thismean = np.mean(thiscolumn)
-
-        thisstdev = np.std(thiscolumn)
-
-        if (not usedate) or featureidx != lastcolumn:
-            # If we're using date we don't normalize the last column.
-            means.append(thismean)
-            stdevs.append(thisstdev)
-            featurearray.iloc[ : , featureidx] = (thiscolumn - thismean) / thisstdev
-        else:
-            print('FLAG')
-            means.append(thismean)
-            thisstdev = 0.1
-            stdevs.append(thisstdev)
-            featurearray.iloc[ : , featureidx] = (thiscolumn - thismean) / thisstdev
-            # We set a small stdev for date.
-
-    return featurearray, means, stdevs
-
-def binormal_select(vocablist, positivecounts, negativecounts, totalpos, totalneg, k):
-    all_scores = np.zeros(len(vocablist))
-
-    for idx, word in enumerate(vocablist):
-        # For each word we create a vector the length of vols in each class
-        # that contains real counts, plus zeroes for all those vols not
-        # represented.
-
-        positives = np.zeros(totalpos, dtype = 'int64')
-        if word in positivecounts:
-            positives[0: len(positivecounts[word])] = positivecounts[word]
-
-        negatives = np.zeros(totalneg, dtype = 'int64')
-        if word in negativecounts:
-            negatives[0: len(negativecounts[word])] = negativecounts[word]
-
-        featuremean = np.mean(np.append(positives, negatives))
-
-        tp = sum(positives > featuremean)
-        fp = sum(positives <= featuremean)
-        tn = sum(negatives > featuremean)
-        fn = sum(negatives <= featuremean)
-        tpr = tp/(tp+fn) # true positive ratio
-        fpr = fp/(fp+tn) # false positive ratio
-
-        bns_score = abs(norm.ppf(tpr) - norm.ppf(fpr))
-        # See Forman
-
-        if np.isinf(bns_score) or np.isnan(bns_score):
-            bns_score = 0
-
-        all_scores[idx] = bns_score
-
-    zipped = [x for x in zip(all_scores, vocablist)]
-    zipped.sort(reverse = True)
-    with open('bnsscores.tsv', mode='w', encoding = 'utf-8') as f:
-        for score, word in zipped:
-            f.write(word + '\t' + str(score) + '\n')
-
-    return [x[1] for x in zipped[0:k]]
-
 ## MAIN code starts here.
 
 # sourcefolder = '/Users/tunder/Dropbox/GenreProject/python/reception/fiction/texts/'
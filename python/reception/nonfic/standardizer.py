@@ -0,0 +1,64 @@
+# standardizer.py
+
+# Centers each feature on its mean and scales it by its standard deviation.
+# This used to be done one column at a time, with a separate copy of
+# normalizearray in every modeling script; since it gets called in every
+# leave-one-out fold, it's worth doing all the columns at once in numpy.
+
+import numpy as np
+import pandas as pd
+
+class Standardizer:
+    '''Learns means and standard deviations from a training set (fit) and
+    applies them to that set or to test data (transform). Works on DataFrames,
+    Series, or numpy arrays, and returns the same kind of thing.
+
+    If usedate is True, the last column is a date. We don't want it to dominate
+    the model, so instead of its real standard deviation we use datestdev
+    (unless datestdev is None). Columns with a standard deviation of zero are
+    only centered, rather than divided by zero.
+    '''
+
+    def __init__(self, usedate = False, datestdev = 0.1):
+        self.usedate = usedate
+        self.datestdev = datestdev
+        self.means = None
+        self.stdevs = None
+
+    def fit(self, featurearray):
+        values = np.asarray(featurearray, dtype = 'float64')
+        self.means = values.mean(axis = 0)
+        stdevs = values.std(axis = 0)
+
+        if self.usedate and self.datestdev is not None:
+            stdevs[-1] = self.datestdev
+
+        stdevs[stdevs == 0] = 1
+        self.stdevs = stdevs
+
+        return self
+
+    def transform(self, featurearray):
+        values = (np.asarray(featurearray, dtype = 'float64') - self.means) / self.stdevs
+
+        if isinstance(featurearray, pd.DataFrame):
+            return pd.DataFrame(values, index = featurearray.index, columns = featurearray.columns)
+        elif isinstance(featurearray, pd.Series):
+            return pd.Series(values, index = featurearray.index, name = featurearray.name)
+        else:
+            return values
+
+    def fit_transform(self, featurearray):
+        return self.fit(featurearray).transform(featurearray)
+
+def normalizearray(featurearray, usedate, datestdev = 0.1):
+    '''Normalizes an array by centering on means and
+    scaling by standard deviations. Also returns the
+    means and standard deviations for features, so that
+    they can be pickled.
+    '''
+
+    standardizer = Standardizer(usedate, datestdev)
+    featurearray = standardizer.fit_transform(featurearray)
+
+    return featurearray, list(standardizer.means), list(standardizer.stdevs)
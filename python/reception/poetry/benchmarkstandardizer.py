@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+# benchmarkstandardizer.py
+
+# Times the setup for one leave-one-out fold (drop the excluded rows, then
+# normalize the training set) on a matrix the size of a typical model:
+# 1000 volumes by 3200 features, with date as the last column. Compares the
+# old column-by-column normalizearray, reproduced below, with the shared one
+# in standardizer.py, and checks that they agree.
+#
+# Usage:
+#   python3 benchmarkstandardizer.py [volumes] [features]
+
+import sys, time
+import numpy as np
+import pandas as pd
+
+import modelingprocess
+from standardizer import normalizearray
+
+def columnwise_normalizearray(featurearray, usedate):
+    '''The version that used to be copied into each modeling script.'''
+
+    numinstances, numfeatures = featurearray.shape
+    means = list()
+    stdevs = list()
+    lastcolumn = numfeatures - 1
+    for featureidx in range(numfeatures):
+
+        thiscolumn = featurearray.iloc[ : , featureidx]
+        thismean = np.mean(thiscolumn)
+
+        thisstdev = np.std(thiscolumn)
+
+        if (not usedate) or featureidx != lastcolumn:
+            means.append(thismean)
+            stdevs.append(thisstdev)
+            featurearray.iloc[ : , featureidx] = (thiscolumn - thismean) / thisstdev
+        else:
+            means.append(thismean)
+            thisstdev = 0.1
+            stdevs.append(thisstdev)
+            featurearray.iloc[ : , featureidx] = (thiscolumn - thismean) / thisstdev
+
+    return featurearray, means, stdevs
+
+def time_folds(normalize, data, classvector, folds, usedate):
+    start = time.time()
+    for listtoexclude, i in folds:
+        trainingset, yvals, testset = modelingprocess.sliceframe(data, classvector, listtoexclude, i)
+        trainingset, means, stdevs = normalize(trainingset, usedate)
+    return (time.time() - start) / len(folds), trainingset, means, stdevs
+
+if __name__ == '__main__':
+
+    args = sys.argv
+    if len(args) > 2:
+        numvolumes = int(args[1])
+        numfeatures = int(args[2])
+    else:
+        numvolumes = 1000
+        numfeatures = 3200
+
+    np.random.seed(0)
+    # Relative frequencies, mostly small, plus a date column.
+    data = np.random.exponential(0.0002, size = (numvolumes, numfeatures))
+    data[ : , -1] = np.random.randint(1820, 1920, size = numvolumes)
+    data = pd.DataFrame(data)
+    classvector = list(np.random.randint(0, 2, size = numvolumes))
+
+    # Exclude a few rows per fold, in descending order as sliceframe expects.
+    folds = list()
+    for i in range(0, numvolumes, numvolumes // 5):
+        folds.append((sorted(set([i, (i + 1) % numvolumes, (i + 7) % numvolumes]), reverse = True), i))
+
+    print('Matrix: ' + str(numvolumes) + ' volumes x ' + str(numfeatures) + ' features, ' + str(len(folds)) + ' folds.')
+
+    old, oldset, oldmeans, oldstdevs = time_folds(columnwise_normalizearray, data, classvector, folds, True)
+    print('column by column:  ' + str(round(old, 4)) + ' sec per fold')
+
+    new, newset, newmeans, newstdevs = time_folds(normalizearray, data, classvector, folds, True)
+    print('standardizer:      ' + str(round(new, 4)) + ' sec per fold  (' + str(round(old / new, 1)) + 'x)')
+
+    agree = np.allclose(oldset.values, newset.values) and np.allclose(oldmeans, newmeans) and np.allclose(oldstdevs, newstdevs)
+    if agree:
+        print('Results agree.')
+    else:
+        print('Results differ!')
+        sys.exit(1)
@@ -1,12 +1,28 @@
 # Linear model of diction.
 
-import csv
+# A ridge regression that separates poetry from nonfiction after 1860, by
+# the relative frequencies of about 3000 common words. Training it means
+# reading all of yeargenjoint.csv, so it used to happen every time the module
+# was imported. Now the fitted model is saved to MODELPATH, and is only
+# trained (or loaded) the first time a prediction is needed.
+#
+#   import lineardiction
+#   predictions = lineardiction.predict_many(voldicts)
+#
+# To retrain it, and write selfpredict.csv, run this file as a script.
+
+import csv, os
 from collections import Counter
 from sklearn.linear_model import LinearRegression
 from sklearn.linear_model import Ridge
 import numpy as np
 import pandas as pd
 
+yeardatapath = '/Volumes/TARDIS/work/mysql/yeargenjoint.csv'
+rulesetfolder = '/Users/tunder/Dropbox/DataMunging/rulesets/'
+selfpredictpath = '/Users/tunder/Dropbox/GenreProject/python/reception/poetry/selfpredict.csv'
+MODELPATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'lineardiction.model.npz')
+
 def get_genre(datapath, targetgenre):
     genrecounts = dict()
 
@@ -106,94 +122,157 @@ def genres_to_pandaframe(positivegenres, negativegenre, wordlist, method):
 
     return data, yvals
 
-yeardatapath = '/Volumes/TARDIS/work/mysql/yeargenjoint.csv'
+def train_model(yeardatapath, rulesetfolder):
+    '''Fits the model; returns it, the list of features it uses, and the
+    normalized counts for each genre (as a dict pairing genre with counts).
+    '''
+    fiction = get_genre(yeardatapath, 'fic')
+    poetry = get_genre(yeardatapath, 'poe')
+    nonfic = get_genre(yeardatapath, 'non')
+
+    fiction = filter_genre(fiction, 1860)
+    poetry = filter_genre(poetry, 1860)
+    nonfic = filter_genre(nonfic, 1860)
 
-fiction = get_genre(yeardatapath, 'fic')
-poetry = get_genre(yeardatapath, 'poe')
-nonfic = get_genre(yeardatapath, 'non')
+    normalize(fiction)
+    normalize(poetry)
+    normalize(nonfic)
 
-fiction = filter_genre(fiction, 1860)
-poetry = filter_genre(poetry, 1860)
-nonfic = filter_genre(nonfic, 1860)
+    commonwords = most_common([poetry, nonfic], 3200)
+    featurelist = commonwords[200:]
 
-normalize(fiction)
-normalize(poetry)
-normalize(nonfic)
+    with open(os.path.join(rulesetfolder, 'MainDictionary.txt'), encoding = 'utf-8') as f:
+        maindict = set([x.split('\t')[0] for x in f])
 
-commonwords = most_common([poetry, nonfic], 3200)
-featurelist = commonwords[200:]
+    with open(os.path.join(rulesetfolder, 'PersonalNames.txt'), encoding = 'utf-8') as f:
+        names = set([x.rstrip().lower() for x in f])
 
-with open('/Users/tunder/Dropbox/DataMunging/rulesets/MainDictionary.txt', encoding = 'utf-8') as f:
-    maindict = set([x.split('\t')[0] for x in f])
+    with open(os.path.join(rulesetfolder, 'PlaceNames.txt'), encoding = 'utf-8') as f:
+        places = set([x.rstrip().lower() for x in f])
 
-with open('/Users/tunder/Dropbox/DataMunging/rulesets/PersonalNames.txt', encoding = 'utf-8') as f:
-    names = set([x.rstrip().lower() for x in f])
+    places.add('iv')
+    places.add('ix')
 
-with open('/Users/tunder/Dropbox/DataMunging/rulesets/PlaceNames.txt', encoding = 'utf-8') as f:
-    places = set([x.rstrip().lower() for x in f])
+    filteredfeatures = list()
+    for word in featurelist:
+        if len(word) < 2:
+            print(word)
+            continue
 
-places.add('iv')
-places.add('ix')
+        if word in maindict and not (word in names or word in places):
+            filteredfeatures.append(word)
+        else:
+            print(word)
 
-filteredfeatures = list()
-for word in featurelist:
-    if len(word) < 2:
-        print(word)
-        continue
+    data, yvals = genres_to_pandaframe([poetry], nonfic, filteredfeatures, 'straight')
 
-    if word in maindict and not (word in names or word in places):
-        filteredfeatures.append(word)
-    else:
-        print(word)
+    model = Ridge(alpha = 0.001)
+    model.fit(data, yvals)
 
-data, yvals = genres_to_pandaframe([poetry], nonfic, filteredfeatures, 'straight')
+    genres = {'poe': poetry, 'fic': fiction, 'non': nonfic}
+    return model, filteredfeatures, genres
 
-model = Ridge(alpha = 0.001)
-model.fit(data, yvals)
+class DictionModel:
+    '''The coefficients of the fitted model, the words they belong to, and a
+    mapping from each word to its column. Predictions are made directly from
+    the coefficients, so loading the model doesn't need sklearn.
+    '''
 
-coefficients = list(zip(model.coef_, featurelist))
-coefficients.sort()
-for coefficient, word in coefficients:
-    print(word + " :  " + str(coefficient))
+    def __init__(self, features, coef, intercept):
+        self.features = [str(x) for x in features]
+        self.coef = np.asarray(coef, dtype = 'float64')
+        self.intercept = float(intercept)
+        self.wordindex = {word: idx for idx, word in enumerate(self.features)}
+
+    def save(self, modelpath):
+        # Write to a temporary name and then rename, so an interrupted
+        # run never leaves a truncated model.
+        temppath = modelpath + '.part'
+        with open(temppath, mode = 'wb') as f:
+            np.savez(f, features = np.array(self.features, dtype = str), coef = self.coef, intercept = np.array([self.intercept]))
+        os.rename(temppath, modelpath)
+
+    def predict_matrix(self, countmatrix, totals):
+        '''countmatrix has a row for each volume and a column for each word in
+        self.features (dense, or scipy.sparse); totals is the total number of
+        words in each volume. Returns an array of predictions.
+        '''
+        scores = countmatrix.dot(self.coef)
+        return np.asarray(scores).ravel() / (np.asarray(totals, dtype = 'float64') + .001) + self.intercept
+
+    def predict_many(self, voldicts):
+        '''Predictions for a list of dicts pairing words with counts.'''
+        from scipy.sparse import csr_matrix
+
+        rows = list()
+        columns = list()
+        data = list()
+        totals = np.zeros(len(voldicts))
+        for row, voldict in enumerate(voldicts):
+            for word, count in voldict.items():
+                totals[row] += count
+                if word in self.wordindex:
+                    rows.append(row)
+                    columns.append(self.wordindex[word])
+                    data.append(count)
+
+        countmatrix = csr_matrix((data, (rows, columns)), shape = (len(voldicts), len(self.features)))
+        return self.predict_matrix(countmatrix, totals)
+
+def load_model(modelpath = MODELPATH):
+    '''Reads a saved DictionModel.'''
+    with np.load(modelpath) as saved:
+        return DictionModel(saved['features'], saved['coef'], saved['intercept'][0])
+
+def build_model(modelpath = MODELPATH):
+    '''Trains a DictionModel, saves it to modelpath, and writes the model's
+    predictions for each year of each genre to selfpredictpath.
+    '''
+    model, filteredfeatures, genres = train_model(yeardatapath, rulesetfolder)
 
-outlist = list()
-for year, wordcounts in poetry.items():
-    features = get_features(wordcounts, filteredfeatures)
-    selfpredict = model.predict(features)
-    outline = 'poe' + ',' + str(year) + ',' + str(selfpredict) + '\n'
-    outlist.append(outline)
+    coefficients = list(zip(model.coef_, filteredfeatures))
+    coefficients.sort()
+    for coefficient, word in coefficients:
+        print(word + " :  " + str(coefficient))
 
-for year, wordcounts in fiction.items():
-    features = get_features(wordcounts, filteredfeatures)
-    selfpredict = model.predict(features)
-    outline = 'fic' + ',' + str(year) + ',' + str(selfpredict) + '\n'
-    outlist.append(outline)
+    dictionmodel = DictionModel(filteredfeatures, model.coef_, model.intercept_)
+    dictionmodel.save(modelpath)
 
-for year, wordcounts in nonfic.items():
-    features = get_features(wordcounts, filteredfeatures)
-    selfpredict = model.predict(features)
-    outline = 'non' + ',' + str(year) + ',' + str(selfpredict) + '\n'
-    outlist.append(outline)
+    outlist = list()
+    for genre in ['poe', 'fic', 'non']:
+        years = list(genres[genre].keys())
+        features = np.array([get_features(genres[genre][year], filteredfeatures) for year in years])
+        selfpredictions = model.predict(features)
+        for year, selfpredict in zip(years, selfpredictions):
+            outline = genre + ',' + str(year) + ',' + str(selfpredict) + '\n'
+            outlist.append(outline)
 
-with open('/Users/tunder/Dropbox/GenreProject/python/reception/poetry/selfpredict.csv', mode='w', encoding = 'utf-8') as f:
-    for line in outlist:
-        f.write(line)
+    with open(selfpredictpath, mode='w', encoding = 'utf-8') as f:
+        for line in outlist:
+            f.write(line)
 
-def prediction(voldict):
-    global filteredfeatures, model
+    return dictionmodel
 
-    totalcount = 0
-    for word, count in voldict.items():
-        totalcount += count
+# The model is loaded the first time it's needed, and trained first if
+# there's no saved copy.
 
-    numwords = len(filteredfeatures)
-    wordvec = np.zeros(numwords)
-    for idx, word in enumerate(filteredfeatures):
-        if word in voldict:
-            wordvec[idx] = voldict[word] / (totalcount + .001)
+dictionmodel = None
 
-    yval = model.predict(wordvec)
-    return yval
+def get_model():
+    global dictionmodel
+    if dictionmodel is None:
+        if os.path.isfile(MODELPATH):
+            dictionmodel = load_model(MODELPATH)
+        else:
+            dictionmodel = build_model(MODELPATH)
+    return dictionmodel
 
+def predict_many(voldicts):
+    '''Scores a list of volumes, each a dict pairing words with counts.'''
+    return get_model().predict_many(voldicts)
 
+def prediction(voldict):
+    return predict_many([voldict])[0]
 
+if __name__ == '__main__':
+    dictionmodel = build_model(MODELPATH)
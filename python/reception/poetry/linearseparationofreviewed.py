@@ -5,10 +5,11 @@
 import numpy as np
 import pandas as pd
 import csv, os, random
-from collections import Counter
 
 from sklearn.linear_model import Ridge
 from sklearn.linear_model import LogisticRegression
+from standardizer import normalizearray
+import corpusloader
 
 usedate = True
 
@@ -37,29 +38,8 @@ def normalizeandexport(featurearray, usedate):
     they can be pickled.
     '''
 
-    numinstances, numfeatures = featurearray.shape
-    means = list()
-    stdevs = list()
-    lastcolumn = numfeatures - 1
-    for featureidx in range(numfeatures):
-
-        thiscolumn = featurearray.iloc[ : , featureidx]
-        thismean = np.mean(thiscolumn)
-
-        thisstdev = np.std(thiscolumn)
-
-        if (not usedate) or featureidx != lastcolumn:
-            # If we're using date we don't normalize the last column.
-            means.append(thismean)
-            stdevs.append(thisstdev)
-            featurearray.iloc[ : , featureidx] = (thiscolumn - thismean) / thisstdev
-        else:
-            means.append(thismean)
-            stdevs.append(thisstdev)
-            featurearray.iloc[ : , featureidx] = (thiscolumn - thismean) / thisstdev
-            # We set a small stdev for date.
-
-    return featurearray, means, stdevs
+    # Unlike the other scripts, this one doesn't override the stdev for date.
+    return normalizearray(featurearray, usedate, datestdev = None)
 
 def get_metadata(classpath, volumeIDs):
     '''
@@ -208,8 +188,9 @@ metadict = get_metadata(classpath, volumeIDs)
 
 IDspresent = set([x for x in metadict.keys()])
 
-# make a vocabulary list and a volsize dict
-wordcounts = Counter()
+# Every volume is parsed once (or read from a cache) into a sparse matrix;
+# the vocabulary and the features are both taken from that.
+corpus = corpusloader.load_corpus(sourcefolder, extension)
 
 volspresent = list()
 
@@ -219,52 +200,23 @@ for volid, volpath in zip(volumeIDs, volumepaths):
     else:
         volspresent.append((volid, volpath))
 
-    with open(volpath, encoding = 'utf-8') as f:
-        for line in f:
-            fields = line.strip().split('\t')
-            word = fields[0]
-            if len(word) > 1 and word[0].isalpha():
-                count = int(fields[1])
-                wordcounts[word] += 1
-
-vocablist = [x[0] for x in wordcounts.most_common(3200)]
+vocablist = corpus.top_words(3200, [x[0] for x in volspresent], corpusloader.longer_than_one)
 VOCABSIZE = len(vocablist)
 
-volsizes = dict()
-voldata = list()
-classvector = list()
-
-for volid, volpath in volspresent:
-
-    with open(volpath, encoding = 'utf-8') as f:
-        voldict = dict()
-        totalcount = 0
-        for line in f:
-            fields = line.strip().split('\t')
-            if len(fields) > 2 or len(fields) < 2:
-                print(line)
-                continue
-
-            word = fields[0]
-            count = int(fields[1])
-            voldict[word] = count
-            totalcount += count
-
-    date = metadict[volid][2]
-    date = date - 1700
-    if date < 0:
-        date = 0
+volIDs = [x[0] for x in volspresent]
+counts = corpus.features(volIDs, vocablist)
+totals = corpus.totals(volIDs)
 
+if usedate:
+    dates = np.array([max(metadict[volid][2] - 1700, 0) for volid in volIDs])
+    voldata = np.column_stack([counts / (totals[ : , np.newaxis] + 0.0001), dates])
+else:
+    voldata = counts / (totals[ : , np.newaxis] + 0.001)
 
-    if usedate:
-        features = get_features_with_date(voldict, vocablist, date, totalcount)
-        voldata.append(features)
-    else:
-        features = get_features(voldict, vocablist)
-        voldata.append(features / (totalcount + 0.001))
-
+volsizes = dict(zip(volIDs, [int(x) for x in totals]))
+classvector = list()
 
-    volsizes[volid] = totalcount
+for volid in volIDs:
     reviewed = metadict[volid][0]
     if reviewed == 'rev':
         classvector.append(1)
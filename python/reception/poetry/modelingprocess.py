@@ -3,6 +3,8 @@
 import numpy as np
 import pandas as pd
 from sklearn.linear_model import LogisticRegression
+from standardizer import normalizearray
+from featureselection import binormal_matrix_select
 
 def sliceframe(dataframe, yvals, excludedrows, testrow):
     numrows = len(dataframe)
@@ -19,39 +21,6 @@ def sliceframe(dataframe, yvals, excludedrows, testrow):
 
     return trainingset, newyvals, testset
 
-def normalizearray(featurearray, usedate):
-    '''Normalizes an array by centering on means and
-    scaling by standard deviations. Also returns the
-    means and standard deviations for features, so that
-    they can be pickled.
-    '''
-
-    numinstances, numfeatures = featurearray.shape
-    means = list()
-    stdevs = list()
-    lastcolumn = numfeatures - 1
-    for featureidx in range(numfeatures):
-
-        thiscolumn = featurearray.iloc[ : , featureidx]
-        thismean = np.mean(thiscolumn)
-
-        thisstdev = np.std(thiscolumn)
-
-        if (not usedate) or featureidx != lastcolumn:
-            # If we're using date we don't normalize the last column.
-            means.append(thismean)
-            stdevs.append(thisstdev)
-            featurearray.iloc[ : , featureidx] = (thiscolumn - thismean) / thisstdev
-        else:
-            print('FLAG')
-            means.append(thismean)
-            thisstdev = 0.1
-            stdevs.append(thisstdev)
-            featurearray.iloc[ : , featureidx] = (thiscolumn - thismean) / thisstdev
-            # We set a small stdev for date.
-
-    return featurearray, means, stdevs
-
 def model_one_volume(data5tuple):
     data, classvector, listtoexclude, i, usedate = data5tuple
     trainingset, yvals, testset = sliceframe(data, classvector, listtoexclude, i)
@@ -65,3 +34,261 @@ def model_one_volume(data5tuple):
         print(i)
     # print(str(i) + "  -  " + str(len(listtoexclude)))
     return prediction
+
+class AuthorGroups:
+    '''Groups rows of the feature matrix by author, so that whenever we make
+    a prediction about a volume we can leave out every volume by the same author.
+    Rows listed in donttrainon are never used for training at all.
+
+    authors is a list with one author for each row, in row order.
+    '''
+
+    def __init__(self, authors, donttrainon):
+        self.numrows = len(authors)
+        self.nevertrain = np.zeros(self.numrows, dtype = bool)
+        self.nevertrain[list(donttrainon)] = True
+
+        rowlists = dict()
+        for idx, author in enumerate(authors):
+            if author in rowlists:
+                rowlists[author].append(idx)
+            else:
+                rowlists[author] = [idx]
+
+        self.groups = {author: np.array(rows, dtype = 'int64') for author, rows in rowlists.items()}
+        self.authors = list(authors)
+
+    def rows_for(self, idx):
+        '''All the rows by the same author as row idx (including idx).'''
+        return self.groups[self.authors[idx]]
+
+    def trainmask(self, idx):
+        '''A boolean mask that is True for rows we can train on when
+        predicting row idx.'''
+        mask = ~self.nevertrain
+        mask[self.rows_for(idx)] = False
+        return mask
+
+    def excluded(self, idx):
+        '''The rows to leave out when predicting row idx, in descending order,
+        as sliceframe expects.'''
+        return list(np.flatnonzero(~self.trainmask(idx))[::-1])
+
+def maskframe(dataframe, yvals, trainmask):
+    '''Like sliceframe, but takes a boolean mask of the rows to train on
+    instead of a list of rows to delete.
+    '''
+    trainingset = dataframe[trainmask]
+    newyvals = np.array(yvals)[trainmask]
+    return trainingset, newyvals
+
+# When parallel_crossvalidate runs leave-one-out in a pool, the feature matrix is
+# saved once as a .npy file and memory-mapped by every worker. Each task then only
+# needs to carry the indexes of the rows to leave out (the author's other volumes),
+# plus the rows to predict; the rows we never train on are shared by every task.
+#
+# Every volume by the same author produces an identical training set, so a task
+# can cover a whole author group: one model is fit, and it predicts each volume
+# in the group.
+
+shareddata = None
+sharedclasses = None
+sharednevertrain = None
+sharedwarmstart = None
+sharedcounts = None
+sharedvocab = None
+sharedbnsfeatures = 0
+
+def attach_shared_data(matrixpath, classvector, nevertrain, warmstart = None, bnsargs = None):
+    '''Called once in each worker process when the pool starts. If
+    warmstart is provided, it's a FullModel, and each fold starts from
+    its solution. If bnsargs is provided, it's (countpath, vocablist,
+    bnsfeatures), and each fold chooses its own features; see bns_columns.
+    '''
+    global shareddata, sharedclasses, sharednevertrain, sharedwarmstart, sharedcounts, sharedvocab, sharedbnsfeatures
+    shareddata = np.load(matrixpath, mmap_mode = 'r')
+    sharedclasses = np.array(classvector)
+    sharednevertrain = np.array(nevertrain, dtype = bool)
+    sharedwarmstart = warmstart
+    if bnsargs is not None:
+        countpath, sharedvocab, sharedbnsfeatures = bnsargs
+        sharedcounts = np.load(countpath, mmap_mode = 'r')
+
+def bns_columns(counts, yvals, vocablist, k, usedate):
+    '''The columns of the k words in vocablist with the highest bi-normal
+    separation, scored on the rows of counts (training rows only), plus the
+    date column if we're using it.
+    '''
+    selected = binormal_matrix_select(vocablist, counts, yvals, k, scorepath = None)
+    wordindex = {word: idx for idx, word in enumerate(vocablist)}
+    columns = [wordindex[word] for word in selected]
+    if usedate:
+        columns.append(len(vocablist))
+    return columns
+
+def model_one_shared_group(data4tuple):
+    '''Fits one model leaving out the rows in groupindices (and all the
+    rows we never train on), and returns a list of predictions, one for
+    each row in testindices.
+    '''
+    groupindices, testindices, usedate, regularization = data4tuple
+
+    keep = ~sharednevertrain
+    keep[groupindices] = False
+    yvals = sharedclasses[keep]
+
+    if sharedbnsfeatures > 0:
+        # Features are chosen on this fold's training rows alone, so the
+        # volumes we predict have no say in them.
+        columns = bns_columns(sharedcounts[keep], yvals, sharedvocab, sharedbnsfeatures, usedate)
+    else:
+        columns = slice(None)
+
+    trainingset = pd.DataFrame(shareddata[keep][ : , columns])
+
+    trainingset, means, stdevs = normalizearray(trainingset, usedate)
+    if sharedwarmstart is None:
+        newmodel = LogisticRegression(C = regularization)
+    else:
+        newmodel = sharedwarmstart.warm_model(means, stdevs)
+    newmodel.fit(trainingset, yvals)
+
+    testset = (pd.DataFrame(shareddata[testindices][ : , columns]) - means) / stdevs
+    predictions = list(newmodel.predict_proba(testset)[ : , 1])
+
+    for i in testindices:
+        if i % 10 == 0:
+            print(i)
+
+    return predictions
+
+def model_one_group_grid(data5tuple):
+    '''Like model_one_shared_group, but fits a model for every combination of
+    vocabulary size and C value. The fold is sliced and normalized only once;
+    since vocabularies are taken from the top of the same ranked list, a smaller
+    vocabulary is just the first columns of the matrix.
+
+    columnsets is a list of (vocabsize, column indexes) pairs. Returns a dict
+    pairing (vocabsize, C) with a list of predictions for testindices.
+    '''
+    groupindices, testindices, usedate, columnsets, cvalues = data5tuple
+
+    keep = ~sharednevertrain
+    keep[groupindices] = False
+    trainingset = pd.DataFrame(shareddata[keep])
+    yvals = sharedclasses[keep]
+
+    trainingset, means, stdevs = normalizearray(trainingset, usedate)
+    testset = (pd.DataFrame(shareddata[testindices]) - means) / stdevs
+
+    results = dict()
+    for vocabsize, columns in columnsets:
+        trainingcolumns = trainingset.values[ : , columns]
+        testcolumns = testset.values[ : , columns]
+        for regularization in cvalues:
+            newmodel = LogisticRegression(C = regularization)
+            newmodel.fit(trainingcolumns, yvals)
+            results[(vocabsize, regularization)] = list(newmodel.predict_proba(testcolumns)[ : , 1])
+
+    return results
+
+# Faster leave-one-out.
+#
+# Each fold leaves out only a handful of rows, so its solution is close to the
+# solution for the model trained on all the trainable rows. FullModel fits that
+# model once. It can then be used in two ways:
+#
+#   warm_model() gives each fold a starting point that already makes the same
+#   predictions as the full model, so the solver needs only a few iterations.
+#   Results match an exact refit to within the solver's tolerance.
+#
+#   approximate_loo() doesn't refit at all. It estimates each fold's solution
+#   with a single Newton step from the full solution, taking the fold's rows
+#   out of the full model's Hessian. Good for a quick pass; compare_predictions
+#   will tell you how far it is from the exact results.
+
+class FullModel:
+
+    def __init__(self, data, classvector, nevertrain, usedate, regularization = .00007):
+        self.nevertrain = np.array(nevertrain, dtype = bool)
+        trainingset = pd.DataFrame(np.asarray(data)[~self.nevertrain])
+        yvals = np.array(classvector)[~self.nevertrain]
+
+        self.regularization = regularization
+        trainingset, means, stdevs = normalizearray(trainingset, usedate)
+        self.means = np.array(means)
+        self.stdevs = np.array(stdevs)
+
+        self.model = LogisticRegression(C = regularization, solver = 'lbfgs')
+        self.model.fit(trainingset, yvals)
+        self.coef = self.model.coef_[0]
+        self.intercept = self.model.intercept_[0]
+
+    def warm_model(self, means, stdevs):
+        '''Returns an unfitted model whose starting point is the full solution,
+        rescaled for a fold that was normalized with these means and stdevs.
+        '''
+        rawcoef = self.coef / self.stdevs
+        newmodel = LogisticRegression(C = self.regularization, solver = 'lbfgs', warm_start = True)
+        newmodel.coef_ = np.array([rawcoef * np.array(stdevs)])
+        newmodel.intercept_ = np.array([self.intercept + np.sum(rawcoef * (np.array(means) - self.means))])
+        return newmodel
+
+def approximate_loo(data, classvector, fullmodel, groups):
+    '''Estimates leave-one-out predictions from a FullModel. groups is a list of
+    (groupindices, testindices) pairs, like the tasks for model_one_shared_group,
+    and the result is a list of predictions for each pair.
+    '''
+    from scipy.linalg import cho_factor, cho_solve
+
+    data = np.asarray(data, dtype = 'float64')
+    numrows, numfeatures = data.shape
+    regularization = fullmodel.regularization
+    trainable = ~fullmodel.nevertrain
+
+    # Normalize as the full model did, and add a column of ones for the intercept.
+    allrows = np.ones((numrows, numfeatures + 1))
+    allrows[ : , : numfeatures] = (data - fullmodel.means) / fullmodel.stdevs
+    beta = np.append(fullmodel.coef, fullmodel.intercept)
+
+    probabilities = 1 / (1 + np.exp(-allrows.dot(beta)))
+    weights = probabilities * (1 - probabilities)
+    gradients = probabilities - np.array(classvector)
+
+    # Hessian of the training objective at the full solution. sklearn doesn't
+    # penalize the intercept.
+    trainrows = allrows[trainable]
+    penalty = np.ones(numfeatures + 1)
+    penalty[-1] = 0
+    hessian = regularization * trainrows.T.dot(trainrows * weights[trainable, np.newaxis]) + np.diag(penalty)
+    factor = cho_factor(hessian)
+
+    results = list()
+    for groupindices, testindices in groups:
+        removed = [x for x in groupindices if trainable[x]]
+        newbeta = beta
+        if len(removed) > 0:
+            # By the Woodbury identity, the Newton step after removing rows X is
+            # B (I - CWM)^-1 Cg, where B = H^-1 X' and M = XB.
+            leftout = allrows[removed]
+            b = cho_solve(factor, leftout.T)
+            m = leftout.dot(b)
+            inner = np.eye(len(removed)) - (regularization * weights[removed])[ : , np.newaxis] * m
+            newbeta = beta + b.dot(np.linalg.solve(inner, regularization * gradients[removed]))
+        predictions = 1 / (1 + np.exp(-allrows[testindices].dot(newbeta)))
+        results.append(list(predictions))
+
+    return results
+
+def compare_predictions(reference, estimate):
+    '''Given two dicts pairing volume IDs with predictions, returns the largest
+    absolute difference, and the number of volumes that land on different sides
+    of 0.5.
+    '''
+    maxdiff = 0
+    flipped = 0
+    for volid, prediction in reference.items():
+        maxdiff = max(maxdiff, abs(prediction - estimate[volid]))
+        if (prediction > 0.5) != (estimate[volid] > 0.5):
+            flipped += 1
+    return maxdiff, flipped
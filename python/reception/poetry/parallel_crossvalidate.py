@@ -8,14 +8,14 @@
 
 import numpy as np
 import pandas as pd
-import csv, os, random, sys
-from collections import Counter
+import csv, os, random, sys, tempfile
 from multiprocessing import Pool
 from sklearn.linear_model import LogisticRegression
 import modelingprocess
 import metafilter
-from scipy.stats import norm
+import corpusloader
 import pylab
+from standardizer import normalizearray
 
 usedate = False
 # Leave this flag false unless you plan major
@@ -109,86 +109,13 @@ def sliceframe(dataframe, yvals, excludedrows, testrow):
 
     return trainingset, newyvals, testset
 
-def normalizearray(featurearray, usedate):
-    '''Normalizes an array by centering on means and
-    scaling by standard deviations. Also returns the
-    means and standard deviations for features, so that
-    they can be pickled.
-    '''
-
-    numinstances, numfeatures = featurearray.shape
-    means = list()
-    stdevs = list()
-    lastcolumn = numfeatures - 1
-    for featureidx in range(numfeatures):
-
-        thiscolumn = featurearray.iloc[ : , featureidx]
-        thismean = np.mean(thiscolumn)
-
-        thisstdev = np.std(thiscolumn)
-
-        if (not usedate) or featureidx != lastcolumn:
-            # If we're using date we don't normalize the last column.
-            means.append(thismean)
-            stdevs.append(thisstdev)
-            featurearray.iloc[ : , featureidx] = (thiscolumn - thismean) / thisstdev
-        else:
-            print('FLAG')
-            means.append(thismean)
-            thisstdev = 0.1
-            stdevs.append(thisstdev)
-            featurearray.iloc[ : , featureidx] = (thiscolumn - thismean) / thisstdev
-            # We set a small stdev for date.
-
-    return featurearray, means, stdevs
-
-def binormal_select(vocablist, positivecounts, negativecounts, totalpos, totalneg, k):
-    ''' A feature-selection option, not currently in use.
-    '''
-    all_scores = np.zeros(len(vocablist))
-
-    for idx, word in enumerate(vocablist):
-        # For each word we create a vector the length of vols in each class
-        # that contains real counts, plus zeroes for all those vols not
-        # represented.
-
-        positives = np.zeros(totalpos, dtype = 'int64')
-        if word in positivecounts:
-            positives[0: len(positivecounts[word])] = positivecounts[word]
-
-        negatives = np.zeros(totalneg, dtype = 'int64')
-        if word in negativecounts:
-            negatives[0: len(negativecounts[word])] = negativecounts[word]
-
-        featuremean = np.mean(np.append(positives, negatives))
-
-        tp = sum(positives > featuremean)
-        fp = sum(positives <= featuremean)
-        tn = sum(negatives > featuremean)
-        fn = sum(negatives <= featuremean)
-        tpr = tp/(tp+fn) # true positive ratio
-        fpr = fp/(fp+tn) # false positive ratio
-
-        bns_score = abs(norm.ppf(tpr) - norm.ppf(fpr))
-        # See Forman
+def get_data(paths, exclusions, thresholds, classifyconditions, vocabsize = 3200, returncounts = False):
+    ''' Reads metadata and volumes, selects the vocabulary, and builds the
+    feature matrix. Returns metadict, IDsToUse, classdictionary, orderedIDs,
+    vocablist, data, classvector, volsizes, and authorgroups; if returncounts
+    is True, also the raw counts behind data, for feature selection.
 
-        if np.isinf(bns_score) or np.isnan(bns_score):
-            bns_score = 0
-
-        all_scores[idx] = bns_score
-
-    zipped = [x for x in zip(all_scores, vocablist)]
-    zipped.sort(reverse = True)
-    with open('bnsscores.tsv', mode='w', encoding = 'utf-8') as f:
-        for score, word in zipped:
-            f.write(word + '\t' + str(score) + '\n')
-
-    return [x[1] for x in zipped[0:k]]
-
-def create_model(paths, exclusions, thresholds, classifyconditions):
-    ''' This is the main function in the module.
-    It can be called externally; it's also called
-    if the module is run directly.
+    The vocabulary is the vocabsize words that occur in the most volumes.
     '''
 
     sourcefolder, extension, classpath, outputpath = paths
@@ -196,8 +123,6 @@ def create_model(paths, exclusions, thresholds, classifyconditions):
     pastthreshold, futurethreshold = thresholds
     category2sorton, positive_class, datetype = classifyconditions
 
-    verbose = False
-
     if not sourcefolder.endswith('/'):
         sourcefolder = sourcefolder + '/'
 
@@ -237,14 +162,13 @@ def create_model(paths, exclusions, thresholds, classifyconditions):
 
     IDsToUse, classdictionary = metafilter.label_classes(metadict, category2sorton, positive_class, sizecap)
 
-    # make a vocabulary list and a volsize dict
-    wordcounts = Counter()
+    # Every volume is parsed once (or read from a cache) into a sparse matrix;
+    # the vocabulary and the features are both taken from that.
+    corpus = corpusloader.load_corpus(sourcefolder, extension)
 
     volspresent = list()
     orderedIDs = list()
-
-    positivecounts = dict()
-    negativecounts = dict()
+    vocabIDs = list()
 
     for volid, volpath in zip(volumeIDs, volumepaths):
         if volid not in IDsToUse:
@@ -257,27 +181,11 @@ def create_model(paths, exclusions, thresholds, classifyconditions):
         if date < pastthreshold or date > futurethreshold:
             continue
         else:
-            with open(volpath, encoding = 'utf-8') as f:
-                for line in f:
-                    fields = line.strip().split('\t')
-                    if len(fields) > 2 or len(fields) < 2:
-                        # print(line)
-                        continue
-                    word = fields[0]
-                    if len(word) > 0 and word[0].isalpha():
-                        count = int(fields[1])
-                        wordcounts[word] += 1
-                        # for initial feature selection we use the number of
-                        # *documents* that contain a given word,
-                        # so it's just +=1.
-
-    vocablist = [x[0] for x in wordcounts.most_common(3200)]
-
-    #vocablist = binormal_select(vocablist, positivecounts, negativecounts, totalposvols, totalnegvols, 3000)
-
-    # Deprecated. There are more sophisticated things we could do with feature selection,
-    # but they'd improve accuracy by 1% at the cost of complicating our explanatory task.
-    # The tradeoff isn't worth it. Explanation is more important.
+            vocabIDs.append(volid)
+
+    # For initial feature selection we use the number of
+    # *documents* that contain a given word.
+    vocablist = corpus.top_words(vocabsize, vocabIDs)
 
     VOCABSIZE = len(vocablist)
 
@@ -297,90 +205,138 @@ def create_model(paths, exclusions, thresholds, classifyconditions):
         elif date < pastthreshold or date > futurethreshold:
             donttrainon.append(idx1)
 
-    authormatches = [list(donttrainon) for x in range(len(orderedIDs))]
-    # For every index in authormatches, identify a set of indexes that have
-    # the same author. Obvs, there will always be at least one.
+    authorgroups = modelingprocess.AuthorGroups([metadict[anid]['author'] for anid in orderedIDs], donttrainon)
+    # For every volume we need to exclude all the volumes by the same author,
+    # as well as all the ids in donttrainon. AuthorGroups pairs each author with
+    # an array of row indexes, and keeps donttrainon as a mask shared by all folds.
 
-    # Since we are going to use these indexes to exclude rows, we also add
-    # all the ids in donttrainon to every volume
+    counts = corpus.features(orderedIDs, vocablist)
+    totals = corpus.totals(orderedIDs)
 
-    for idx1, anid in enumerate(orderedIDs):
-        thisauthor = metadict[anid]['author']
-        for idx2, anotherid in enumerate(orderedIDs):
-            otherauthor = metadict[anotherid]['author']
-            if thisauthor == otherauthor and not idx2 in authormatches[idx1]:
-                authormatches[idx1].append(idx2)
+    if usedate:
+        dates = np.array([max(infer_date(metadict[volid], datetype) - 1700, 0) for volid in orderedIDs])
+        voldata = np.column_stack([counts / (totals[ : , np.newaxis] + 0.0001), dates])
+    else:
+        voldata = counts / (totals[ : , np.newaxis] + 0.001)
+
+    volsizes = dict(zip(orderedIDs, [int(x) for x in totals]))
+    classvector = [classdictionary[volid] for volid in orderedIDs]
+
+    data = pd.DataFrame(voldata)
 
-    for alist in authormatches:
-        alist.sort(reverse = True)
+    if returncounts:
+        return metadict, IDsToUse, classdictionary, orderedIDs, vocablist, data, classvector, volsizes, authorgroups, counts
 
-    # I am reversing the order of indexes so that I can delete them from
-    # back to front, without changing indexes yet to be deleted.
+    return metadict, IDsToUse, classdictionary, orderedIDs, vocablist, data, classvector, volsizes, authorgroups
 
-    volsizes = dict()
-    voldata = list()
-    classvector = list()
+def create_model(paths, exclusions, thresholds, classifyconditions, groupfolds = True, loomethod = 'exact', regularization = .00007, vocabsize = 3200, bnsfeatures = 0):
+    ''' This is the main function in the module.
+    It can be called externally; it's also called
+    if the module is run directly.
 
-    for volid, volpath in volspresent:
+    If groupfolds is True, we fit one model per author rather than
+    one per volume; the predictions are the same either way.
+
+    loomethod can be 'exact' (refit every fold from scratch), 'warm'
+    (start each fold from the solution for all the data; same results
+    to within the solver's tolerance), or 'approximate' (estimate each
+    fold from that solution without refitting, for a quick pass).
+
+    regularization is the C parameter for LogisticRegression; see
+    grid_search for a way to choose it. vocabsize is passed to get_data.
+
+    bnsfeatures is off by default. There are more sophisticated things we could
+    do with feature selection, but they'd improve accuracy by 1% at the cost of
+    complicating our explanatory task. If it's more than zero, each fold keeps
+    that many of the vocabsize words, chosen by bi-normal separation on its own
+    training rows. Unlike choosing words by frequency, this uses the class
+    labels, so it can't be done once for all folds without letting each
+    held-out volume help choose its own features. Only loomethod 'exact'
+    refits folds with their own features, so the others refuse it.
+    '''
 
-        with open(volpath, encoding = 'utf-8') as f:
-            voldict = dict()
-            totalcount = 0
-            for line in f:
-                fields = line.strip().split('\t')
-                if len(fields) > 2 or len(fields) < 2:
-                    continue
+    sourcefolder, extension, classpath, outputpath = paths
+    category2sorton, positive_class, datetype = classifyconditions
 
-                word = fields[0]
-                count = int(fields[1])
-                voldict[word] = count
-                totalcount += count
+    verbose = False
 
-        date = infer_date(metadict[volid], datetype)
-        date = date - 1700
-        if date < 0:
-            date = 0
+    if bnsfeatures > 0 and loomethod != 'exact':
+        raise ValueError("bnsfeatures needs loomethod = 'exact', since features are chosen separately for each fold.")
 
-        if usedate:
-            features = get_features_with_date(voldict, vocablist, date, totalcount)
-            voldata.append(features)
-        else:
-            features = get_features(voldict, vocablist)
-            voldata.append(features / (totalcount + 0.001))
+    metadict, IDsToUse, classdictionary, orderedIDs, vocablist, data, classvector, volsizes, authorgroups, counts = get_data(paths, exclusions, thresholds, classifyconditions, vocabsize, returncounts = True)
 
+    fourtuples = list()
+    if groupfolds:
+        # Every volume by the same author has the same training set, so fit
+        # one model per author and use it to predict all of that author's volumes.
+        for author, rows in authorgroups.groups.items():
+            afourtuple = rows, list(rows), usedate, regularization
+            fourtuples.append(afourtuple)
+    else:
+        for i, volid in enumerate(orderedIDs):
+            afourtuple = authorgroups.rows_for(i), [i], usedate, regularization
+            fourtuples.append(afourtuple)
 
-        volsizes[volid] = totalcount
-        classflag = classdictionary[volid]
-        classvector.append(classflag)
+    if loomethod == 'exact':
+        fullmodel = None
+    else:
+        fullmodel = modelingprocess.FullModel(data.values, classvector, authorgroups.nevertrain, usedate, regularization)
 
-    data = pd.DataFrame(voldata)
+    if loomethod == 'approximate':
+        groups = [(afourtuple[0], afourtuple[1]) for afourtuple in fourtuples]
+        resultlist = modelingprocess.approximate_loo(data.values, classvector, fullmodel, groups)
 
-    fivetuples = list()
-    for i, volid in enumerate(orderedIDs):
-        listtoexclude = authormatches[i]
-        afivetuple = data, classvector, listtoexclude, i, usedate
-        fivetuples.append(afivetuple)
+    else:
+        # Rather than pickling the whole DataFrame for every volume, we save the
+        # feature matrix once; each worker memory-maps it, and tasks carry only
+        # the indexes of rows to exclude.
+
+        matrixhandle, matrixpath = tempfile.mkstemp(suffix = '.npy')
+        os.close(matrixhandle)
+        np.save(matrixpath, data.values)
+        temppaths = [matrixpath]
+
+        if bnsfeatures > 0:
+            # Folds choose their features from the raw counts, shared the same way.
+            counthandle, countpath = tempfile.mkstemp(suffix = '.npy')
+            os.close(counthandle)
+            np.save(countpath, counts)
+            temppaths.append(countpath)
+            bnsargs = (countpath, vocablist, bnsfeatures)
+        else:
+            bnsargs = None
 
-    # Now do leave-one-out predictions.
-    print('Beginning multiprocessing.')
+        pool = None
+        try:
+            # Now do leave-one-out predictions.
+            print('Beginning multiprocessing.')
 
-    pool = Pool(processes = 12)
-    res = pool.map_async(modelingprocess.model_one_volume, fivetuples)
+            pool = Pool(processes = 12, initializer = modelingprocess.attach_shared_data, initargs = (matrixpath, classvector, authorgroups.nevertrain, fullmodel, bnsargs))
+            res = pool.map_async(modelingprocess.model_one_shared_group, fourtuples)
 
-    # After all files are processed, write metadata, errorlog, and counts of phrases.
-    res.wait()
-    resultlist = res.get()
+            # After all files are processed, write metadata, errorlog, and counts of phrases.
+            res.wait()
+            resultlist = res.get()
 
-    assert len(resultlist) == len(orderedIDs)
+            pool.close()
+            pool.join()
+        finally:
+            # terminate does nothing to a pool that has already closed and
+            # joined, but stops the workers if anything above failed.
+            if pool is not None:
+                pool.terminate()
+            for path in temppaths:
+                os.remove(path)
 
-    logisticpredictions = dict()
-    for i, volid in enumerate(orderedIDs):
-        logisticpredictions[volid] = resultlist[i]
+        print('Multiprocessing concluded.')
 
-    pool.close()
-    pool.join()
+    logisticpredictions = dict()
+    for afourtuple, predictions in zip(fourtuples, resultlist):
+        testindices = afourtuple[1]
+        for i, prediction in zip(testindices, predictions):
+            logisticpredictions[orderedIDs[i]] = prediction
 
-    print('Multiprocessing concluded.')
+    assert len(logisticpredictions) == len(orderedIDs)
 
     truepositives = 0
     truenegatives = 0
@@ -420,9 +376,17 @@ def create_model(paths, exclusions, thresholds, classifyconditions):
             elif logistic > 0.5 and classdictionary[volid] < 0.5:
                 falsepositives += 1
 
-    donttrainon.sort(reverse = True)
-    trainingset, yvals, testset = sliceframe(data, classvector, donttrainon, 0)
-    newmodel = LogisticRegression(C = .00007)
+    trainingset, yvals = modelingprocess.maskframe(data, classvector, ~authorgroups.nevertrain)
+
+    if bnsfeatures > 0:
+        # The model we report coefficients for isn't scored, so its features
+        # can be chosen on all the training rows.
+        columns = modelingprocess.bns_columns(counts[~authorgroups.nevertrain], yvals, vocablist, bnsfeatures, usedate)
+        trainingset = trainingset.iloc[ : , columns]
+        trainingset.columns = range(len(columns))
+        vocablist = [vocablist[x] for x in columns if x < len(vocablist)]
+
+    newmodel = LogisticRegression(C = regularization)
     trainingset, means, stdevs = normalizearray(trainingset, usedate)
     newmodel.fit(trainingset, yvals)
 
@@ -445,93 +409,233 @@ def create_model(paths, exclusions, thresholds, classifyconditions):
 
     return accuracy, allvolumes, coefficientuples
 
-def diachronic_tilt(allvolumes, modeltype, datelimits):
-    ''' Takes a set of predictions produced by a model that knows nothing about date,
-    and divides it along a line with a diachronic tilt. We need to do this in a way
-    that doesn't violate crossvalidation. I.e., we shouldn't "know" anything
-    that the model shouldn't know. The simplest way to do that is just to use
-    the linear option -- which fits a line to the center of the scatterplot,
-    entirely ignoring information about the 'reviewed' or 'random' status of
-    individual volumes.
+def grid_search(paths, exclusions, thresholds, classifyconditions, cvalues, vocabsizes):
+    ''' Runs leave-author-out crossvalidation for every combination of
+    C value and vocabulary size, and writes a table of accuracies
+    (vocabsize, C, accuracy) to the outputpath in paths. The data, the
+    folds, and the normalization of each fold are computed only once.
+
+    Returns a list of (vocabsize, C, accuracy) tuples.
     '''
 
-    listofrows = list()
-    classvector = list()
+    sourcefolder, extension, classpath, outputpath = paths
 
-    if modeltype == 'logistic' and len(datelimits) == 2:
-        # In this case we construct a subset of data to model on.
-        tomodeldata = list()
-        tomodelclasses = list()
-        pastthreshold, futurethreshold = datelimits
+    metadict, IDsToUse, classdictionary, orderedIDs, vocablist, data, classvector, volsizes, authorgroups = get_data(paths, exclusions, thresholds, classifyconditions, vocabsize = max(vocabsizes))
 
-    for volume in allvolumes:
-        date = volume[3]
-        logistic = volume[8]
-        realclass = volume[13]
-        listofrows.append([logistic, date])
-        classvector.append(realclass)
+    # The vocabulary is ranked, so a smaller vocabulary is the first
+    # vocabsize columns (plus date, if we're using it).
 
-        if modeltype == 'logistic' and len(datelimits) == 2:
-            if date >= pastthreshold and date <= futurethreshold:
-                tomodeldata.append([logistic, date])
-                tomodelclasses.append(realclass)
+    columnsets = list()
+    for vocabsize in vocabsizes:
+        columns = list(range(min(vocabsize, len(vocablist))))
+        if usedate:
+            columns.append(len(vocablist))
+        columnsets.append((vocabsize, columns))
 
-    y, x = [a for a in zip(*listofrows)]
-    pylab.axis([min(x) - 2, max(x) + 2, min(y) - 0.02, max(y) + 0.02])
-    reviewedx = list()
-    reviewedy = list()
-    randomx = list()
-    randomy = list()
-
-    for idx, reviewcode in enumerate(classvector):
-        if reviewcode == 1:
-            reviewedx.append(x[idx])
-            reviewedy.append(y[idx])
-        else:
-            randomx.append(x[idx])
-            randomy.append(y[idx])
+    fivetuples = list()
+    for author, rows in authorgroups.groups.items():
+        afivetuple = rows, list(rows), usedate, columnsets, cvalues
+        fivetuples.append(afivetuple)
 
-    pylab.plot(reviewedx, reviewedy, 'ro')
-    pylab.plot(randomx, randomy, 'k+')
+    matrixhandle, matrixpath = tempfile.mkstemp(suffix = '.npy')
+    os.close(matrixhandle)
+    np.save(matrixpath, data.values)
 
-    if modeltype == 'logistic':
+    print('Beginning multiprocessing.')
 
-        if len(datelimits) == 2:
-            data = pd.DataFrame(tomodeldata)
-            responsevariable = tomodelclasses
-        else:
-            data = pd.DataFrame(listofrows)
-            responsevariable = classvector
+    pool = None
+    try:
+        pool = Pool(processes = 12, initializer = modelingprocess.attach_shared_data, initargs = (matrixpath, classvector, authorgroups.nevertrain))
+        res = pool.map_async(modelingprocess.model_one_group_grid, fivetuples)
+        res.wait()
+        resultlist = res.get()
+
+        pool.close()
+        pool.join()
+    finally:
+        if pool is not None:
+            pool.terminate()
+        os.remove(matrixpath)
 
+    print('Multiprocessing concluded.')
+
+    table = list()
+    for vocabsize in vocabsizes:
+        for regularization in cvalues:
+            logisticpredictions = dict()
+            for afivetuple, results in zip(fivetuples, resultlist):
+                testindices = afivetuple[1]
+                for i, prediction in zip(testindices, results[(vocabsize, regularization)]):
+                    logisticpredictions[orderedIDs[i]] = prediction
+
+            correct = 0
+            for volid in IDsToUse:
+                logistic = logisticpredictions[volid]
+                if logistic > 0.5 and classdictionary[volid] > 0.5:
+                    correct += 1
+                elif logistic <= 0.5 and classdictionary[volid] < 0.5:
+                    correct += 1
+
+            accuracy = correct / len(IDsToUse)
+            table.append((vocabsize, regularization, accuracy))
+
+    with open(outputpath, mode = 'w', encoding = 'utf-8') as f:
+        f.write('vocabsize\tC\taccuracy\n')
+        for vocabsize, regularization, accuracy in table:
+            f.write(str(vocabsize) + '\t' + str(regularization) + '\t' + str(accuracy) + '\n')
+
+    return table
+
+# Dividing the predictions with a diachronic tilt.
+#
+# allvolumes has a row for each volume; the prediction is in column 8, the
+# date in column 3 and the real class in column 13. Everything below works on
+# those three columns as arrays, so a line (or many candidate lines, or many
+# resampled fits) can be scored without looping over volumes.
+
+def tilt_arrays(allvolumes, modeltype, datelimits):
+    '''Returns predictions (y), dates (x) and classes for allvolumes, plus a
+    boolean mask of the volumes a logistic tilt is fit to.
+    '''
+    y = np.array([volume[8] for volume in allvolumes], dtype = 'float64')
+    x = np.array([volume[3] for volume in allvolumes], dtype = 'float64')
+    classvector = np.array([volume[13] for volume in allvolumes])
+
+    tomodel = np.ones(len(x), dtype = bool)
+    if modeltype == 'logistic' and len(datelimits) == 2:
+        # In this case we construct a subset of data to model on.
+        pastthreshold, futurethreshold = datelimits
+        tomodel = (x >= pastthreshold) & (x <= futurethreshold)
+
+    return y, x, classvector, tomodel
+
+def fit_tilt(y, x, classvector, modeltype):
+    '''Returns the slope and intercept of a dividing line, y = intercept + x * slope.'''
+
+    if modeltype == 'logistic':
         newmodel = LogisticRegression(C = 10000)
-        newmodel.fit(data, responsevariable)
+        newmodel.fit(np.column_stack([y, x]), classvector)
         coefficients = newmodel.coef_[0]
 
         intercept = newmodel.intercept_[0] / (-coefficients[0])
         slope = coefficients[1] / (-coefficients[0])
 
-        p = np.poly1d([slope, intercept])
-
     elif modeltype == 'linear':
+        slope, intercept = np.polyfit(x, y, 1)
+
+    return slope, intercept
 
-        z = np.polyfit(x, y, 1)
-        p = np.poly1d(z)
-        slope = z[0]
-        intercept = z[1]
+def weighted_linear_tilts(y, x, weights):
+    '''Closed-form least-squares lines for many weightings of the volumes at
+    once. weights has a row for each fit and a column for each volume (for a
+    bootstrap sample, the number of times each volume was drawn). Returns
+    arrays of slopes and intercepts, one for each row.
+    '''
+    n = weights.sum(axis = 1)
+    # Centering first keeps the sums well-conditioned; dates are large numbers.
+    xc = x - x.mean()
+    sumx = weights.dot(xc)
+    sumy = weights.dot(y)
+    sumxx = weights.dot(xc * xc)
+    sumxy = weights.dot(xc * y)
+
+    slopes = (n * sumxy - sumx * sumy) / (n * sumxx - sumx * sumx)
+    intercepts = (sumy - slopes * sumx) / n - slopes * x.mean()
+    return slopes, intercepts
+
+def tilt_accuracies(y, x, classvector, slopes, intercepts, weights = None):
+    '''The accuracy of each candidate line (slopes[i], intercepts[i]), all at
+    once. If weights is given, it has a row for each line, and each volume
+    counts as many times as its weight in that row.
+    '''
+    slopes = np.atleast_1d(slopes)
+    intercepts = np.atleast_1d(intercepts)
+
+    dividinglines = intercepts[ : , np.newaxis] + np.outer(slopes, x)
+    predicted_as_reviewed = y[np.newaxis, : ] > dividinglines
+    really_reviewed = (np.asarray(classvector) == 1)[np.newaxis, : ]
+    correct = predicted_as_reviewed == really_reviewed
+
+    if weights is None:
+        return correct.sum(axis = 1) / len(x)
+    else:
+        return (correct * weights).sum(axis = 1) / weights.sum(axis = 1)
 
-    pylab.plot(x,p(x),"b-")
+def plot_tilt(y, x, classvector, slope, intercept):
+    pylab.axis([min(x) - 2, max(x) + 2, min(y) - 0.02, max(y) + 0.02])
+    reviewed = classvector == 1
+    pylab.plot(x[reviewed], y[reviewed], 'ro')
+    pylab.plot(x[~reviewed], y[~reviewed], 'k+')
+    pylab.plot(x, intercept + x * slope, "b-")
     pylab.show()
 
-    x = np.array(x, dtype='float64')
-    y = np.array(y, dtype='float64')
-    classvector = np.array(classvector)
-    dividingline = intercept + (x * slope)
-    predicted_as_reviewed = (y > dividingline)
-    really_reviewed = (classvector == 1)
-    accuracy = sum(predicted_as_reviewed == really_reviewed) / len(classvector)
+def diachronic_tilt(allvolumes, modeltype, datelimits, plot = True):
+    ''' Takes a set of predictions produced by a model that knows nothing about date,
+    and divides it along a line with a diachronic tilt. We need to do this in a way
+    that doesn't violate crossvalidation. I.e., we shouldn't "know" anything
+    that the model shouldn't know. The simplest way to do that is just to use
+    the linear option -- which fits a line to the center of the scatterplot,
+    entirely ignoring information about the 'reviewed' or 'random' status of
+    individual volumes.
+    '''
+
+    y, x, classvector, tomodel = tilt_arrays(allvolumes, modeltype, datelimits)
+    slope, intercept = fit_tilt(y[tomodel], x[tomodel], classvector[tomodel], modeltype)
+
+    if plot:
+        plot_tilt(y, x, classvector, slope, intercept)
+
+    accuracy = tilt_accuracies(y, x, classvector, slope, intercept)[0]
 
     return accuracy
 
+def fit_resampled_tilt(data5tuple):
+    '''Fits a logistic tilt to one bootstrap sample, for the pool in bootstrap_tilt.'''
+    y, x, classvector, tomodel, sample = data5tuple
+    sample = sample[tomodel[sample]]
+    return fit_tilt(y[sample], x[sample], classvector[sample], 'logistic')
+
+def bootstrap_tilt(allvolumes, modeltype, datelimits, iterations = 500, confidence = 0.95, processes = 12, seed = None):
+    '''Resamples the volumes with replacement, fits a tilt to each sample and
+    measures its accuracy on that sample. Returns the accuracy on all volumes,
+    and confidence intervals (as (low, high) pairs) for accuracy and for slope.
+
+    Linear tilts have a closed form, so every sample is fit at once; logistic
+    tilts are fit in a pool of processes.
+    '''
+    y, x, classvector, tomodel = tilt_arrays(allvolumes, modeltype, datelimits)
+    numvolumes = len(x)
+
+    slope, intercept = fit_tilt(y[tomodel], x[tomodel], classvector[tomodel], modeltype)
+    accuracy = tilt_accuracies(y, x, classvector, slope, intercept)[0]
+
+    randomstate = np.random.RandomState(seed)
+    samples = randomstate.randint(0, numvolumes, size = (iterations, numvolumes))
+
+    # How many times each volume was drawn in each sample.
+    weights = np.zeros((iterations, numvolumes))
+    np.add.at(weights, (np.repeat(np.arange(iterations), numvolumes), samples.ravel()), 1)
+
+    if modeltype == 'linear':
+        slopes, intercepts = weighted_linear_tilts(y, x, weights)
+    else:
+        pool = Pool(processes = processes)
+        res = pool.map_async(fit_resampled_tilt, [(y, x, classvector, tomodel, sample) for sample in samples])
+        res.wait()
+        fits = res.get()
+        pool.close()
+        pool.join()
+        slopes = np.array([fit[0] for fit in fits])
+        intercepts = np.array([fit[1] for fit in fits])
+
+    accuracies = tilt_accuracies(y, x, classvector, slopes, intercepts, weights)
+
+    tail = (1 - confidence) / 2 * 100
+    accuracyinterval = tuple(np.percentile(accuracies, [tail, 100 - tail]))
+    slopeinterval = tuple(np.percentile(slopes, [tail, 100 - tail]))
+
+    return accuracy, accuracyinterval, slopeinterval
+
 if __name__ == '__main__':
 
     # If this class is called directly, it creates a single model using the default
@@ -600,3 +704,6 @@ if __name__ == '__main__':
 
     print("Divided with a line fit to the data trend, it's ", str(tiltaccuracy))
 
+    tiltaccuracy, accuracyinterval, slopeinterval = bootstrap_tilt(allvolumes, 'linear', [])
+    print("Over 500 bootstrap samples, the 95% interval for that accuracy is ", str(accuracyinterval))
+
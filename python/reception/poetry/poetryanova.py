@@ -1,8 +1,8 @@
 import numpy as np
 import csv, os, random
-from collections import Counter
 
 import lineardiction
+import corpusloader
 
 def dirty_pairtree(htid):
     period = htid.find('.')
@@ -285,20 +285,10 @@ metadict = get_metadata(classpath, volumeIDs, excludeif, excludeifnot, excludebe
 
 IDspresent = set([x for x in metadict.keys()])
 
-# make a vocabulary list and a volsize dict
-wordcounts = Counter()
-
-for volid, volpath in zip(volumeIDs, volumepaths):
-    if volid not in IDspresent:
-        continue
-
-    with open(volpath, encoding = 'utf-8') as f:
-        for line in f:
-            fields = line.strip().split('\t')
-            word = fields[0]
-            if len(word) > 1 and word[0].isalpha():
-                count = int(fields[1])
-                wordcounts[word] += 1
+# Every volume is parsed once (or read from a cache) into a sparse matrix;
+# the vocabulary and the counts below are both taken from that.
+corpus = corpusloader.load_corpus(sourcefolder, extension)
+volspresent = [x for x in volumeIDs if x in IDspresent]
 
 etymological_categories = ['pre', 'post', 'stopword', 'missing']
 etymo = dict()
@@ -313,7 +303,7 @@ with open('/Users/tunder/Dropbox/PythonScripts/mine/metadata/ReMergedEtymologies
         else:
             etymo[fields[0]] = 'stopword'
 
-vocablist = [x[0] for x in wordcounts.most_common(VOCABSIZE)]
+vocablist = corpus.top_words(VOCABSIZE, volspresent, corpusloader.longer_than_one)
 VOCABSIZE = len(vocablist)
 vocabset = set(vocablist)
 
@@ -327,38 +317,17 @@ for idx, word in enumerate(vocablist):
         vocabmapper[word] = 'missing'
 
 
-volsizes = Counter()
-prewords = Counter()
-postwords = Counter()
-linearpredictions = dict()
-
-for volid, volpath in zip(volumeIDs, volumepaths):
-    if volid not in IDspresent:
-        continue
-
-    with open(volpath, encoding = 'utf-8') as f:
-        voldict = dict()
-        for line in f:
-            fields = line.strip().split('\t')
-            if len(fields) > 2 or len(fields) < 2:
-                print(line)
-                continue
-
-            word = fields[0]
-            count = int(fields[1])
-            voldict[word] = count
-
-            if word in vocabset:
-
-                volsizes[volid] += count
+prevocab = [x for x in vocablist if vocabmapper[x] == 'pre']
+postvocab = [x for x in vocablist if vocabmapper[x] == 'post']
 
-                etymcategory = vocabmapper[word]
-                if etymcategory == 'pre':
-                    prewords[volid] += count
-                elif etymcategory == 'post':
-                    postwords[volid] += count
+volsizes = dict(zip(volspresent, corpus.totals(volspresent, vocabset)))
+prewords = dict(zip(volspresent, corpus.totals(volspresent, prevocab)))
+postwords = dict(zip(volspresent, corpus.totals(volspresent, postvocab)))
 
-    linearpredictions[volid] = lineardiction.prediction(voldict)
+# The diction model scores every volume at once, from the corpus matrix.
+dictionmodel = lineardiction.get_model()
+dictioncounts = corpus.sparse_features(volspresent, dictionmodel.features)
+linearpredictions = dict(zip(volspresent, dictionmodel.predict_matrix(dictioncounts, corpus.totals(volspresent))))
 
 with open('/Users/tunder/Dropbox/GenreProject/python/reception/poetry/poedata.csv', mode = 'w', encoding = 'utf-8') as f:
     writer = csv.writer(f)
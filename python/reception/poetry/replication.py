@@ -3,15 +3,20 @@
 # so they can be replicated without a lot of fuss.
 
 import parallel_crossvalidate as pc
-import sys
+import modelingprocess
+import sys, random, time
 
-allowable = {"full", "quarters"}
+allowable = {"full", "quarters", "compareloo", "gridsearch"}
 
 def instructions():
     print("Your options are: ")
     print()
     print("full -- model the full 700-volume dataset using default settings")
     print("quarters -- create four quarter-century models")
+    print("compareloo -- run the full model with exact, warm-started, and approximate")
+    print("              leave-one-out, and report how far apart the predictions are")
+    print("gridsearch -- crossvalidate the full dataset over a grid of C values and")
+    print("              vocabulary sizes, and write a table of accuracies")
     print()
 
 args = sys.argv
@@ -130,11 +135,87 @@ elif command == 'quarters':
 
         print("Divided with a line fit to the data trend, it's ", str(tiltaccuracy))
 
+elif command == 'compareloo':
 
+    sourcefolder = '/Users/tunder/Dropbox/GenreProject/python/reception/poetry/texts/'
+    extension = '.poe.tsv'
+    classpath = '/Users/tunder/Dropbox/GenreProject/python/reception/poetry/finalpoemeta.csv'
+
+    excludeif = dict()
+    excludeif['pubname'] = 'TEM'
+    excludeif['recept'] = 'addcanon'
+    excludeifnot = dict()
+    excludeabove = dict()
+    excludebelow = dict()
+    excludebelow['firstpub'] = 1700
+    excludeabove['firstpub'] = 1950
+    sizecap = 350
+
+    futurethreshold = 1925
+    pastthreshold = 1800
+
+    positive_class = 'rev'
+    category2sorton = 'reviewed'
+    datetype = 'firstpub'
+
+    exclusions = (excludeif, excludeifnot, excludebelow, excludeabove, sizecap)
+    thresholds = (pastthreshold, futurethreshold)
+    classifyconditions = (category2sorton, positive_class, datetype)
+
+    # The sizecap samples volumes at random, so we fix the seed to make
+    # every run model the same volumes.
+
+    allpredictions = dict()
+    for loomethod in ['exact', 'warm', 'approximate']:
+        outputpath = '/Users/tunder/Dropbox/GenreProject/python/reception/poetry/' + loomethod + 'predictions.csv'
+        paths = (sourcefolder, extension, classpath, outputpath)
 
+        random.seed(1845)
+        start = time.time()
+        accuracy, allvolumes, coefficientuples = pc.create_model(paths, exclusions, thresholds, classifyconditions, loomethod = loomethod)
+        elapsed = time.time() - start
 
+        allpredictions[loomethod] = {x[0]: x[8] for x in allvolumes}
+        print(loomethod + ': accuracy ' + str(accuracy) + ' in ' + str(round(elapsed, 1)) + ' sec')
 
+    for loomethod in ['warm', 'approximate']:
+        maxdiff, flipped = modelingprocess.compare_predictions(allpredictions['exact'], allpredictions[loomethod])
+        print(loomethod + ' vs. exact: largest difference ' + str(maxdiff) + ', ' + str(flipped) + ' volumes on the other side of 0.5')
 
+elif command == 'gridsearch':
+
+    sourcefolder = '/Users/tunder/Dropbox/GenreProject/python/reception/poetry/texts/'
+    extension = '.poe.tsv'
+    classpath = '/Users/tunder/Dropbox/GenreProject/python/reception/poetry/finalpoemeta.csv'
+    outputpath = '/Users/tunder/Dropbox/GenreProject/python/reception/poetry/gridsearch.tsv'
+
+    excludeif = dict()
+    excludeif['pubname'] = 'TEM'
+    excludeif['recept'] = 'addcanon'
+    excludeifnot = dict()
+    excludeabove = dict()
+    excludebelow = dict()
+    excludebelow['firstpub'] = 1700
+    excludeabove['firstpub'] = 1950
+    sizecap = 350
+
+    futurethreshold = 1925
+    pastthreshold = 1800
+
+    positive_class = 'rev'
+    category2sorton = 'reviewed'
+    datetype = 'firstpub'
+
+    paths = (sourcefolder, extension, classpath, outputpath)
+    exclusions = (excludeif, excludeifnot, excludebelow, excludeabove, sizecap)
+    thresholds = (pastthreshold, futurethreshold)
+    classifyconditions = (category2sorton, positive_class, datetype)
 
+    # The scripts have used .00005 and .00007; this brackets them widely.
+    cvalues = [.00001, .00003, .00005, .00007, .0001, .0003, .001]
+    vocabsizes = [1000, 2000, 3200, 4000]
 
+    table = pc.grid_search(paths, exclusions, thresholds, classifyconditions, cvalues, vocabsizes)
 
+    for vocabsize, regularization, accuracy in table:
+        print(str(vocabsize).rjust(6) + '  C = ' + str(regularization).ljust(8) + '  accuracy ' + str(round(accuracy, 4)))